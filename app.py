@@ -1,9 +1,10 @@
 import streamlit as st
 from datetime import datetime
-from backend.model_pdfplumber import build_index_from_pdf
-from backend.model_docling import build_index_from_pdf_docling
-from backend.utils import extract_key_metrics, extract_risk_factors
-import tempfile
+from backend.cache import file_sha256
+from backend.corpus import FilingCorpus
+from backend.index_registry import index_registry
+from backend.jobs import STAGES, job_queue, process_document
+from backend.tracing import bind_session, render_timing_panel
 
 # Configure page
 st.set_page_config(
@@ -74,6 +75,9 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Spans from this run are shown in this session's timing panel; also identifies the session to the job queue
+session_id = bind_session()
+
 # Initialize session state
 if 'uploaded_file' not in st.session_state:
     st.session_state.uploaded_file = None
@@ -85,6 +89,37 @@ if 'key_metrics' not in st.session_state:
     st.session_state.key_metrics = None
 if 'risk_factors' not in st.session_state:
     st.session_state.risk_factors = None
+if 'dashboard_warnings' not in st.session_state:
+    st.session_state.dashboard_warnings = []
+if 'job_key' not in st.session_state:
+    st.session_state.job_key = None
+
+
+def open_document(lease):
+    """Show a document from its lease on the process-wide index registry."""
+    close_document()
+    st.session_state.index_lease = lease
+    st.session_state.index = lease.index
+    st.session_state.key_metrics = lease.dashboard.get("key_metrics")
+    st.session_state.risk_factors = lease.dashboard.get("risk_factors")
+    st.session_state.dashboard_warnings = lease.dashboard.get("warnings", [])
+    # Every filing opened in this session is kept for cross-filing comparisons; the corpus
+    # holds its own lease, so the shared index stays accounted for after this one is released
+    if "corpus" not in st.session_state:
+        st.session_state.corpus = FilingCorpus()
+    st.session_state.corpus.add_lease(lease.clone())
+
+
+def close_document():
+    # The shared index is only evicted once no session leases it
+    lease = st.session_state.get("index_lease")
+    if lease is not None:
+        lease.release()
+    st.session_state.index_lease = None
+    st.session_state.index = None
+    # Closed filings stay listed for comparison, but only selected ones keep their index resident
+    if "corpus" in st.session_state:
+        st.session_state.corpus.release(keep=st.session_state.get("compare_filings", []))
 
 
 # Sidebar
@@ -102,24 +137,39 @@ with st.sidebar:
     if uploaded_file:
         st.session_state.uploaded_file = uploaded_file
         st.success(f"✅ **{uploaded_file.name}**")
-        st.info(f"📄 {uploaded_file.size:,} bytes • Processing...")
-        
-        # Save to temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            temp_file.write(uploaded_file.getvalue())
-            temp_file_path = temp_file.name
-        
-    
-        with st.spinner("🔄 Analyzing document..."):
-            # Build Index from the document
-            st.session_state.index = build_index_from_pdf_docling(temp_file_path)
-
-            # Extract key metrics using RAG pipeline
-            st.session_state.key_metrics = extract_key_metrics(st.session_state.index)
-            st.session_state.risk_factors = extract_risk_factors(st.session_state.index)
-            st.success("✅ Document processed for Q&A!")
-            
-    
+        file_bytes = uploaded_file.getvalue()
+        doc_hash = file_sha256(file_bytes)
+
+        # Widget clicks rerun the script; skip all work if this file is already loaded
+        if st.session_state.get("doc_hash") != doc_hash:
+            # Stop waiting on the previous upload (it is cancelled unless another session needs it)
+            if st.session_state.job_key:
+                job_queue.cancel(st.session_state.job_key, session=session_id)
+                st.session_state.job_key = None
+            st.session_state.job_notice = None
+
+            st.info(f"📄 {uploaded_file.size:,} bytes • Processing...")
+            # Sessions opening the same filing share one memory-mapped index
+            lease = index_registry.acquire(doc_hash)
+
+            if lease is not None:
+                open_document(lease)
+                st.success("✅ Loaded previously analyzed document!")
+            else:
+                # Parsing, indexing and extraction run in the background job queue;
+                # the same file uploaded by another session joins the same job
+                job_queue.submit(doc_hash, process_document, file_bytes, doc_hash,
+                                 session=session_id, name=uploaded_file.name)
+                st.session_state.job_key = doc_hash
+                close_document()
+                st.session_state.key_metrics = None
+                st.session_state.risk_factors = None
+                st.session_state.dashboard_warnings = []
+
+            st.session_state.doc_hash = doc_hash
+    elif st.session_state.get("index") is None:
+        # A cancelled or failed upload can be retried by uploading the file again
+        st.session_state.doc_hash = None
 
 # Main content
 
@@ -172,9 +222,15 @@ if not st.session_state.uploaded_file:
     st.info("👈 **Upload a financial document using the sidebar to get started!**")
 
 
-# Show the key metrics if available
-if st.session_state.key_metrics:
-    metrics = st.session_state.key_metrics
+# ------ Dashboard rendering ------
+def has_valid_metric(metric_dict):
+    return (
+        isinstance(metric_dict, dict) 
+        and isinstance(metric_dict.get("current"), (int, float))
+    )
+
+
+def render_company_header(metrics):
     st.markdown("---")
     col4, col5, col6 = st.columns(3)
     with col4:
@@ -193,6 +249,7 @@ if st.session_state.key_metrics:
         else:
             st.markdown("<h4 style='color:#4CAF50;'>N/A</h4>", unsafe_allow_html=True)
 
+def render_key_metrics(metrics):
     # ------ Financial Metrics Display ------
     st.markdown("---")
     st.markdown("#### 📊 Key Financial Metrics")
@@ -205,12 +262,6 @@ if st.session_state.key_metrics:
     profit_margin = metrics.get('profit_margin', {})
     eps = metrics.get('eps', {})
 
-    def has_valid_metric(metric_dict):
-        return (
-            isinstance(metric_dict, dict) 
-            and isinstance(metric_dict.get("current"), (int, float))
-        )
-    
     show_metrics = any([
         has_valid_metric(revenue),
         has_valid_metric(net_profit),
@@ -288,11 +339,12 @@ if st.session_state.key_metrics:
     else:
         st.markdown("📉 No financial metrics available for display.")
 
+def render_risk_factors(risk_text):
     # ------ Risk Factors Display ------
     st.markdown("---")
     st.markdown("#### ⚠️ Major Risk Factors and Business Highlights")
-    if st.session_state.risk_factors:
-        risk_factors = st.session_state.risk_factors.replace("$", r"\$")
+    if risk_text:
+        risk_factors = risk_text.replace("$", r"\$")
         if risk_factors:
             st.markdown(f"""
                 <div class="analysis-card">   
@@ -306,3 +358,95 @@ if st.session_state.key_metrics:
             <span style = "color: #475569">✅ No major risk factors identified</span>
         </div>
         """, unsafe_allow_html=True)
+
+
+def render_dashboard_warnings(warnings):
+    # Steps that timed out or failed while the dashboard was extracted in the background
+    for warning in warnings or []:
+        st.warning(warning)
+
+
+# ------ Background processing progress ------
+STAGE_LABELS = {
+    "parse": "📄 Pages parsed",
+    "chunk": "✂️ Chunks created",
+    "embed": "🧮 Chunks embedded",
+    "dashboard": "📊 Dashboard sections done",
+}
+
+
+def render_sections(sections):
+    # Dashboard sections are shown as soon as the job has extracted them
+    render_dashboard_warnings(sections.get("warnings"))
+    if sections.get("key_metrics"):
+        render_company_header(sections["key_metrics"])
+        render_key_metrics(sections["key_metrics"])
+    if "risk_factors" in sections:
+        render_risk_factors(sections["risk_factors"])
+
+
+@st.fragment(run_every=1.0)
+def render_job_progress():
+    """Polls this session's background job; only this fragment reruns while it works."""
+    job = job_queue.get(st.session_state.job_key)
+    if job is None:
+        st.session_state.job_key = None
+        st.rerun()
+    state = job.snapshot()
+
+    if state["status"] == "done":
+        # The job keeps its own lease until it expires, so the index is still resident
+        lease = index_registry.acquire(job.key)
+        if lease is not None:
+            open_document(lease)
+        else:
+            st.session_state.job_notice = "Error processing document: the analysis is no longer cached."
+        st.session_state.job_key = None
+        st.rerun()
+    if state["status"] in ("failed", "cancelled"):
+        st.session_state.job_notice = (
+            f"Error processing document: {state['error']}" if state["status"] == "failed"
+            else "⏹️ Processing was cancelled. Upload the file again to restart.")
+        st.session_state.job_key = None
+        st.rerun()
+
+    if state["status"] == "queued":
+        st.info(f"⏳ Waiting for a free worker ({job_queue.position(job.key)} documents ahead)...")
+    else:
+        st.info(f"🔄 Analyzing **{state['name']}** • {state['seconds']:.0f}s")
+
+    current = STAGES.index(state["stage"]) if state["stage"] in STAGES else -1
+    for i, stage in enumerate(STAGES):
+        progress = state["stages"][stage]
+        done, total = progress["done"], progress["total"]
+        if i < current:
+            fraction = 1.0
+        else:
+            fraction = min(done / total, 1.0) if total else 0.0
+        text = f"{STAGE_LABELS[stage]}: {done:,}/{total:,}" if total else STAGE_LABELS[stage]
+        st.progress(fraction, text=text)
+
+    if st.button("✖️ Cancel", key="cancel_job"):
+        job_queue.cancel(job.key, session=session_id)
+        st.session_state.job_key = None
+        st.session_state.job_notice = "⏹️ Processing was cancelled. Upload the file again to restart."
+        st.rerun()
+
+    render_sections(state["sections"])
+
+
+# Show the key metrics if available
+if st.session_state.job_key:
+    render_job_progress()
+
+elif st.session_state.get("job_notice"):
+    st.warning(st.session_state.job_notice)
+
+elif st.session_state.key_metrics or st.session_state.dashboard_warnings:
+    render_dashboard_warnings(st.session_state.dashboard_warnings)
+    render_company_header(st.session_state.key_metrics)
+    render_key_metrics(st.session_state.key_metrics)
+    render_risk_factors(st.session_state.risk_factors)
+
+# Collapsible per-stage timings of this session's latest requests
+render_timing_panel()
@@ -0,0 +1,157 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+import numpy as np
+
+from backend.cache import CACHE_DIR
+
+ANSWER_CACHE_PATH = os.getenv("FSA_ANSWER_CACHE", os.path.join(CACHE_DIR, "answers.sqlite"))
+# Questions at least this similar (cosine) to a cached one reuse its answer
+SIMILARITY_THRESHOLD = 0.95
+ANSWER_TTL_SECONDS = 7 * 24 * 3600
+MAX_ANSWERS = 5000
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def question_numbers(question):
+    """Numbers in a normalized question (years, amounts), sorted; semantic hits must match them."""
+    return sorted(re.findall(r"\d+", question))
+
+
+# ----------------- Semantic answer cache ----------------
+class AnswerCache:
+    """
+    Persistent cache of role-based answers, partitioned by (document hash, role, model).
+    A question hits on an exact normalized match, or on a cached question whose
+    embedding is at least `threshold` similar and which has the same numbers (so
+    "revenue in 2022" never answers "revenue in 2023"). Entries expire after `ttl` seconds and
+    the least recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, db_path=ANSWER_CACHE_PATH, threshold=SIMILARITY_THRESHOLD,
+                 ttl=ANSWER_TTL_SECONDS, max_entries=MAX_ANSWERS):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " doc_hash TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " question TEXT NOT NULL,"
+                " embedding BLOB,"
+                " answer TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (doc_hash, role, model, question))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def lookup(self, doc_hash, role, model, question, embedding=None):
+        """Return a cached answer or None. `embedding` enables near-duplicate matching."""
+        question = normalize_question(question)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            row = conn.execute(
+                "SELECT question, answer FROM answers WHERE doc_hash = ? AND role = ? AND model = ? AND question = ?",
+                (doc_hash, role, model, question),
+            ).fetchone()
+            counter = "exact_hits"
+
+            if row is None and embedding is not None:
+                query = np.asarray(embedding, dtype=np.float32)
+                rows = conn.execute(
+                    "SELECT question, answer, embedding FROM answers"
+                    " WHERE doc_hash = ? AND role = ? AND model = ? AND length(embedding) = ?",
+                    (doc_hash, role, model, query.nbytes),
+                ).fetchall()
+                if rows:
+                    # One matrix-vector product over the partition's embeddings
+                    matrix = np.frombuffer(b"".join(blob for _, _, blob in rows), dtype=np.float32)
+                    matrix = matrix.reshape(len(rows), query.size)
+                    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix)) * np.linalg.norm(query)
+                    scores = np.divide(matrix @ query, norms, out=np.zeros(len(rows), dtype=np.float32),
+                                       where=norms > 0)
+                    numbers = question_numbers(question)
+                    for i in np.argsort(-scores):
+                        if scores[i] < self.threshold:
+                            break
+                        if question_numbers(rows[i][0]) == numbers:
+                            row = rows[i][:2]
+                            break
+                counter = "semantic_hits"
+
+            if row is None:
+                self._count("misses")
+                return None
+
+            conn.execute(
+                "UPDATE answers SET last_access = ?, hits = hits + 1"
+                " WHERE doc_hash = ? AND role = ? AND model = ? AND question = ?",
+                (now, doc_hash, role, model, row[0]),
+            )
+        self._count(counter)
+        return row[1]
+
+    def store(self, doc_hash, role, model, question, answer, embedding=None):
+        now = time.time()
+        blob = array("f", embedding).tobytes() if embedding is not None else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers"
+                " (doc_hash, role, model, question, embedding, answer, created, last_access, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (doc_hash, role, model, normalize_question(question), blob, answer, now, now),
+            )
+            # LRU eviction beyond the entry budget
+            conn.execute(
+                "DELETE FROM answers WHERE rowid IN ("
+                " SELECT rowid FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        total = hits + counters["misses"]
+        counters["hit_rate"] = hits / total if total else 0.0
+        with self._connect() as conn:
+            counters["entries"] = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return counters
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM answers")
+
+
+answer_cache = AnswerCache()
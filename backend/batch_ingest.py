@@ -0,0 +1,164 @@
+"""
+Headless batch ingestion: parse, index and extract the dashboard for many PDFs.
+
+    python -m backend.batch_ingest "filings/*.pdf" more_filings/ --workers 4
+
+Indexes are saved to the same on-disk cache the app reads, so uploads of these
+files open instantly (raise FSA_CACHE_MAX_BYTES for large batches). One JSON line
+per file is appended to the metrics file; files already recorded as "ok" are
+skipped, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backend.cache import CACHE_DIR, file_sha256
+
+DEFAULT_METRICS_PATH = os.path.join(CACHE_DIR, "batch_metrics.jsonl")
+# Each worker process is replaced after this many files to release parser memory
+MAX_FILES_PER_WORKER = 20
+
+
+# ----------------- Input discovery and resume ----------------
+def find_pdfs(inputs):
+    """Expand files, directories and glob patterns into a sorted list of PDF paths."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            paths.update(glob.glob(item, recursive=True))
+    return sorted(os.path.abspath(path) for path in paths if path.lower().endswith(".pdf"))
+
+
+def completed_hashes(metrics_path):
+    """Document hashes already processed successfully in earlier runs."""
+    done = set()
+    if not os.path.exists(metrics_path):
+        return done
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+            if record.get("status") == "ok":
+                done.add(record["doc_hash"])
+    return done
+
+
+def append_record(metrics_path, record):
+    with open(metrics_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ----------------- Worker ----------------
+def process_pdf(pdf_path, doc_hash):
+    """Build (or load) the index and dashboard for one PDF and save them to the cache."""
+    import pymupdf
+    from backend.cache import load_cached_analysis, save_analysis
+    from backend.model_docling import PIPELINE_CONFIG, build_index_from_pdf_docling
+    from backend.utils import extract_dashboard_async
+
+    start = time.perf_counter()
+    with pymupdf.open(pdf_path) as doc:
+        pages = len(doc)
+
+    index, dashboard = load_cached_analysis(doc_hash, PIPELINE_CONFIG)
+    cached = index is not None
+    timings = {}
+    if not cached:
+        # The batch is parallel across files, so each file is converted in a single process
+        index = build_index_from_pdf_docling(pdf_path, workers=1)
+        timings["index_seconds"] = round(time.perf_counter() - start, 2)
+        dashboard = asyncio.run(extract_dashboard_async(index))
+        timings["dashboard_seconds"] = round(time.perf_counter() - start - timings["index_seconds"], 2)
+        save_analysis(doc_hash, PIPELINE_CONFIG, index, dashboard)
+
+    seconds = time.perf_counter() - start
+    return {
+        "file": pdf_path,
+        "doc_hash": doc_hash,
+        "status": "ok",
+        "cached": cached,
+        "pages": pages,
+        "nodes": len(index.docstore.docs),
+        "seconds": round(seconds, 2),
+        "pages_per_second": round(pages / seconds, 2) if seconds else None,
+        **timings,
+        "key_metrics": dashboard.get("key_metrics"),
+        "risk_factors": dashboard.get("risk_factors"),
+        "dashboard_warnings": dashboard.get("warnings", []),
+    }
+
+
+# ----------------- Batch runner ----------------
+def run_batch(pdf_paths, workers=2, metrics_path=DEFAULT_METRICS_PATH):
+    """Process every PDF not yet recorded as done; returns (succeeded, failed) counts."""
+    os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+    done = completed_hashes(metrics_path)
+
+    pending = {}
+    for path in pdf_paths:
+        doc_hash = file_sha256(path)
+        if doc_hash not in done and doc_hash not in pending.values():
+            pending[path] = doc_hash
+    print(f"📦 {len(pdf_paths)} PDFs found, {len(pdf_paths) - len(pending)} already done or duplicate, "
+          f"{len(pending)} to process with {workers} workers")
+    if not pending:
+        return 0, 0
+
+    succeeded = failed = 0
+    batch_start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             max_tasks_per_child=MAX_FILES_PER_WORKER) as pool:
+        futures = {pool.submit(process_pdf, path, doc_hash): path for path, doc_hash in pending.items()}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                record = future.result()
+                succeeded += 1
+                print(f"✅ {os.path.basename(path)}: {record['pages']} pages in {record['seconds']}s "
+                      f"({record['pages_per_second']} pages/s{', cached' if record['cached'] else ''})")
+            except Exception as e:
+                record = {"file": path, "doc_hash": pending[path], "status": "error", "error": repr(e)}
+                failed += 1
+                print(f"❌ {os.path.basename(path)}: {e}")
+            record["finished"] = time.time()
+            append_record(metrics_path, record)
+
+    elapsed = time.perf_counter() - batch_start
+    print(f"🏁 {succeeded} succeeded, {failed} failed in {elapsed:.1f}s "
+          f"({succeeded / elapsed * 60:.1f} files/min) → {metrics_path}")
+    return succeeded, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-build indexes and dashboards for a batch of PDF filings.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="files processed in parallel")
+    parser.add_argument("--metrics", default=DEFAULT_METRICS_PATH, help="JSONL file of per-file results")
+    args = parser.parse_args(argv)
+
+    pdf_paths = find_pdfs(args.inputs)
+    if not pdf_paths:
+        print("No PDF files matched.")
+        return 1
+    _, failed = run_batch(pdf_paths, workers=args.workers, metrics_path=args.metrics)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from llama_index.core import StorageContext, load_index_from_storage
+from backend.numpy_vector_store import NumpyVectorStore
+from backend.hybrid_retrieval import BM25Index, get_bm25, register_bm25
+from backend.tracing import current_span
+
+# ----------------- Cache location and limits ----------------
+# Root folder for persisted indexes, override with FSA_CACHE_DIR
+CACHE_DIR = os.getenv(
+    "FSA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "financial_analyzer"))
+INDEX_CACHE_DIR = os.path.join(CACHE_DIR, "indexes")
+# Total size allowed on disk before least recently used entries are evicted
+MAX_CACHE_BYTES = int(os.getenv("FSA_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+MANIFEST_FILE = "manifest.json"
+DASHBOARD_FILE = "dashboard.json"
+
+
+# ----------------- Cache keys ----------------
+def file_sha256(data):
+    """Return the SHA-256 hex digest of raw file bytes or of a file path."""
+    hasher = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray)):
+        hasher.update(data)
+    else:
+        with open(data, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def config_hash(config):
+    """Stable short hash of the parser/chunker/embedding configuration."""
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(doc_hash, config):
+    return f"{doc_hash}-{config_hash(config)}"
+
+
+def _entry_dir(key):
+    return os.path.join(INDEX_CACHE_DIR, key)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _read_manifest(entry_path):
+    try:
+        with open(os.path.join(entry_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(entry_path, manifest):
+    # Write to a temp file first so a crash never leaves a half written manifest
+    tmp_path = os.path.join(entry_path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(entry_path, MANIFEST_FILE))
+
+
+# ----------------- Load / save ----------------
+def load_cached_analysis(doc_hash, config):
+    """
+    Load a persisted index and dashboard results for a document.
+    Returns (index, dashboard) or (None, None) on a cache miss.
+    """
+    entry_path = _entry_dir(cache_key(doc_hash, config))
+    manifest = _read_manifest(entry_path)
+    if manifest is None or manifest.get("config_hash") != config_hash(config):
+        return None, None
+
+    try:
+        # Vectors are memory-mapped straight from the saved matrix
+        vector_store = NumpyVectorStore.from_persist_dir(entry_path) if NumpyVectorStore.is_persisted(entry_path) else None
+        storage_context = StorageContext.from_defaults(persist_dir=entry_path, vector_store=vector_store)
+        index = load_index_from_storage(storage_context)
+        bm25 = BM25Index.from_persist_dir(entry_path)
+        if bm25 is not None:
+            register_bm25(index, bm25)
+        with open(os.path.join(entry_path, DASHBOARD_FILE), "r", encoding="utf-8") as f:
+            dashboard = json.load(f)
+    except Exception as e:
+        # A corrupted entry is dropped so the next upload rebuilds it
+        current_span().set(cache_entry_discarded=entry_path, cache_entry_error=repr(e))
+        shutil.rmtree(entry_path, ignore_errors=True)
+        return None, None
+
+    # Record the access time for LRU eviction
+    manifest["last_access"] = time.time()
+    _write_manifest(entry_path, manifest)
+    return index, dashboard
+
+
+def save_analysis(doc_hash, config, index, dashboard):
+    """Persist the index (docstore and vectors) and the dashboard results."""
+    key = cache_key(doc_hash, config)
+    entry_path = _entry_dir(key)
+    tmp_path = entry_path + f".tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path, exist_ok=True)
+
+    index.storage_context.persist(persist_dir=tmp_path)
+    get_bm25(index).persist(tmp_path)
+    with open(os.path.join(tmp_path, DASHBOARD_FILE), "w", encoding="utf-8") as f:
+        json.dump(dashboard, f)
+
+    now = time.time()
+    _write_manifest(tmp_path, {
+        "doc_hash": doc_hash,
+        "config": json.loads(json.dumps(config, default=str)),
+        "config_hash": config_hash(config),
+        "created": now,
+        "last_access": now,
+        "size_bytes": _dir_size(tmp_path),
+    })
+
+    # Swap the finished entry into place
+    shutil.rmtree(entry_path, ignore_errors=True)
+    os.replace(tmp_path, entry_path)
+
+    invalidate_stale_entries(config)
+    evict_lru()
+    return key
+
+
+# ----------------- Invalidation and eviction ----------------
+def _list_entries():
+    if not os.path.isdir(INDEX_CACHE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(INDEX_CACHE_DIR):
+        entry_path = os.path.join(INDEX_CACHE_DIR, name)
+        if not os.path.isdir(entry_path) or ".tmp-" in name:
+            continue
+        entries.append((entry_path, _read_manifest(entry_path)))
+    return entries
+
+
+def invalidate_stale_entries(config):
+    """
+    Remove entries built by the same parser with a different pipeline config.
+    Bumping any value in the config (e.g. "version") invalidates old indexes.
+    """
+    current = config_hash(config)
+    removed = 0
+    for entry_path, manifest in _list_entries():
+        if manifest is None:
+            stale = True
+        else:
+            same_parser = manifest.get("config", {}).get("parser") == config.get("parser")
+            stale = same_parser and manifest.get("config_hash") != current
+        if stale:
+            shutil.rmtree(entry_path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def evict_lru(max_bytes=MAX_CACHE_BYTES):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    entries = [(path, manifest) for path, manifest in _list_entries() if manifest]
+    entries.sort(key=lambda item: item[1].get("last_access", 0))
+    total = sum(manifest.get("size_bytes", 0) for _, manifest in entries)
+    removed = 0
+    for entry_path, manifest in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        total -= manifest.get("size_bytes", 0)
+        removed += 1
+    return removed
+
+
+def clear_cache():
+    """Delete every persisted index."""
+    shutil.rmtree(INDEX_CACHE_DIR, ignore_errors=True)
@@ -0,0 +1,58 @@
+import os
+from functools import lru_cache
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Keep-alive pool shared by every client in the process, so each question
+# reuses open TLS connections instead of handshaking again
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120.0)
+
+
+# ----------------- Shared clients (one per process) ----------------
+# Client libraries are imported inside the getters: the OpenAI SDK and the
+# LlamaIndex integrations cost about a second of import time nobody needs
+# until the first question or upload.
+@lru_cache(maxsize=None)
+def get_http_client():
+    return httpx.Client(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+
+
+@lru_cache(maxsize=None)
+def get_openrouter_llm(model="anthropic/claude-sonnet-4", max_tokens=4096):
+    from llama_index.llms.openrouter import OpenRouter
+    return OpenRouter(
+        model=model,
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        max_tokens=max_tokens,
+        http_client=get_http_client())
+
+
+@lru_cache(maxsize=None)
+def get_openai_llm(model="gpt-4o", max_tokens=4096):
+    from llama_index.llms.openai import OpenAI
+    return OpenAI(
+        model=model,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_tokens=max_tokens,
+        http_client=get_http_client())
+
+
+@lru_cache(maxsize=None)
+def get_openai_embedding(model="text-embedding-3-large"):
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    return OpenAIEmbedding(
+        model=model,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        # Retries and rate limiting belong to the EmbeddingExecutor in front of this client
+        max_retries=0,
+        http_client=get_http_client())
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Raw OpenAI SDK client, used for Whisper transcription."""
+    from openai import OpenAI as OpenAIClient
+    return OpenAIClient(api_key=os.getenv("OPENAI_API_KEY"), http_client=get_http_client())
@@ -0,0 +1,316 @@
+import asyncio
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Sequence
+from llama_index.core import Settings
+from llama_index.core.prompts.default_prompts import DEFAULT_TEXT_QA_PROMPT, DEFAULT_TREE_SUMMARIZE_PROMPT
+from llama_index.core.response_synthesizers.base import BaseSynthesizer
+
+from backend.hybrid_retrieval import tokenize
+from backend.tracing import atraced_stream, detach, span, start_span, traced_stream
+
+# response_mode value selecting the PackedSynthesizer in build_query_engine
+PACKED_MODE = "packed"
+
+# OpenRouter reports a generic 3900-token window; these are the models' real ones
+MODEL_CONTEXT_WINDOWS = {
+    "anthropic/claude-sonnet-4": 200000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+# Upper bound on context tokens sent in one call, whatever the model allows
+PACKED_CONTEXT_TOKENS = int(os.getenv("PACKED_CONTEXT_TOKENS", "16000"))
+# Parallel LLM calls in the map step of the overflow path
+MAP_CONCURRENCY = 4
+# A chunk whose word trigrams are this much contained in a kept chunk is a duplicate
+DUPLICATE_OVERLAP = 0.8
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\"'$])")
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+
+def count_tokens(text):
+    return len(Settings.tokenizer(text))
+
+
+def context_window(llm):
+    metadata = llm.metadata
+    return MODEL_CONTEXT_WINDOWS.get(metadata.model_name, metadata.context_window)
+
+
+def output_tokens(llm):
+    return getattr(llm, "max_tokens", None) or Settings.num_output
+
+
+# ----------------- Deduplication ----------------
+def _trigrams(text):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def dedupe_chunks(chunks, overlap=DUPLICATE_OVERLAP):
+    """
+    Drop chunks that repeat or are mostly contained in another retrieved chunk
+    (overlapping windows, repeated boilerplate). The longer of two near-duplicates is kept,
+    at the position of the first one.
+    """
+    kept = []  # [(text, trigrams)]
+    for text in chunks:
+        grams = _trigrams(text)
+        duplicate_of = None
+        for i, (_, kept_grams) in enumerate(kept):
+            shared = len(grams & kept_grams)
+            if shared and shared / min(len(grams), len(kept_grams)) >= overlap:
+                duplicate_of = i
+                break
+        if duplicate_of is None:
+            kept.append((text, grams))
+        elif len(grams) > len(kept[duplicate_of][1]):
+            kept[duplicate_of] = (text, grams)
+    return [text for text, _ in kept]
+
+
+# ----------------- Sentence ranking and packing ----------------
+def split_units(chunk):
+    """
+    Split a chunk into packable units: markdown tables and headings stay whole,
+    narrative paragraphs are split into sentences.
+    """
+    units = []
+    for block in re.split(r"\n\s*\n", chunk):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith("|") or block.startswith("#"):
+            units.append(block)
+        else:
+            units.extend(sentence.strip() for sentence in SENTENCE_END.split(block) if sentence.strip())
+    return units
+
+
+def _score(unit, query_terms):
+    if not query_terms:
+        return 0.0
+    return len(query_terms & set(tokenize(unit))) / len(query_terms)
+
+
+def pack_context(query_str, chunks, budget):
+    """
+    Pack chunks into at most `budget` tokens.
+    If everything fits, chunks are kept whole. Otherwise sentences and tables are
+    ranked by query-term coverage (retrieval rank breaks ties) and the best ones kept,
+    in their original order. Returns (context, complete) where complete is False when
+    some relevant unit had to be left out.
+    """
+    chunk_tokens = [count_tokens(chunk) for chunk in chunks]
+    if sum(chunk_tokens) <= budget:
+        return CHUNK_SEPARATOR.join(chunks), True
+
+    query_terms = set(tokenize(query_str))
+    units = [(chunk_no, unit_no, unit)
+             for chunk_no, chunk in enumerate(chunks)
+             for unit_no, unit in enumerate(split_units(chunk))]
+    ranked = sorted(units, key=lambda item: (-_score(item[2], query_terms), item[0], item[1]))
+
+    selected, used, complete = [], 0, True
+    for chunk_no, unit_no, unit in ranked:
+        tokens = count_tokens(unit)
+        if used + tokens > budget:
+            if _score(unit, query_terms) > 0:
+                complete = False
+            continue
+        selected.append((chunk_no, unit_no, unit))
+        used += tokens
+
+    selected.sort()
+    by_chunk = {}
+    for chunk_no, _, unit in selected:
+        by_chunk.setdefault(chunk_no, []).append(unit)
+    return CHUNK_SEPARATOR.join("\n".join(parts) for parts in by_chunk.values()), complete
+
+
+def group_chunks(query_str, chunks, budget):
+    """Greedily group whole chunks into prompts of at most `budget` tokens each."""
+    groups, current, used = [], [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk)
+        if tokens > budget:
+            # A single oversized chunk is packed down to its most relevant units
+            chunk, _ = pack_context(query_str, [chunk], budget)
+            tokens = count_tokens(chunk)
+        if current and used + tokens > budget:
+            groups.append(CHUNK_SEPARATOR.join(current))
+            current, used = [], 0
+        current.append(chunk)
+        used += tokens
+    if current:
+        groups.append(CHUNK_SEPARATOR.join(current))
+    return groups
+
+
+# ----------------- Synthesizer ----------------
+_stats = {"queries": 0, "llm_calls": 0}
+_stats_lock = threading.Lock()
+
+
+def synthesis_stats():
+    """Queries answered and LLM calls made by every PackedSynthesizer in this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["calls_per_query"] = stats["llm_calls"] / stats["queries"] if stats["queries"] else 0.0
+    return stats
+
+
+def _record(active_span, llm_calls, chunks, unique, context_tokens):
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats["llm_calls"] += llm_calls
+    active_span.set(llm_calls=llm_calls, chunks=chunks, unique_chunks=unique, context_tokens=context_tokens)
+
+
+class PackedSynthesizer(BaseSynthesizer):
+    """
+    Answers from retrieved chunks in a single LLM call whenever possible.
+
+    Duplicate chunks are dropped and the rest packed into one prompt sized to the
+    model's real context window (capped at max_context_tokens). Only when the relevant
+    text does not fit is it split into groups answered in parallel (at most
+    map_concurrency at a time) and merged by one final call.
+
+    With a router (backend.model_router.ModelRouter) each call goes to the model it
+    picks for that step, e.g. a faster one for the map calls, instead of llm.
+    """
+
+    def __init__(self, llm=None, streaming: bool = False, max_context_tokens: int = PACKED_CONTEXT_TOKENS,
+                 map_concurrency: int = MAP_CONCURRENCY, router=None, **kwargs: Any) -> None:
+        super().__init__(llm=llm, streaming=streaming, **kwargs)
+        self._router = router
+        self._qa_template = DEFAULT_TEXT_QA_PROMPT
+        self._reduce_template = DEFAULT_TREE_SUMMARIZE_PROMPT
+        self._max_context_tokens = max_context_tokens
+        self._map_concurrency = map_concurrency
+
+    def _get_prompts(self):
+        return {"qa_template": self._qa_template, "reduce_template": self._reduce_template}
+
+    def _update_prompts(self, prompts) -> None:
+        if "qa_template" in prompts:
+            self._qa_template = prompts["qa_template"]
+        if "reduce_template" in prompts:
+            self._reduce_template = prompts["reduce_template"]
+
+    def _budget(self, query_str):
+        prompt_tokens = count_tokens(self._qa_template.format(context_str="", query_str=query_str))
+        available = context_window(self._llm) - output_tokens(self._llm) - prompt_tokens
+        return max(min(available, self._max_context_tokens), 256)
+
+    def _plan(self, active_span, query_str, text_chunks):
+        """Return (packed context, None) for one call, or (None, groups) for map-reduce."""
+        unique = dedupe_chunks(list(text_chunks))
+        budget = self._budget(query_str)
+        context, complete = pack_context(query_str, unique, budget)
+        if complete:
+            _record(active_span, 1, len(text_chunks), len(unique), count_tokens(context))
+            return context, None
+        groups = group_chunks(query_str, unique, budget)
+        _record(active_span, len(groups) + 1, len(text_chunks), len(unique),
+                sum(count_tokens(group) for group in groups))
+        return None, groups
+
+    def _llm_span(self, llm, step, prompt_tokens, stream):
+        return start_span("llm", model=llm.metadata.model_name, step=step, streaming=stream,
+                          prompt_tokens=prompt_tokens)
+
+    @staticmethod
+    def _count_completion(active_span):
+        return lambda text: active_span.set(completion_tokens=count_tokens(text))
+
+    def _call(self, step, template, context_str, query_str, stream=False, **response_kwargs):
+        """One LLM call, on the model the router picks for it when there is a router."""
+        kwargs = dict(context_str=context_str, query_str=query_str, **response_kwargs)
+        prompt_tokens = count_tokens(template.format(**kwargs))
+        predict = lambda llm: self._predict(llm, step, template, prompt_tokens, stream, kwargs)
+        if self._router is None:
+            return predict(self._llm)
+        if stream:
+            return self._router.stream(step, prompt_tokens, predict)
+        return self._router.call(step, prompt_tokens, predict)
+
+    async def _acall(self, step, template, context_str, query_str, stream=False, **response_kwargs):
+        kwargs = dict(context_str=context_str, query_str=query_str, **response_kwargs)
+        prompt_tokens = count_tokens(template.format(**kwargs))
+        apredict = lambda llm: self._apredict(llm, step, template, prompt_tokens, stream, kwargs)
+        if self._router is None:
+            return await apredict(self._llm)
+        if stream:
+            return await self._router.astream(step, prompt_tokens, apredict)
+        return await self._router.acall(step, prompt_tokens, apredict)
+
+    def _predict(self, llm, step, template, prompt_tokens, stream, kwargs):
+        """One traced LLM call; a stream keeps its span open until it is consumed."""
+        active = self._llm_span(llm, step, prompt_tokens, stream)
+        try:
+            result = llm.stream(template, **kwargs) if stream else llm.predict(template, **kwargs)
+        except BaseException as e:
+            active.end(error=e)
+            raise
+        finally:
+            detach(active)
+        if stream:
+            return traced_stream(result, active, on_text=self._count_completion(active))
+        self._count_completion(active)(result)
+        active.end()
+        return result
+
+    async def _apredict(self, llm, step, template, prompt_tokens, stream, kwargs):
+        active = self._llm_span(llm, step, prompt_tokens, stream)
+        try:
+            if stream:
+                result = await llm.astream(template, **kwargs)
+            else:
+                result = await llm.apredict(template, **kwargs)
+        except BaseException as e:
+            active.end(error=e)
+            raise
+        finally:
+            detach(active)
+        if stream:
+            return atraced_stream(result, active, on_text=self._count_completion(active))
+        self._count_completion(active)(result)
+        active.end()
+        return result
+
+    def get_response(self, query_str: str, text_chunks: Sequence[str], **response_kwargs: Any):
+        with span("synthesize", mode=PACKED_MODE) as active:
+            context, groups = self._plan(active, query_str, text_chunks)
+            if groups is None:
+                return self._call("answer", self._qa_template, context, query_str,
+                                  stream=self._streaming, **response_kwargs)
+
+            # Each map call runs in a copy of this context so its span nests under synthesize
+            with ThreadPoolExecutor(max_workers=self._map_concurrency) as pool:
+                futures = [pool.submit(contextvars.copy_context().run, self._call,
+                                       "map", self._qa_template, group, query_str) for group in groups]
+                partials = [future.result() for future in futures]
+            return self._call("reduce", self._reduce_template, CHUNK_SEPARATOR.join(partials), query_str,
+                              stream=self._streaming, **response_kwargs)
+
+    async def aget_response(self, query_str: str, text_chunks: Sequence[str], **response_kwargs: Any):
+        with span("synthesize", mode=PACKED_MODE) as active:
+            context, groups = self._plan(active, query_str, text_chunks)
+            if groups is None:
+                return await self._acall("answer", self._qa_template, context, query_str,
+                                         stream=self._streaming, **response_kwargs)
+
+            semaphore = asyncio.Semaphore(self._map_concurrency)
+
+            async def answer_group(group):
+                async with semaphore:
+                    return await self._acall("map", self._qa_template, group, query_str)
+
+            partials = await asyncio.gather(*(answer_group(group) for group in groups))
+            return await self._acall("reduce", self._reduce_template, CHUNK_SEPARATOR.join(partials), query_str,
+                                     stream=self._streaming, **response_kwargs)
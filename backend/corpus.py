@@ -0,0 +1,258 @@
+import asyncio
+import re
+from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+from backend.context_packer import PACKED_MODE, count_tokens
+from backend.engine_pool import clear_engines, get_query_engine
+from backend.hybrid_retrieval import BM25Index, register_bm25
+from backend.index_registry import index_registry
+from backend.model_docling import RETRIEVAL_TOP_K, build_index_from_pdf_docling
+from backend.model_router import model_router
+from backend.numpy_vector_store import build_storage_context
+from backend.tracing import span
+from backend.utils import find_company_name_from_index
+
+# Metadata every corpus node carries; kept out of embeddings so cached vectors are reused
+FILING_KEYS = ["doc_hash", "company", "fiscal_year", "form_type", "section"]
+# Filings queried at once in fan-out mode
+FANOUT_CONCURRENCY = 4
+
+FORM_TYPE = re.compile(r"\bFORM\s+(10-K|10-Q|20-F|8-K|40-F)\b", re.I)
+FISCAL_YEAR = re.compile(
+    r"fiscal\s+year\s+ended\s+(?:[A-Za-z]+\s+\d{1,2},?\s+)?((?:19|20)\d{2})", re.I)
+ITEM_HEADING = re.compile(r"^[#\s]*(item\s+\d+[a-c]?)\.?\s*([^\n|]{0,80})", re.I | re.M)
+
+MERGE_PROMPT = """
+You are comparing several financial filings. Below are answers to the same question,
+one per filing. Combine them into a single comparison, ordered by fiscal year, and
+point out the changes between years and differences between companies.
+Only use the information given.
+
+Question: {question}
+
+{answers}
+"""
+
+
+# ----------------- Filing metadata ----------------
+def detect_filing_metadata(text):
+    """Guess form type and fiscal year from a filing's cover pages."""
+    form = FORM_TYPE.search(text)
+    year = FISCAL_YEAR.search(text)
+    return {
+        "form_type": form.group(1).upper() if form else "unknown",
+        "fiscal_year": year.group(1) if year else "unknown",
+    }
+
+
+def section_of(text, current):
+    """The 10-K item ("Item 1A. Risk Factors") a node starts, or the current one."""
+    match = ITEM_HEADING.search(text[:300])
+    if not match:
+        return current
+    title = re.sub(r"\s+", " ", match.group(2)).strip(" .")
+    return f"{match.group(1).title()}. {title}".strip(" .")
+
+
+def filing_label(filing):
+    return f"{filing['company']} {filing['form_type']} FY{filing['fiscal_year']}"
+
+
+def build_filters(filters):
+    """{"company": "Apple Inc.", "fiscal_year": ["2022", "2023"]} -> MetadataFilters (list values match any)."""
+    if not filters:
+        return None
+    return MetadataFilters(filters=[
+        MetadataFilter(key=key, value=[str(v) for v in value], operator=FilterOperator.IN)
+        if isinstance(value, (list, tuple, set))
+        else MetadataFilter(key=key, value=str(value), operator=FilterOperator.EQ)
+        for key, value in filters.items()
+    ])
+
+
+# ----------------- Corpus index ----------------
+class FilingCorpus:
+    """
+    Many filings in one index. Every node is tagged with its filing's company,
+    fiscal year, form type and 10-K section, and queries can be restricted to a
+    partition of the corpus with metadata filters.
+
+    A query for a single filing ({"doc_hash": ...}) goes straight to that filing's own
+    index, which is shared with other sessions (backend.index_registry); the merged
+    copy is only built once a query spans several filings. Filings the session is not
+    using can be released and are leased from the registry again when queried.
+    """
+
+    def __init__(self, registry=index_registry):
+        self.index = VectorStoreIndex(nodes=[], storage_context=build_storage_context())
+        self.registry = registry
+        self.filings = {}  # doc_hash -> filing metadata
+        self._indexes = {}  # doc_hash -> single-filing index (None once released), until it is merged
+        self._leases = {}  # doc_hash -> IndexLease keeping a shared index resident
+
+    def add_index(self, index, doc_hash, **metadata):
+        """
+        Register a single-filing index with its filing metadata.
+        metadata overrides detected values (company, fiscal_year, form_type).
+        """
+        if doc_hash in self.filings:
+            return self.filings[doc_hash]
+
+        nodes = list(index.docstore.docs.values())
+        cover_text = "\n".join(node.get_content() for node in nodes[:20])
+        filing = {"company": find_company_name_from_index(index) or "unknown", **detect_filing_metadata(cover_text)}
+        filing.update({key: str(value) for key, value in metadata.items() if value})
+        self.filings[doc_hash] = filing
+        self._indexes[doc_hash] = index
+        return filing
+
+    def label(self, doc_hash):
+        """The filing's label, with its hash prefix when another filing in the corpus has the same one."""
+        label = filing_label(self.filings[doc_hash])
+        if any(filing_label(filing) == label for other, filing in self.filings.items() if other != doc_hash):
+            label = f"{label} ({doc_hash[:8]})"
+        return label
+
+    def add_lease(self, lease, **metadata):
+        """
+        Register a filing from its lease on the shared index registry. The corpus holds
+        the lease while it queries that index, and releases it once the filing is merged,
+        on release() (or when the corpus is garbage collected).
+        """
+        doc_hash = lease.doc_hash
+        if doc_hash in self.filings:
+            if doc_hash in self._indexes and doc_hash not in self._leases:
+                # Released earlier: hold this lease rather than leasing again on the next query
+                self._leases[doc_hash] = lease
+                self._indexes[doc_hash] = lease.index
+            else:
+                lease.release()
+            return self.filings[doc_hash]
+        self._leases[doc_hash] = lease
+        return self.add_index(lease.index, doc_hash, **metadata)
+
+    def release(self, keep=()):
+        """
+        Return the leases of filings not merged yet, except those in keep (e.g. the ones
+        selected for comparison), so the registry can evict their indexes. The filings
+        stay in the corpus and are leased again when a query needs them.
+        """
+        for doc_hash in [doc_hash for doc_hash in self._leases if doc_hash not in keep]:
+            self._indexes[doc_hash] = None
+            self._leases.pop(doc_hash).release()
+
+    def _index_of(self, doc_hash):
+        """A filing's own index, leased from the registry again if it was released."""
+        index = self._indexes[doc_hash]
+        if index is None:
+            lease = self.registry.acquire(doc_hash)
+            if lease is None:
+                raise LookupError(f"{self.label(doc_hash)} is no longer cached; open it again to query it")
+            self._leases[doc_hash] = lease
+            index = self._indexes[doc_hash] = lease.index
+        return index
+
+    def _merge(self):
+        """
+        Copy the nodes of filings not merged yet into the corpus index, tagged with filing metadata.
+        Node text and embedded metadata are unchanged, so embeddings come from the embedding cache.
+        """
+        if not self._indexes:
+            return
+        try:
+            for doc_hash in list(self._indexes):
+                self._merge_filing(doc_hash, self._index_of(doc_hash))
+        finally:
+            # Keyword index and pooled engines must see the new nodes; rebuilt once per merge
+            register_bm25(self.index, BM25Index.from_nodes(list(self.index.docstore.docs.values())))
+            clear_engines(self.index)
+
+    def _merge_filing(self, doc_hash, index):
+        filing = self.filings[doc_hash]
+        section = "Cover"
+        corpus_nodes = []
+        for node in index.docstore.docs.values():
+            section = section_of(node.get_content(), section)
+            corpus_nodes.append(TextNode(
+                text=node.get_content(),
+                metadata={**node.metadata, **filing, "doc_hash": doc_hash, "section": section},
+                excluded_embed_metadata_keys=list(node.excluded_embed_metadata_keys) + FILING_KEYS,
+                excluded_llm_metadata_keys=list(node.excluded_llm_metadata_keys) + ["doc_hash"],
+            ))
+        with span("corpus_add", filing=self.label(doc_hash), nodes=len(corpus_nodes)):
+            self.index.insert_nodes(corpus_nodes)
+        del self._indexes[doc_hash]
+        lease = self._leases.pop(doc_hash, None)
+        if lease is not None:
+            lease.release()
+
+    def _target(self, filters):
+        """The index to query and the filters left to apply on it."""
+        doc_hash = (filters or {}).get("doc_hash")
+        if set(filters or {}) == {"doc_hash"} and doc_hash in self._indexes:
+            return self._index_of(doc_hash), None
+        self._merge()
+        return self.index, build_filters(filters)
+
+    def add_filing(self, pdf_file, doc_hash, **metadata):
+        return self.add_index(build_index_from_pdf_docling(pdf_file), doc_hash, **metadata)
+
+    def _engine(self, filters, llm, streaming=False):
+        """Query engine over the filings matching filters; without llm, calls are routed per step."""
+        index, metadata_filters = self._target(filters)
+        return get_query_engine(
+            index, llm=llm or model_router.default_llm(), similarity_top_k=RETRIEVAL_TOP_K,
+            response_mode=PACKED_MODE, streaming=streaming, filters=metadata_filters,
+            router=None if llm else model_router)
+
+    def query(self, query, filters=None, llm=None, streaming=False):
+        """Answer over the filings matching filters, e.g. {"company": "Apple Inc.", "fiscal_year": "2023"}."""
+        response = self._engine(filters, llm, streaming).query(query)
+        if streaming:
+            return response.response_gen
+        return str(response)
+
+    async def aquery(self, query, filters=None, llm=None):
+        return str(await self._engine(filters, llm).aquery(query))
+
+    async def acompare(self, question, doc_hashes=None, llm=None, role_context=""):
+        """
+        Fan-out: ask the same question of each filing concurrently, then merge the
+        answers in one call. Returns {"answers": {doc_hash: answer}, "comparison": text};
+        label(doc_hash) names each filing.
+        Without llm, every call is routed (backend.model_router).
+        """
+        doc_hashes = [doc_hash for doc_hash in (doc_hashes or self.filings) if doc_hash in self.filings]
+        semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+        query = QueryBundle(query_str=f"{role_context}\nUser Question: {question}", custom_embedding_strs=[question])
+
+        async def ask(doc_hash):
+            async with semaphore:
+                return await self.aquery(query, filters={"doc_hash": doc_hash}, llm=llm)
+
+        with span("compare", filings=len(doc_hashes)):
+            results = await asyncio.gather(*(ask(doc_hash) for doc_hash in doc_hashes), return_exceptions=True)
+            answers = {}
+            for doc_hash, result in sorted(zip(doc_hashes, results),
+                                           key=lambda item: self.filings[item[0]]["fiscal_year"]):
+                answers[doc_hash] = f"Error: {result}" if isinstance(result, Exception) else result
+
+            answer_text = "\n\n".join(
+                f"### {self.label(doc_hash)}\n{answer}" for doc_hash, answer in answers.items())
+            prompt = MERGE_PROMPT.format(question=question, answers=answer_text)
+            prompt_tokens = count_tokens(prompt)
+
+            async def merge(merge_llm):
+                with span("llm", model=merge_llm.metadata.model_name, step="merge", streaming=False,
+                          prompt_tokens=prompt_tokens) as merge_span:
+                    merged = await merge_llm.acomplete(prompt)
+                    merge_span.set(completion_tokens=count_tokens(merged.text))
+                return merged.text
+
+            comparison = await (merge(llm) if llm else model_router.acall("merge", prompt_tokens, merge))
+        return {"answers": answers, "comparison": comparison}
+
+    def compare(self, question, doc_hashes=None, llm=None, role_context=""):
+        return asyncio.run(self.acompare(question, doc_hashes, llm, role_context))
@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import time
+from llama_index.core import Document
+from dotenv import load_dotenv
+
+from backend.progress import report
+from backend.tracing import current_span
+
+load_dotenv()
+
+# Number of Docling worker processes; 1 keeps the original single serial job
+DOCLING_WORKERS = int(os.getenv("DOCLING_WORKERS", "1"))
+PAGES_PER_SHARD = int(os.getenv("DOCLING_PAGES_PER_SHARD", "8"))
+SHARD_TIMEOUT = int(os.getenv("DOCLING_SHARD_TIMEOUT", "600"))
+SHARD_RETRIES = 1
+
+
+# ----------------- Docling converter ----------------
+def build_pdf_converter(do_ocr=False, do_table_structure=True):
+    """Docling converter with the PDF pipeline options actually applied."""
+    # Docling pulls in torch and transformers (several seconds), so it is only
+    # imported once a PDF actually needs converting
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.do_ocr = do_ocr  # Skip OCR for text-based PDFs
+    pipeline_options.do_table_structure = do_table_structure  # Keep table detection
+    return DocumentConverter(
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+    )
+
+
+# Each worker process builds its converter (and loads the layout/table models) once
+_worker_converter = None
+
+
+def _init_worker(do_ocr, do_table_structure):
+    global _worker_converter
+    _worker_converter = build_pdf_converter(do_ocr, do_table_structure)
+
+
+def convert_page_range(pdf_file, page_range, converter=None):
+    """
+    Convert pages page_range[0]..page_range[1] (1-based, inclusive) and
+    return a list of (page_no, markdown) in page order.
+    """
+    converter = converter or _worker_converter or build_pdf_converter()
+    result = converter.convert(pdf_file, page_range=page_range)
+    doc = result.document
+    start, end = page_range
+    return [(page_no, doc.export_to_markdown(page_no=page_no)) for page_no in range(start, end + 1)]
+
+
+# ----------------- Sharded conversion ----------------
+def plan_shards(page_count, pages_per_shard=PAGES_PER_SHARD):
+    return [
+        (start, min(start + pages_per_shard - 1, page_count))
+        for start in range(1, page_count + 1, pages_per_shard)
+    ]
+
+
+def convert_pdf_parallel(pdf_file, workers=DOCLING_WORKERS, pages_per_shard=PAGES_PER_SHARD,
+                         shard_timeout=SHARD_TIMEOUT, retries=SHARD_RETRIES,
+                         do_ocr=False, do_table_structure=True, shards=None):
+    """
+    Split the PDF into page ranges and convert the shards in a process pool.
+    Returns a list of (page_no, markdown) for the converted pages in page order.
+    Pass `shards` to convert only selected page ranges instead of the whole file.
+    A shard that fails or exceeds shard_timeout is resubmitted up to `retries` times.
+    """
+    if shards is None:
+        import pymupdf
+        with pymupdf.open(pdf_file) as doc:
+            page_count = doc.page_count
+        shards = plan_shards(page_count, pages_per_shard)
+        report("parse", done=0, total=page_count)
+    if not shards:
+        return []
+
+    # spawn avoids forking a parent that may already hold torch / Streamlit threads
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(
+        processes=max(1, min(workers, len(shards))),
+        initializer=_init_worker,
+        initargs=(do_ocr, do_table_structure),
+    )
+    try:
+        pending = {shard: pool.apply_async(convert_page_range, (pdf_file, shard)) for shard in shards}
+        attempts = {shard: 0 for shard in shards}
+        pages = {}
+
+        # Shards are collected in page order. The deadline starts when we begin
+        # waiting on a shard, so shards queued behind busy workers are not penalised.
+        for shard in shards:
+            started = time.monotonic()
+            while True:
+                remaining = shard_timeout - (time.monotonic() - started)
+                try:
+                    shard_pages = pending[shard].get(timeout=max(remaining, 0))
+                    break
+                except Exception as e:
+                    if attempts[shard] >= retries:
+                        raise RuntimeError(f"Docling shard pages {shard[0]}-{shard[1]} failed: {e!r}") from e
+                    attempts[shard] += 1
+                    current_span().set(shard_retries=sum(attempts.values()),
+                                       last_shard_error=f"pages {shard[0]}-{shard[1]}: {e!r}")
+                    pending[shard] = pool.apply_async(convert_page_range, (pdf_file, shard))
+                    started = time.monotonic()
+            pages.update(shard_pages)
+            # Also the point where a cancelled job stops (the pool is terminated below); outside
+            # the retry handler, so Cancelled is never mistaken for a failed shard
+            report("parse", advance=shard[1] - shard[0] + 1)
+    finally:
+        # terminate also kills any worker still stuck on a timed out shard
+        pool.terminate()
+        pool.join()
+
+    return [(page_no, pages[page_no]) for page_no in sorted(pages)]
+
+
+# Page metadata kept out of the embedded text: it is the embedding cache key, and the same
+# chunk in a re-upload (new temp file name) or another filing (other page) must match
+PAGE_EMBED_EXCLUDED_KEYS = ["file_name", "page_label"]
+
+
+def load_documents_parallel(pdf_file, **kwargs):
+    """One Document per page, keeping the page number as metadata."""
+    file_name = os.path.basename(str(pdf_file))
+    return [
+        Document(text=markdown, metadata={"page_label": str(page_no), "file_name": file_name},
+                 excluded_embed_metadata_keys=list(PAGE_EMBED_EXCLUDED_KEYS))
+        for page_no, markdown in convert_pdf_parallel(pdf_file, **kwargs)
+        if markdown.strip()
+    ]
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from array import array
+from collections import Counter
+from typing import Any, Callable, List, Union
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from backend.cache import CACHE_DIR
+from backend.embedding_executor import EmbeddingExecutor
+from backend.progress import report, reporter
+from backend.tracing import span
+
+# SQLite file shared by every process on the machine
+EMBED_CACHE_PATH = os.getenv("FSA_EMBED_CACHE", os.path.join(CACHE_DIR, "embeddings.sqlite"))
+
+
+def normalize_text(text):
+    """Collapse whitespace so re-extracted boilerplate hashes the same."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+# ----------------- Cached embedding model ----------------
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model (e.g. OpenAIEmbedding) with a persistent vector store
+    keyed by (model, normalized chunk text hash). Only cache misses are sent to the
+    wrapped model, through an EmbeddingExecutor (batching, concurrency, rate limits,
+    retries). Each completed batch is written to the cache right away, so an ingest
+    that fails part way resumes from the batches already embedded.
+
+    embed_model may also be a callable returning the model, in which case model_name
+    must be given and the client is only built on the first cache miss or query.
+    """
+
+    _embed_model: Union[BaseEmbedding, Callable[[], BaseEmbedding]] = PrivateAttr()
+    _db_path: str = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _executor: EmbeddingExecutor = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, embed_model: Union[BaseEmbedding, Callable[[], BaseEmbedding]],
+                 db_path: str = EMBED_CACHE_PATH, executor: EmbeddingExecutor = None, **kwargs: Any):
+        # Look up a large slice at once; misses are re-batched by the wrapped model
+        kwargs.setdefault("embed_batch_size", 2048)
+        if isinstance(embed_model, BaseEmbedding):
+            kwargs["model_name"] = embed_model.model_name
+        elif "model_name" not in kwargs:
+            raise ValueError("model_name is required when embed_model is a factory")
+        super().__init__(**kwargs)
+        self._embed_model = embed_model
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._executor = executor or EmbeddingExecutor()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """The wrapped model, built from its factory on first use."""
+        if not isinstance(self._embed_model, BaseEmbedding):
+            with self._lock:
+                if not isinstance(self._embed_model, BaseEmbedding):
+                    self._embed_model = self._embed_model()
+        return self._embed_model
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- cache lookups ----------
+    def _lookup(self, hashes):
+        found = {}
+        unique = list(set(hashes))
+        with self._connect() as conn:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *chunk],
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, items):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, key, array("f", vector).tobytes()) for key, vector in items],
+            )
+
+    def _resolve(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        found = self._lookup(hashes)
+        misses = sum(1 for key in hashes if key not in found)
+        with self._lock:
+            self._hits += len(hashes) - misses
+            self._misses += misses
+
+        # Embed each distinct missing chunk once
+        miss_texts = {}
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in miss_texts:
+                miss_texts[key] = text
+        return hashes, found, miss_texts
+
+    def _checkpoint(self, keys, found, hashes):
+        """
+        on_batch callback storing each embedded batch as soon as it arrives and
+        advancing the job's "embed" progress by the texts it covers.
+        """
+        # Batches complete on the executor's thread, outside this context
+        report_progress = reporter()
+        counts = Counter(hashes)
+
+        def on_batch(start, vectors):
+            items = list(zip(keys[start:start + len(vectors)], vectors))
+            self._store(items)
+            found.update(items)
+            report_progress("embed", advance=sum(counts[key] for key, _ in items))
+        return on_batch
+
+    @staticmethod
+    def _report_hits(hashes, found):
+        report("embed", advance=sum(1 for key in hashes if key in found))
+
+    # One request per executor batch (the public batch API would re-split and retry on its own)
+    async def _embed_batch(self, texts):
+        return await self.embed_model._aget_text_embeddings(texts)
+
+    async def _embed_queries(self, queries):
+        return [await self.embed_model.aget_query_embedding(query) for query in queries]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        with span("embed", model=self.model_name, texts=len(texts)) as active:
+            hashes, found, miss_texts = self._resolve(texts)
+            active.set(cache_hits=len(found), cache_misses=len(miss_texts))
+            self._report_hits(hashes, found)
+            if miss_texts:
+                self._executor.embed(self._embed_batch, list(miss_texts.values()),
+                                     on_batch=self._checkpoint(list(miss_texts), found, hashes))
+            return [found[key] for key in hashes]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        with span("embed", model=self.model_name, texts=len(texts)) as active:
+            hashes, found, miss_texts = self._resolve(texts)
+            active.set(cache_hits=len(found), cache_misses=len(miss_texts))
+            self._report_hits(hashes, found)
+            if miss_texts:
+                await self._executor.aembed(self._embed_batch, list(miss_texts.values()),
+                                            on_batch=self._checkpoint(list(miss_texts), found, hashes))
+            return [found[key] for key in hashes]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    # Queries are one-off: not cached, but rate limited and retried like any request
+    def _get_query_embedding(self, query: str) -> List[float]:
+        with span("embed", model=self.model_name, texts=1, query=True):
+            return self._executor.embed(self._embed_queries, [query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        with span("embed", model=self.model_name, texts=1, query=True):
+            return (await self._executor.aembed(self._embed_queries, [query]))[0]
+
+    # ---------- counters ----------
+    def stats(self):
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / total if total else 0.0,
+            **self._executor.stats(),
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
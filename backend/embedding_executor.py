@@ -0,0 +1,222 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+from backend.tracing import current_span
+
+# Texts per embedding request and requests in flight at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Client-side limits, set a little under the account's; 0 disables a limit
+EMBED_RPM = float(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = float(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+# Seconds of traffic a bucket may send at once after being idle
+BURST_SECONDS = 10
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Transport errors carry no status code; matched by name so no client library is imported
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "TimeoutException", "NetworkError",
+                    "ConnectionError", "TimeoutError"}
+
+
+def estimate_tokens(text):
+    # ~4 characters per token in English filings; only used for rate limiting
+    return len(text) // 4 + 1
+
+
+# ----------------- Errors ----------------
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def retry_after(error):
+    """Seconds from a Retry-After header on the error's response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after")), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+# ----------------- Rate limiting ----------------
+class TokenBucket:
+    """
+    `rate` tokens per second, up to `capacity` saved while idle. Only used from the
+    executor's event loop, so it needs no lock.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount=1):
+        """Wait until `amount` tokens are available and take them; returns seconds waited."""
+        # A single request larger than the bucket still has to go through eventually
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return waited
+            delay = (amount - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+def per_minute_bucket(limit):
+    if not limit:
+        return None
+    rate = limit / 60
+    return TokenBucket(rate, capacity=max(rate * BURST_SECONDS, 1))
+
+
+# ----------------- Executor ----------------
+class EmbeddingExecutor:
+    """
+    Sends texts to an embedding model in batches of `batch_size`, at most
+    `concurrency` requests in flight, under requests-per-minute and tokens-per-minute
+    limits. 429s and transient errors are retried with jittered exponential backoff
+    (Retry-After wins when the server sends one), and a 429 pauses every batch, not
+    just the one that hit it.
+
+    on_batch(start, vectors) is called as soon as a batch completes, with the offset of
+    its first text, so callers can checkpoint finished work: if a batch finally fails,
+    the batches already done are not lost.
+
+    All requests run on one background event loop owned by the executor, so an async
+    client (and its keep-alive connections) is never shared across event loops.
+    """
+
+    def __init__(self, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY,
+                 requests_per_minute=EMBED_RPM, tokens_per_minute=EMBED_TPM,
+                 max_retries=EMBED_MAX_RETRIES, backoff_base=BACKOFF_BASE_S, backoff_max=BACKOFF_MAX_S):
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._request_bucket = per_minute_bucket(requests_per_minute)
+        self._token_bucket = per_minute_bucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "rate_limited": 0, "throttle_wait_s": 0.0}
+
+    def _background_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="embedding-executor", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    # ---------- public API ----------
+    def embed(self, embed_batch, texts, on_batch=None):
+        """
+        Embed texts with embed_batch, an async function taking a list of texts and
+        returning their vectors in order (one request). Blocks until done.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._run(embed_batch, texts, on_batch), self._background_loop())
+        vectors, job = future.result()
+        current_span().set(**job)
+        return vectors
+
+    async def aembed(self, embed_batch, texts, on_batch=None):
+        future = asyncio.run_coroutine_threadsafe(self._run(embed_batch, texts, on_batch), self._background_loop())
+        vectors, job = await asyncio.wrap_future(future)
+        current_span().set(**job)
+        return vectors
+
+    def stats(self):
+        """Totals for every job this executor ran."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    # ---------- batches ----------
+    async def _run(self, embed_batch, texts, on_batch):
+        starts = list(range(0, len(texts), self.batch_size))
+        results = {}
+        failures = []
+        job = {"batches": len(starts), "retries": 0, "rate_limited": 0, "throttle_wait_s": 0.0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_batch(start):
+            async with semaphore:
+                if failures:
+                    return  # a batch gave up; the rest are left for the retried run
+                batch = texts[start:start + self.batch_size]
+                try:
+                    vectors = await self._send(embed_batch, batch, job)
+                    if len(vectors) != len(batch):
+                        raise ValueError(f"Got {len(vectors)} embeddings for {len(batch)} texts")
+                    results[start] = vectors
+                    # A failing checkpoint (or a cancelled job) stops the remaining batches too
+                    if on_batch:
+                        on_batch(start, vectors)
+                except Exception as e:
+                    failures.append(e)
+
+        await asyncio.gather(*(run_batch(start) for start in starts))
+        job["throttle_wait_s"] = round(job["throttle_wait_s"], 3)
+        with self._stats_lock:
+            for key in ("retries", "rate_limited", "throttle_wait_s"):
+                self._stats[key] += job[key]
+        if failures:
+            raise failures[0]
+        return [vector for start in starts for vector in results[start]], job
+
+    async def _send(self, embed_batch, batch, job):
+        tokens = sum(estimate_tokens(text) for text in batch)
+        for attempt in range(self.max_retries + 1):
+            job["throttle_wait_s"] += await self._throttle(tokens)
+            try:
+                vectors = await embed_batch(batch)
+                with self._stats_lock:
+                    self._stats["requests"] += 1
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                job["retries"] += 1
+                if status_code(e) == 429:
+                    # The account is over its limit: hold back every batch, not only this one
+                    job["rate_limited"] += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    async def _throttle(self, tokens):
+        waited = 0.0
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+            waited += pause
+        if self._request_bucket:
+            waited += await self._request_bucket.acquire(1)
+        if self._token_bucket:
+            waited += await self._token_bucket.acquire(tokens)
+        return waited
@@ -0,0 +1,39 @@
+import threading
+import weakref
+
+from backend.context_packer import PACKED_MODE, PackedSynthesizer
+from backend.hybrid_retrieval import build_query_engine
+
+# index -> {(llm, router, top_k, response_mode, streaming, filters): query engine}
+# Engines are dropped together with their index.
+_engines = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_query_engine(index, llm, similarity_top_k, response_mode, streaming=False, filters=None, router=None):
+    """
+    Return a prebuilt query engine for this combination, building it on first use.
+    LLM clients are process-wide singletons (backend.clients), so their identity is a stable key.
+    With a router (packed mode only) the model is picked per call and llm only sizes the context.
+    """
+    key = (id(llm), id(router), similarity_top_k, response_mode, streaming,
+           filters.model_dump_json() if filters is not None else None)
+    with _lock:
+        engines = _engines.setdefault(index, {})
+        engine = engines.get(key)
+        if engine is None:
+            kwargs = {}
+            if response_mode == PACKED_MODE:
+                kwargs["response_synthesizer"] = PackedSynthesizer(llm=llm, streaming=streaming, router=router)
+            engine = engines[key] = build_query_engine(
+                index, llm=llm, similarity_top_k=similarity_top_k,
+                response_mode=response_mode, streaming=streaming, filters=filters, **kwargs)
+    return engine
+
+
+def clear_engines(index=None):
+    with _lock:
+        if index is None:
+            _engines.clear()
+        else:
+            _engines.pop(index, None)
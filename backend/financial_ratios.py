@@ -0,0 +1,210 @@
+import re
+import weakref
+import numpy as np
+
+from backend.financial_tables import LINE_ITEMS, iter_markdown_tables, match_label, row_by_year, statement_kind, table_scale
+
+# ----------------- Statement line items ----------------
+# Labels after normalization (lower case, punctuation dropped), most specific first;
+# each item is only read from its statement (STATEMENT_OF)
+STATEMENT_ITEMS = {
+    # Income statement
+    "revenue": LINE_ITEMS["revenue"],
+    "cost_of_revenue": [r"total cost of (sales|revenues?)", r"cost of (sales|revenues?|goods sold)"],
+    "gross_profit": [r"gross (profit|margin)"],
+    "operating_income": [r"operating income", r"income from operations", r"operating profit"],
+    "interest_expense": [r"interest expense"],
+    "pretax_income": [r"income before (provision for )?income taxes", r"earnings before (provision for )?income taxes"],
+    "income_tax": [r"provision for income taxes", r"income tax expense", r"income taxes"],
+    "net_income": LINE_ITEMS["net_profit"],
+    # Balance sheet
+    "cash": [r"cash and cash equivalents"],
+    "inventory": [r"inventor(y|ies)"],
+    "current_assets": [r"total current assets"],
+    "total_assets": [r"total assets"],
+    "current_liabilities": [r"total current liabilities"],
+    "short_term_debt": [r"short term debt", r"commercial paper", r"current portion of long term debt"],
+    "long_term_debt": [r"long term debt", r"term debt"],
+    "total_liabilities": [r"total liabilities(?! and)"],
+    "equity": [r"total (shareholders|stockholders) equity", r"total equity"],
+    # Cash flow statement
+    "operating_cash_flow": [r"(net )?cash (generated|provided) by operating activities",
+                            r"net cash from operating activities"],
+    "capex": [r"payments for acquisition of property, plant and equipment",
+              r"purchases? of property(, plant)? and equipment", r"capital expenditures"],
+}
+
+STATEMENT_OF = {
+    **dict.fromkeys(["revenue", "cost_of_revenue", "gross_profit", "operating_income", "interest_expense",
+                     "pretax_income", "income_tax", "net_income"], "income"),
+    **dict.fromkeys(["cash", "inventory", "current_assets", "total_assets", "current_liabilities",
+                     "short_term_debt", "long_term_debt", "total_liabilities", "equity"], "balance"),
+    **dict.fromkeys(["operating_cash_flow", "capex"], "cash_flow"),
+}
+
+# Tax rate assumed for NOPAT when the statements give no effective rate
+STATUTORY_TAX_RATE = 0.21
+
+# (key, label, unit) in display order; "%" ratios are shown as percentages, "x" as multiples
+RATIOS = [
+    ("gross_margin", "Gross margin", "%"),
+    ("operating_margin", "Operating margin", "%"),
+    ("net_margin", "Net margin", "%"),
+    ("free_cash_flow_margin", "Free cash flow margin", "%"),
+    ("revenue_growth", "Revenue growth (YoY)", "%"),
+    ("operating_income_growth", "Operating income growth (YoY)", "%"),
+    ("net_income_growth", "Net income growth (YoY)", "%"),
+    ("roe", "Return on equity (ROE)", "%"),
+    ("roa", "Return on assets (ROA)", "%"),
+    ("roic", "Return on invested capital (ROIC)", "%"),
+    ("debt_to_equity", "Debt to equity", "x"),
+    ("liabilities_to_assets", "Liabilities to assets", "%"),
+    ("interest_coverage", "Interest coverage (EBIT / interest)", "x"),
+    ("current_ratio", "Current ratio", "x"),
+    ("quick_ratio", "Quick ratio", "x"),
+    ("cash_ratio", "Cash ratio", "x"),
+]
+
+# Questions the ratio table answers on its own, with less retrieved text
+RATIO_QUESTION = re.compile(
+    r"\b(ratios?|margins?|growth|roe|roa|roic|return on|leverage|debt|liquidity|coverage|solvency)\b", re.I)
+
+
+# ----------------- Per-period statements ----------------
+def extract_statements(text):
+    """
+    Parse statement line items from the markdown tables in text into per-period arrays.
+    Returns {"periods": array of fiscal years, most recent first, "items": {item: array}},
+    where every item array is aligned to periods (in millions, NaN where not reported).
+    Each item is taken from the first matching row of its own statement (income
+    statement, balance sheet or cash flow statement), in document order; values
+    come from their year's column, never from percent-change columns.
+    """
+    tables = []
+    for rows, preceding_text in iter_markdown_tables(text):
+        kind = statement_kind(rows, preceding_text)
+        if kind:
+            tables.append((kind, rows, preceding_text))
+
+    found = {}
+    for item, patterns in STATEMENT_ITEMS.items():
+        for kind, rows, preceding_text in tables:
+            if kind != STATEMENT_OF[item]:
+                continue
+            row = next((cells for cells in rows if cells and match_label(cells[0], patterns)
+                        and "per share" not in cells[0].lower()), None)
+            by_year = row_by_year(row, rows) if row else {}
+            if any(value is not None for value in by_year.values()):
+                scale = table_scale(rows, preceding_text)
+                found[item] = {year: value * scale for year, value in by_year.items() if value is not None}
+                break
+
+    periods = np.array(sorted({year for values in found.values() for year in values}, reverse=True), dtype=int)
+    items = {item: np.array([values.get(year, np.nan) for year in periods], dtype=float)
+             for item, values in found.items()}
+    return {"periods": periods, "items": items}
+
+
+# ----------------- Ratios ----------------
+def _growth(values):
+    """Change against the next (earlier) period; NaN for the oldest."""
+    growth = np.full_like(values, np.nan)
+    growth[:-1] = values[:-1] / np.abs(values[1:]) - 1
+    return growth
+
+
+def _average(values):
+    """Mean of each period's and the prior period's balance, or the ending balance without one."""
+    average = values.copy()
+    average[:-1] = np.where(np.isnan(values[1:]), values[:-1], (values[:-1] + values[1:]) / 2)
+    return average
+
+
+def compute_ratios(statements):
+    """Every ratio in RATIOS as an array over statements["periods"] (NaN where an input is missing)."""
+    n = len(statements["periods"])
+    missing = np.full(n, np.nan)
+    item = lambda name: statements["items"].get(name, missing)
+
+    revenue, net_income, operating_income = item("revenue"), item("net_income"), item("operating_income")
+    gross_profit = np.where(np.isnan(item("gross_profit")), revenue - item("cost_of_revenue"), item("gross_profit"))
+    equity, cash = item("equity"), item("cash")
+    debt = np.nansum([item("short_term_debt"), item("long_term_debt")], axis=0)
+    debt[np.isnan(item("short_term_debt")) & np.isnan(item("long_term_debt"))] = np.nan
+
+    # NOPAT at the effective tax rate, or the statutory one when it is not reported
+    tax_rate = np.clip(item("income_tax") / item("pretax_income"), 0.0, 0.5)
+    tax_rate = np.where(np.isnan(tax_rate), STATUTORY_TAX_RATE, tax_rate)
+    nopat = operating_income * (1 - tax_rate)
+    invested_capital = equity + np.nan_to_num(debt) - np.nan_to_num(cash)
+    free_cash_flow = item("operating_cash_flow") - np.abs(item("capex"))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = {
+            "gross_margin": gross_profit / revenue,
+            "operating_margin": operating_income / revenue,
+            "net_margin": net_income / revenue,
+            "free_cash_flow_margin": free_cash_flow / revenue,
+            "revenue_growth": _growth(revenue),
+            "operating_income_growth": _growth(operating_income),
+            "net_income_growth": _growth(net_income),
+            "roe": net_income / _average(equity),
+            "roa": net_income / _average(item("total_assets")),
+            "roic": nopat / _average(invested_capital),
+            "debt_to_equity": debt / equity,
+            "liabilities_to_assets": item("total_liabilities") / item("total_assets"),
+            "interest_coverage": operating_income / np.abs(item("interest_expense")),
+            "current_ratio": item("current_assets") / item("current_liabilities"),
+            "quick_ratio": (item("current_assets") - np.nan_to_num(item("inventory"))) / item("current_liabilities"),
+            "cash_ratio": cash / item("current_liabilities"),
+        }
+    # Division by zero gives inf; treat it as not computable
+    return {key: np.where(np.isfinite(values), values, np.nan) for key, values in ratios.items()}
+
+
+def format_ratio_table(statements, ratios):
+    """Markdown table of the computable ratios, one column per fiscal year; "" if none are."""
+    periods = statements["periods"]
+    rows = []
+    for key, label, unit in RATIOS:
+        values = ratios[key]
+        if np.isnan(values).all():
+            continue
+        cells = ["n/a" if np.isnan(value) else f"{value * 100:.1f}%" if unit == "%" else f"{value:.2f}x"
+                 for value in values]
+        rows.append(f"| {label} | " + " | ".join(cells) + " |")
+    if not rows:
+        return ""
+    header = "| Ratio | " + " | ".join(f"FY{year}" for year in periods) + " |"
+    separator = "|---" * (len(periods) + 1) + "|"
+    return "\n".join([header, separator] + rows)
+
+
+def ratio_table_from_text(text):
+    statements = extract_statements(text)
+    if not len(statements["periods"]):
+        return ""
+    return format_ratio_table(statements, compute_ratios(statements))
+
+
+# ----------------- Per-index ratio tables ----------------
+# Ratio tables computed at ingest; dropped together with their vector index
+_ratio_tables = weakref.WeakKeyDictionary()
+
+
+def register_ratio_table(index, table):
+    _ratio_tables[index] = table
+
+
+def get_ratio_table(index):
+    """Ratio table for a vector index, computed from its docstore if it was not registered at ingest."""
+    table = _ratio_tables.get(index)
+    if table is None:
+        nodes = index.docstore.docs.values()
+        table = ratio_table_from_text("\n\n".join(node.get_content() for node in nodes))
+        register_ratio_table(index, table)
+    return table
+
+
+def is_ratio_question(question):
+    return bool(RATIO_QUESTION.search(question))
@@ -0,0 +1,238 @@
+import re
+
+# ----------------- Line items matched in statement tables ----------------
+# Labels are matched against the start of the first cell, most specific first
+LINE_ITEMS = {
+    "revenue": [
+        r"total net sales", r"net sales", r"total net revenues?", r"net revenues?",
+        r"total revenues?", r"revenues?",
+    ],
+    "net_profit": [
+        r"net income attributable to [\w\s.,&]+", r"net income", r"net earnings", r"net profit",
+    ],
+    "eps": [r"diluted"],
+    "assets": [r"total assets"],
+}
+
+# Words in a table that mark the table an EPS "Diluted" row belongs to
+EPS_CONTEXT = ("per share", "earnings per share", "eps")
+
+# Statement titles above (or in the header of) a table; MD&A summaries match none
+STATEMENT_TITLES = {
+    "income": re.compile(r"statements? of (consolidated )?(comprehensive )?(operations|income|earnings)"
+                         r"|income statements?", re.I),
+    "balance": re.compile(r"balance sheets?|statements? of financial position", re.I),
+    "cash_flow": re.compile(r"statements? of (consolidated )?cash flows?|cash flows? statements?", re.I),
+}
+
+YEAR = re.compile(r"\b(19|20)\d{2}\b")
+DASH = re.compile(r"^\$?\s*[—–-]+$")
+NUMBER = re.compile(r"^\(?-?\$?\s*\(?-?\d[\d,]*(\.\d+)?\)?\s*%?\)?$")
+SCALE_PATTERNS = [
+    (re.compile(r"in thousands", re.I), 0.001),
+    (re.compile(r"in billions", re.I), 1000.0),
+]
+
+
+# ----------------- Markdown table parsing ----------------
+def parse_number(cell):
+    """Parse '$ 1,234.5', '(1,234)' or '12.3%' into a float; None for anything else."""
+    text = cell.strip().replace("—", "").replace("–", "")
+    if not text or not NUMBER.match(text):
+        return None
+    negative = "(" in text and ")" in text
+    value = float(re.sub(r"[^\d.\-]", "", text))
+    return -abs(value) if negative else value
+
+
+def iter_markdown_tables(text):
+    """
+    Yield (rows, preceding_text) for every markdown table in text.
+    rows is a list of cell lists with the |---| separator rows dropped.
+    """
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        if not lines[i].lstrip().startswith("|"):
+            i += 1
+            continue
+        start = i
+        while i < len(lines) and lines[i].lstrip().startswith("|"):
+            i += 1
+        rows = []
+        for line in lines[start:i]:
+            cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+            if all(re.fullmatch(r":?-{2,}:?", cell) or not cell for cell in cells):
+                continue
+            rows.append(cells)
+        if rows:
+            yield rows, "\n".join(lines[max(0, start - 5):start])
+
+
+def _cell_value(cell):
+    """A cell's number, None for a dash placeholder, or False for anything else (labels, '$', percentages)."""
+    text = cell.strip()
+    if DASH.match(text):
+        return None
+    if text.endswith("%") or text.endswith("%)"):
+        return False  # percent-change columns of MD&A tables
+    value = parse_number(text)
+    return False if value is None else value
+
+
+def row_values(cells):
+    """Numeric values of a row, in column order, skipping the label, lone '$' cells and percentages."""
+    return [value for value in map(_cell_value, cells[1:]) if value not in (None, False)]
+
+
+def header_columns(rows):
+    """(column, year) of the year headers in the first header row that has at least two, in column order."""
+    for cells in rows[:3]:
+        columns = []
+        for col, cell in enumerate(cells):
+            match = YEAR.search(cell)
+            # Spanned headers repeat the year over their columns; keep the first
+            if match and (not columns or columns[-1][1] != int(match.group(0))):
+                columns.append((col, int(match.group(0))))
+        if len(columns) >= 2:
+            return columns, len(cells)
+    return [], 0
+
+
+def header_years(rows):
+    """Years found in the header rows, in column order."""
+    return [year for _, year in header_columns(rows)[0]]
+
+
+def row_by_year(cells, rows):
+    """
+    {year: value} for a table row, each value taken from its year's header column
+    (up to the next year's), so '$', percent-change and blank columns are skipped.
+    Dash placeholders give None. Rows whose width differs from the header's are
+    matched in order, one value or dash per year.
+    """
+    columns, width = header_columns(rows)
+    if not columns:
+        return {}
+    values = [_cell_value(cell) for cell in cells]
+    if len(cells) == width:
+        by_year = {}
+        bounds = [col for col, _ in columns[1:]] + [width]
+        for (start, year), end in zip(columns, bounds):
+            found = [value for value in values[max(start, 1):end] if value is not False]
+            by_year[year] = found[0] if found else None
+        return by_year
+    found = [value for value in values[1:] if value is not False]
+    return dict(zip((year for _, year in columns), found))
+
+
+def statement_kind(rows, preceding_text):
+    """"income", "balance" or "cash_flow" for a financial statement table, None for any other (MD&A, segments)."""
+    title = preceding_text + " " + " ".join(rows[0])
+    for kind, pattern in STATEMENT_TITLES.items():
+        if pattern.search(title):
+            return kind
+    # Untitled: percent-change columns mark an MD&A summary, labels tell statements apart
+    if any(cell.strip().endswith(("%", "%)")) for cells in rows for cell in cells[1:]):
+        return None
+    labels = [re.sub(r"\s+", " ", cells[0].lower()) for cells in rows if cells]
+    if any("operating activities" in label for label in labels):
+        return "cash_flow"
+    if any(label.startswith(("total assets", "total liabilities")) for label in labels):
+        return "balance"
+    if any(match_label(label, LINE_ITEMS["revenue"]) for label in labels) and \
+            any(match_label(label, LINE_ITEMS["net_profit"]) for label in labels):
+        return "income"
+    return None
+
+
+def table_scale(rows, preceding_text):
+    """Factor converting the table's reported units into millions."""
+    context = preceding_text + " " + " ".join(" ".join(cells) for cells in rows[:2])
+    for pattern, factor in SCALE_PATTERNS:
+        if pattern.search(context):
+            return factor
+    return 1.0
+
+
+# ----------------- Metric extraction ----------------
+def match_label(label, patterns):
+    label = re.sub(r"[^a-z0-9 ,.&]", " ", label.lower())
+    label = re.sub(r"\s+", " ", label).strip()
+    return any(re.match(pattern + r"\b", label) for pattern in patterns)
+
+
+def find_line_item(tables, field):
+    """
+    Return (values, years, scale) for the first row matching a line item, where
+    values are aligned to their header years, most recent first (None where not
+    reported). Statement tables are tried before others (MD&A summaries), each in
+    document order.
+    """
+    patterns = LINE_ITEMS[field]
+    ordered = sorted(tables, key=lambda table: statement_kind(*table) is None)
+    for rows, preceding_text in ordered:
+        if field == "eps":
+            table_text = (preceding_text + " " + " ".join(" ".join(cells) for cells in rows)).lower()
+            if not any(word in table_text for word in EPS_CONTEXT):
+                continue
+        for cells in rows:
+            if not cells or not match_label(cells[0], patterns):
+                continue
+            if field != "eps" and "per share" in cells[0].lower():
+                continue
+            by_year = row_by_year(cells, rows)
+            years = sorted(by_year, reverse=True)
+            values = [by_year[year] for year in years]
+            # Share counts also appear on "Diluted" rows; per-share amounts are small
+            if values[:1] == [None] or not values or (field == "eps" and abs(values[0]) >= 1000):
+                continue
+            scale = 1.0 if field == "eps" else table_scale(rows, preceding_text)
+            return values, years, scale
+    return None
+
+
+def extract_metrics_from_text(text):
+    """
+    Fill the dashboard metrics schema from statement tables in markdown text.
+    Returns (metrics, missing_fields); fields that could not be resolved are None.
+    """
+    tables = list(iter_markdown_tables(text))
+    metrics = {
+        "fiscal_year": None,
+        "assets": None,
+        "revenue": None,
+        "net_profit": None,
+        "profit_margin": None,
+        "eps": None,
+    }
+
+    for field in ("revenue", "net_profit", "eps", "assets"):
+        found = find_line_item(tables, field)
+        if not found:
+            continue
+        values, years, scale = found
+        values = [None if value is None else round(value * scale, 2) for value in values]
+        if field == "assets":
+            metrics["assets"] = values[0]
+        elif len(values) >= 2 and values[1] is not None:
+            metrics[field] = {"current": values[0], "previous": values[1]}
+        if years and metrics["fiscal_year"] is None:
+            metrics["fiscal_year"] = str(years[0])
+
+    revenue, net_profit = metrics["revenue"], metrics["net_profit"]
+    if revenue and net_profit and revenue["current"] and revenue["previous"]:
+        metrics["profit_margin"] = {
+            "current": round(net_profit["current"] / revenue["current"] * 100, 2),
+            "previous": round(net_profit["previous"] / revenue["previous"] * 100, 2),
+        }
+
+    missing = [field for field, value in metrics.items() if value is None]
+    return metrics, missing
+
+
+def extract_metrics_from_index(index):
+    """Run the table extractor over every node of an index, in document order."""
+    nodes = index.docstore.docs.values()
+    full_text = "\n\n".join(node.text for node in nodes)
+    return extract_metrics_from_text(full_text)
@@ -0,0 +1,106 @@
+import os
+import re
+from llama_index.core import Document
+
+from backend.docling_shards import (
+    DOCLING_WORKERS, PAGE_EMBED_EXCLUDED_KEYS, PAGES_PER_SHARD, build_pdf_converter, convert_page_range,
+    convert_pdf_parallel,
+)
+from backend.progress import report
+from backend.tracing import current_span
+
+# A page needs Docling's table model once it has this many numeric table-like rows
+MIN_TABLE_ROWS = 3
+
+NUMBER_TOKEN = re.compile(r"^\(?\$?\(?-?\d[\d,]*(\.\d+)?\)?%?\)?$")
+
+
+# ----------------- Page classification ----------------
+def page_has_table(page, min_rows=MIN_TABLE_ROWS):
+    """
+    Cheap table detector on PyMuPDF word boxes.
+    PyMuPDF emits each table cell on its own line, so words are regrouped into
+    visual rows by their vertical position. A row with a label followed by at
+    least two separate numeric cells ("Net income   200   (150)") counts as a table row.
+    """
+    rows = {}
+    for x0, y0, x1, y1, word, *_ in page.get_text("words"):
+        rows.setdefault(round((y0 + y1) / 2 / 3), []).append((x0, word))
+
+    table_rows = 0
+    for words in rows.values():
+        numeric_x = {round(x0) for x0, word in words if NUMBER_TOKEN.match(word) and word not in ("$", "%")}
+        if len(numeric_x) >= 2:
+            table_rows += 1
+            if table_rows >= min_rows:
+                return True
+    return False
+
+
+def classify_pages(pdf_file):
+    """Return ({page_no: plain text}, [table page numbers]) with 1-based page numbers."""
+    import pymupdf
+
+    texts = {}
+    table_pages = []
+    with pymupdf.open(pdf_file) as doc:
+        for page_no, page in enumerate(doc, start=1):
+            if page_has_table(page):
+                table_pages.append(page_no)
+            else:
+                texts[page_no] = page.get_text().strip()
+    return texts, table_pages
+
+
+def group_page_runs(page_numbers, max_run=PAGES_PER_SHARD):
+    """Group sorted page numbers into contiguous (start, end) ranges of at most max_run pages."""
+    runs = []
+    for page_no in page_numbers:
+        if runs and page_no == runs[-1][1] + 1 and page_no - runs[-1][0] < max_run:
+            runs[-1] = (runs[-1][0], page_no)
+        else:
+            runs.append((page_no, page_no))
+    return runs
+
+
+# ----------------- Hybrid conversion ----------------
+def convert_pdf_hybrid(pdf_file, workers=DOCLING_WORKERS):
+    """
+    Route each page to the cheapest extractor that preserves it:
+    PyMuPDF text for narrative pages, Docling table structure only for table pages.
+    Returns a list of (page_no, markdown, parser) in page order.
+    """
+    texts, table_pages = classify_pages(pdf_file)
+    current_span().set(docling_pages=len(table_pages), pymupdf_pages=len(texts))
+    # Narrative pages are done once classified; table pages count as their runs convert
+    report("parse", done=len(texts), total=len(texts) + len(table_pages))
+
+    runs = group_page_runs(table_pages)
+    if workers > 1 and len(runs) > 1:
+        table_markdown = convert_pdf_parallel(pdf_file, workers=workers, shards=runs)
+    else:
+        converter = build_pdf_converter() if runs else None
+        table_markdown = []
+        for run in runs:
+            table_markdown += convert_page_range(pdf_file, run, converter)
+            report("parse", advance=run[1] - run[0] + 1)
+
+    pages = [(page_no, text, "pymupdf") for page_no, text in texts.items()]
+    pages += [(page_no, markdown, "docling") for page_no, markdown in table_markdown]
+    pages.sort(key=lambda item: item[0])
+    return pages
+
+
+def load_documents_hybrid(pdf_file, workers=DOCLING_WORKERS):
+    """One Document per page, in page order, with page number and parser as metadata."""
+    file_name = os.path.basename(str(pdf_file))
+    return [
+        Document(
+            text=markdown,
+            metadata={"page_label": str(page_no), "file_name": file_name, "parser": parser},
+            excluded_embed_metadata_keys=PAGE_EMBED_EXCLUDED_KEYS + ["parser"],
+            excluded_llm_metadata_keys=["parser"],
+        )
+        for page_no, markdown, parser in convert_pdf_hybrid(pdf_file, workers)
+        if markdown.strip()
+    ]
@@ -0,0 +1,211 @@
+import json
+import math
+import os
+import re
+import weakref
+from collections import Counter, defaultdict
+from typing import List
+import numpy as np
+from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.utils import build_metadata_filter_fn
+
+from backend.tracing import span
+
+BM25_FNAME = "bm25.json"
+# Standard BM25 parameters and the reciprocal-rank-fusion constant
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+# Each retriever contributes this many candidates per final result
+CANDIDATE_MULTIPLIER = 3
+
+STOPWORDS = set("""
+a an and are as at be by did do does for from had has have how i in is it its of on or
+that the this to was were what when where which who why will with you your
+""".split())
+TOKEN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+# ----------------- BM25 inverted index ----------------
+class BM25Index:
+    """Inverted index over node texts with vectorized BM25 scoring."""
+
+    def __init__(self, node_ids, doc_lengths, postings):
+        self.node_ids = list(node_ids)
+        self.rows = {node_id: row for row, node_id in enumerate(self.node_ids)}
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        # term -> (node positions, term frequencies)
+        self.postings = {
+            term: (np.asarray(rows, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (rows, tfs) in postings.items()
+        }
+        n = len(self.node_ids)
+        self.idf = {
+            term: math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            for term, (rows, _) in self.postings.items()
+        }
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        postings = defaultdict(lambda: ([], []))
+        node_ids, doc_lengths = [], []
+        for row, node in enumerate(nodes):
+            tokens = tokenize(node.get_content())
+            node_ids.append(node.node_id)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(row)
+                postings[term][1].append(tf)
+        return cls(node_ids, doc_lengths, postings)
+
+    def search(self, query, top_k, rows=None):
+        """Return [(node_id, score)] for the top_k nodes, best first; rows restricts the candidates."""
+        if not self.node_ids:
+            return []
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1.0))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            term_rows, tfs = self.postings[term]
+            scores[term_rows] += self.idf[term] * tfs * (BM25_K1 + 1) / (tfs + norm[term_rows])
+        if rows is not None:
+            allowed = np.zeros(len(self.node_ids), dtype=bool)
+            allowed[rows] = True
+            scores[~allowed] = 0
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.node_ids[row], float(scores[row])) for row in top]
+
+    def persist(self, persist_dir):
+        with open(os.path.join(persist_dir, BM25_FNAME), "w", encoding="utf-8") as f:
+            json.dump({
+                "node_ids": self.node_ids,
+                "doc_lengths": self.doc_lengths.tolist(),
+                "postings": {term: [rows.tolist(), tfs.tolist()] for term, (rows, tfs) in self.postings.items()},
+            }, f)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        path = os.path.join(persist_dir, BM25_FNAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["node_ids"], data["doc_lengths"], data["postings"])
+
+
+# BM25 indexes built at ingest; dropped together with their vector index
+_bm25_indexes = weakref.WeakKeyDictionary()
+
+
+def register_bm25(index, bm25):
+    _bm25_indexes[index] = bm25
+
+
+def get_bm25(index):
+    """BM25 index for a vector index, built from its docstore if it was not registered at ingest."""
+    bm25 = _bm25_indexes.get(index)
+    if bm25 is None:
+        bm25 = BM25Index.from_nodes(list(index.docstore.docs.values()))
+        register_bm25(index, bm25)
+    return bm25
+
+
+# ----------------- Fusion retrieval ----------------
+class FusionRetriever(BaseRetriever):
+    """
+    Reciprocal-rank fusion of dense vector retrieval and BM25 keyword retrieval.
+    Metadata filters restrict both retrievers to the matching nodes.
+
+    The index is held by weak reference, and the vector retriever built once here holds
+    a weak proxy of it, so cached engines (backend.engine_pool) do not keep their index alive.
+    """
+
+    def __init__(self, index, similarity_top_k=5, filters=None, **kwargs):
+        super().__init__(**kwargs)
+        self._index_ref = weakref.ref(index)
+        self._top_k = similarity_top_k
+        self._candidates = similarity_top_k * CANDIDATE_MULTIPLIER
+        # What index.as_retriever builds, minus its strong reference to the index
+        self._vector = VectorIndexRetriever(
+            weakref.proxy(index),
+            similarity_top_k=self._candidates,
+            filters=filters,
+            node_ids=list(index.index_struct.nodes_dict.values()),
+            callback_manager=index._callback_manager,
+            object_map=index._object_map,
+        )
+        self._bm25 = get_bm25(index)
+        self._bm25_rows = None
+        if filters is not None:
+            nodes = index.docstore.docs
+            filter_fn = build_metadata_filter_fn(lambda node_id: nodes[node_id].metadata, filters)
+            self._bm25_rows = np.fromiter(
+                (row for node_id, row in self._bm25.rows.items() if node_id in nodes and filter_fn(node_id)),
+                dtype=np.int64)
+
+    @property
+    def _index(self):
+        index = self._index_ref()
+        if index is None:
+            raise ReferenceError("The index of this retriever was dropped")
+        return index
+
+    def _fuse(self, vector_results, query_bundle):
+        keyword_query = " ".join(query_bundle.embedding_strs)
+        keyword_results = self._bm25.search(keyword_query, self._candidates, rows=self._bm25_rows)
+
+        fused = defaultdict(float)
+        nodes = {}
+        for rank, result in enumerate(vector_results):
+            fused[result.node.node_id] += 1.0 / (RRF_K + rank + 1)
+            nodes[result.node.node_id] = result.node
+        for rank, (node_id, _) in enumerate(keyword_results):
+            fused[node_id] += 1.0 / (RRF_K + rank + 1)
+
+        missing = [node_id for node_id in fused if node_id not in nodes]
+        for node in self._index.docstore.get_nodes(missing, raise_error=False):
+            nodes[node.node_id] = node
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        return [NodeWithScore(node=nodes[node_id], score=score)
+                for node_id, score in ranked if node_id in nodes][:self._top_k]
+
+    def _traced_fuse(self, active, vector_results, query_bundle):
+        results = self._fuse(vector_results, query_bundle)
+        active.set(node_ids=[result.node.node_id for result in results],
+                   scores=[round(result.score, 5) for result in results])
+        return results
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with span("retrieve", top_k=self._top_k, filtered=self._bm25_rows is not None) as active:
+            return self._traced_fuse(active, self._vector.retrieve(query_bundle), query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with span("retrieve", top_k=self._top_k, filtered=self._bm25_rows is not None) as active:
+            return self._traced_fuse(active, await self._vector.aretrieve(query_bundle), query_bundle)
+
+
+def build_query_engine(index, llm, similarity_top_k, response_mode, streaming=False, filters=None, **kwargs):
+    """Query engine over the fused BM25 + vector retriever."""
+    return RetrieverQueryEngine.from_args(
+        retriever=FusionRetriever(index, similarity_top_k=similarity_top_k, filters=filters),
+        llm=llm,
+        response_mode=response_mode,
+        streaming=streaming,
+        **kwargs,
+    )
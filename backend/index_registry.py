@@ -0,0 +1,185 @@
+import os
+import threading
+from collections import deque
+import time
+import weakref
+
+from backend.cache import load_cached_analysis
+from backend.engine_pool import clear_engines
+from backend.model_docling import PIPELINE_CONFIG
+from backend.tracing import span
+
+# Resident size of unused indexes kept loaded before the least recently used are dropped
+INDEX_MEMORY_BYTES = int(os.getenv("FSA_INDEX_MEMORY_BYTES", 1024 ** 3))
+
+
+def index_bytes(index):
+    """Approximate memory held by an index: its vector matrix plus node text."""
+    vector_store = index.vector_store
+    total = 0
+    for name in ("_matrix", "_scales"):
+        array = getattr(vector_store, name, None)
+        if array is not None:
+            total += array.nbytes
+    return total + sum(len(node.get_content()) for node in index.docstore.docs.values())
+
+
+# ----------------- Leases ----------------
+class IndexLease:
+    """
+    A session's handle on a shared index. The registry counts live leases per document;
+    a lease is returned by release(), or automatically once nothing references it
+    (e.g. when Streamlit drops a closed session's state).
+    """
+
+    def __init__(self, registry, doc_hash, entry):
+        self.doc_hash = doc_hash
+        self.index = entry.index
+        self.dashboard = entry.dashboard
+        self._registry = registry
+        self._entry = entry
+        self._finalizer = weakref.finalize(self, registry._release, entry)
+
+    def clone(self):
+        """Another lease on the same index, released independently (e.g. one held by a FilingCorpus)."""
+        return self._registry._lease_again(self.doc_hash, self._entry)
+
+    def release(self):
+        self._finalizer()
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+
+class _Entry:
+    def __init__(self, index, dashboard):
+        self.index = index
+        self.dashboard = dashboard
+        self.size_bytes = index_bytes(index)
+        self.leases = 0
+        self.last_used = time.time()
+
+
+# ----------------- Registry ----------------
+class IndexRegistry:
+    """
+    Process-wide, read-only indexes keyed by document hash. Every session opening the
+    same filing gets the same index object, loaded once from the on-disk cache; its
+    vectors are memory-mapped, so the OS keeps a single physical copy shared by every
+    session here and by every other process (Streamlit workers, batch ingest) that maps
+    the same cache entry.
+
+    Indexes handed out must not be modified. Entries nobody holds a lease on are kept
+    while they fit in max_bytes, least recently used first out.
+    """
+
+    def __init__(self, max_bytes=INDEX_MEMORY_BYTES, config=PIPELINE_CONFIG):
+        self.max_bytes = max_bytes
+        self.config = config
+        self._entries = {}
+        self._loading = {}  # doc_hash -> lock, so concurrent sessions load a document once
+        self._released = deque()  # entries of released leases, applied under the lock
+        self._lock = threading.Lock()
+
+    def acquire(self, doc_hash):
+        """Lease the shared index for a document; returns None if it is not in the cache."""
+        entry = self._get(doc_hash)
+        if entry is None:
+            with self._lock:
+                load_lock = self._loading.setdefault(doc_hash, threading.Lock())
+            with load_lock:
+                # Another session may have loaded it while this one waited
+                entry = self._get(doc_hash) or self._load(doc_hash)
+            if entry is None:
+                return None
+        return IndexLease(self, doc_hash, entry)
+
+    def _get(self, doc_hash):
+        """The resident entry with one more lease taken, or None."""
+        with self._lock:
+            self._apply_releases()
+            entry = self._entries.get(doc_hash)
+            if entry is not None:
+                entry.leases += 1
+                entry.last_used = time.time()
+            return entry
+
+    def _load(self, doc_hash):
+        try:
+            with span("index_cache") as cache_span:
+                index, dashboard = load_cached_analysis(doc_hash, self.config)
+                cache_span.set(cache_hit=index is not None)
+        finally:
+            with self._lock:
+                self._loading.pop(doc_hash, None)
+        if index is None:
+            return None
+        entry = _Entry(index, dashboard)
+        entry.leases = 1
+        with self._lock:
+            self._entries[doc_hash] = entry
+            self._apply_releases()
+            self._evict()
+        return entry
+
+    def _lease_again(self, doc_hash, entry):
+        with self._lock:
+            self._apply_releases()
+            entry.leases += 1
+            entry.last_used = time.time()
+        return IndexLease(self, doc_hash, entry)
+
+    def _release(self, entry):
+        # Lease finalizers run during garbage collection, on any thread and possibly while
+        # that thread holds the lock: only queue the release, and apply it if the lock is free
+        self._released.append(entry)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._apply_releases()
+            finally:
+                self._lock.release()
+
+    def _apply_releases(self):
+        """Count queued lease releases and evict what they freed; called with the lock held."""
+        if not self._released:
+            return
+        while self._released:
+            entry = self._released.popleft()
+            entry.leases = max(0, entry.leases - 1)
+            entry.last_used = time.time()
+        self._evict()
+
+    def _evict(self):
+        """Drop unleased entries, least recently used first, until the registry fits its budget."""
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        idle = sorted((item for item in self._entries.items() if not item[1].leases),
+                      key=lambda item: item[1].last_used)
+        for doc_hash, entry in idle:
+            if total <= self.max_bytes:
+                break
+            del self._entries[doc_hash]
+            clear_engines(entry.index)
+            total -= entry.size_bytes
+
+    def evict(self, doc_hash):
+        """Forget a document (e.g. after its cache entry was rebuilt); current leases keep their index."""
+        with self._lock:
+            self._apply_releases()
+            entry = self._entries.pop(doc_hash, None)
+        if entry is not None:
+            clear_engines(entry.index)
+
+    def stats(self):
+        with self._lock:
+            self._apply_releases()
+            return {
+                "indexes": len(self._entries),
+                "leases": sum(entry.leases for entry in self._entries.values()),
+                "bytes": sum(entry.size_bytes for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared by every Streamlit session in this process
+index_registry = IndexRegistry()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.cache import save_analysis
+from backend.index_registry import index_registry
+from backend.model_docling import PIPELINE_CONFIG
+from backend.progress import Cancelled, track
+from backend.registry import get_parser
+from backend.tracing import span
+from backend.utils import extract_dashboard_async
+
+# Documents processed at once in this process; later uploads wait in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs stay visible this long, so every session sharing one picks up its result
+JOB_TTL_S = 600
+# Stages shown to the user, in order
+STAGES = ["parse", "chunk", "embed", "dashboard"]
+ACTIVE = ("queued", "running")
+
+
+# ----------------- Jobs ----------------
+class Job:
+    """
+    One unit of background work and its per-stage progress. Sessions waiting on the
+    job are tracked so it is only cancelled when none of them wants it any more.
+    """
+
+    def __init__(self, key, name=None):
+        self.key = key
+        self.name = name or key[:12]
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.stage = None
+        self.stages = {stage: {"done": 0, "total": None} for stage in STAGES}
+        self.sections = {}  # dashboard sections, filled in as each one finishes
+        self.result = None
+        self.error = None
+        self.sessions = set()
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, stage, done=None, total=None, advance=0):
+        """Progress callback (see backend.progress); raises Cancelled once the job is cancelled."""
+        if self._cancel.is_set():
+            raise Cancelled(f"Job {self.name} was cancelled")
+        with self._lock:
+            progress = self.stages.setdefault(stage, {"done": 0, "total": None})
+            if total is not None:
+                progress["total"] = total
+            if done is not None:
+                progress["done"] = done
+            progress["done"] += advance
+            self.stage = stage
+
+    def set_section(self, section, value):
+        with self._lock:
+            self.sections[section] = value
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def snapshot(self):
+        """Consistent copy of the job's state for rendering."""
+        with self._lock:
+            return {
+                "key": self.key,
+                "name": self.name,
+                "status": self.status,
+                "stage": self.stage,
+                "stages": {stage: dict(progress) for stage, progress in self.stages.items()},
+                "sections": dict(self.sections),
+                "error": self.error,
+                "seconds": (self.finished or time.time()) - self.created,
+            }
+
+
+class JobQueue:
+    """
+    Process-wide queue of background jobs on a bounded thread pool. Jobs are keyed
+    (e.g. by document hash): submitting a key that is queued, running or recently
+    finished joins the existing job instead of starting another.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="fsa-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, session=None, name=None):
+        """Run fn(job, *args) in the background, or join the live job with the same key."""
+        with self._lock:
+            self._sweep()
+            job = self._jobs.get(key)
+            if job is None or job.status in ("failed", "cancelled"):
+                job = self._jobs[key] = Job(key, name)
+                job.future = self._pool.submit(self._run, job, fn, args)
+            if session is not None:
+                job.sessions.add(session)
+            return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def cancel(self, key, session=None):
+        """
+        Stop waiting on a job. It is cancelled once no session waits on it any more
+        (or right away when no session is given); running work stops at its next
+        progress checkpoint.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.status not in ACTIVE:
+                return job
+            job.sessions.discard(session)
+            if session is None or not job.sessions:
+                job._cancel.set()
+                if job.future.cancel():  # never started
+                    job.status, job.finished = "cancelled", time.time()
+            return job
+
+    def position(self, key):
+        """Number of queued jobs ahead of this one (0 once it runs)."""
+        with self._lock:
+            queued = sorted((job for job in self._jobs.values() if job.status == "queued"),
+                            key=lambda job: job.created)
+            keys = [job.key for job in queued]
+        return keys.index(key) if key in keys else 0
+
+    def _run(self, job, fn, args):
+        if job.cancel_requested:
+            job.status, job.finished = "cancelled", time.time()
+            return
+        job.status = "running"
+        try:
+            with track(job), span("job", job=job.name):
+                job.result = fn(job, *args)
+            job.status = "done"
+        except Cancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    def _sweep(self):
+        now = time.time()
+        for key in [key for key, job in self._jobs.items()
+                    if job.finished and now - job.finished > JOB_TTL_S]:
+            del self._jobs[key]
+
+
+# Shared by every Streamlit session in this process
+job_queue = JobQueue()
+
+
+# ----------------- Document processing ----------------
+def process_document(job, file_bytes, doc_hash):
+    """
+    Parse, index and extract the dashboard of an uploaded PDF, then cache both.
+    Returns a lease on the shared, memory-mapped copy of the cached index (see
+    backend.index_registry); the in-memory index built here is dropped.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+        temp_file.write(file_bytes)
+        temp_file_path = temp_file.name
+    try:
+        index = get_parser("docling")(temp_file_path)
+    finally:
+        os.remove(temp_file_path)
+
+    dashboard = asyncio.run(extract_dashboard_async(index, on_result=job.set_section))
+    save_analysis(doc_hash, PIPELINE_CONFIG, index, dashboard)
+    index_registry.evict(doc_hash)
+    lease = index_registry.acquire(doc_hash)
+    if lease is None:
+        raise RuntimeError("The analysis could not be read back from the index cache")
+    return lease
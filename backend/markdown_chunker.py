@@ -0,0 +1,223 @@
+import os
+import re
+from typing import Any, List, Sequence
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode, TextNode
+from llama_index.core.utils import get_tqdm_iterable
+
+from backend.context_packer import SENTENCE_END, count_tokens
+
+# Most tokens of text in one node (4 retrieved nodes stay well inside a 4096 token window)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "512"))
+
+# A one-line paragraph right before a table ("BALANCE SHEETS (In millions)") stays with it
+CAPTION_TOKENS = 48
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*)")
+TABLE_SEPARATOR = re.compile(r"^\s*\|?(\s*:?-{2,}:?\s*\|)+\s*:?-*:?\s*$")
+BLOCK_SEPARATOR = "\n\n"
+
+
+# ----------------- Markdown blocks ----------------
+def iter_blocks(text):
+    """
+    Yield ("heading", line), ("table", [row lines]) or ("text", paragraph) for the
+    markdown in text, in order. Fenced code is one text block.
+    """
+    lines = text.split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.lstrip()
+        if not stripped:
+            i += 1
+        elif stripped.startswith("```"):
+            end = i + 1
+            while end < len(lines) and not lines[end].lstrip().startswith("```"):
+                end += 1
+            yield "text", "\n".join(lines[i:end + 1])
+            i = end + 1
+        elif HEADING.match(line):
+            yield "heading", line.strip()
+            i += 1
+        elif stripped.startswith("|"):
+            end = i
+            while end < len(lines) and lines[end].lstrip().startswith("|"):
+                end += 1
+            yield "table", lines[i:end]
+            i = end
+        else:
+            end = i
+            while end < len(lines) and lines[end].strip() and not HEADING.match(lines[end]) \
+                    and not lines[end].lstrip().startswith(("|", "```")):
+                end += 1
+            yield "text", "\n".join(lines[i:end])
+            i = end
+
+
+def split_text(text, budget):
+    """Split a paragraph into pieces under budget tokens, at sentence ends (words if a sentence is too long)."""
+    units = []
+    for sentence in SENTENCE_END.split(text):
+        if count_tokens(sentence) <= budget:
+            units.append(sentence)
+        else:
+            units.extend(sentence.split(" "))
+    pieces, current, tokens = [], [], 0
+    for unit in units:
+        unit_tokens = count_tokens(unit) + 1
+        if current and tokens + unit_tokens > budget:
+            pieces.append(" ".join(current))
+            current, tokens = [], 0
+        current.append(unit)
+        tokens += unit_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_table(rows, budget, caption=None):
+    """
+    Split table row lines into tables under budget tokens, never inside a row. Every
+    part repeats the caption and the header (with its |---| separator); a single row
+    over budget is kept whole as its own part.
+    """
+    header = rows[:2] if len(rows) > 1 and TABLE_SEPARATOR.match(rows[1]) else rows[:1]
+    rows = rows[len(header):]
+    if caption:
+        header = [caption, ""] + header
+    header_tokens = count_tokens("\n".join(header)) + 1
+    parts, current, tokens = [], [], header_tokens
+    for row in rows:
+        row_tokens = count_tokens(row) + 1
+        if current and tokens + row_tokens > budget:
+            parts.append("\n".join(header + current))
+            current, tokens = [], header_tokens
+        current.append(row)
+        tokens += row_tokens
+    if current or not parts:
+        parts.append("\n".join(header + current))
+    return parts
+
+
+# ----------------- Node parser ----------------
+class TableAwareMarkdownParser(NodeParser):
+    """
+    Markdown node parser with a token budget per node. Splits on headings like
+    MarkdownNodeParser, then packs paragraphs and tables into nodes of at most
+    chunk_tokens tokens: long paragraphs are split at sentence ends, and long tables
+    between rows, with the table header repeated on every continuation node.
+
+    Each node gets a section_path ("Item 7. MD&A > Liquidity") and keeps its page's
+    metadata (page_label). Pages of one file are parsed in order, so a section that
+    starts on one page carries over to the next.
+    """
+
+    chunk_tokens: int = Field(default=CHUNK_TOKENS, description="Most tokens of text in one node.")
+    header_path_separator: str = Field(default=" > ", description="Separator between section headings.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TableAwareMarkdownParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        all_nodes: List[BaseNode] = []
+        header_stack, pending = [], []
+        source, previous = None, None
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing nodes"):
+            file_name = node.metadata.get("file_name")
+            if file_name != source:
+                # Headings left at the end of the last file's final page
+                all_nodes.extend(self._build_nodes(self._pending_split(pending, header_stack), previous))
+                header_stack, pending, source = [], [], file_name
+            all_nodes.extend(self.get_nodes_from_node(node, header_stack, pending))
+            previous = node
+        all_nodes.extend(self._build_nodes(self._pending_split(pending, header_stack), previous))
+        return all_nodes
+
+    def get_nodes_from_node(self, node: BaseNode, header_stack=None, pending=None) -> List[TextNode]:
+        """
+        Split one document; header_stack holds the (level, heading) path and is updated in place.
+        Headings ending the document are moved into pending, when given, to open the next
+        document's first node (pages of one file); otherwise they become a node of their own.
+        """
+        header_stack = [] if header_stack is None else header_stack
+        splits = []  # (text, section path)
+        # Pieces of the node being built, starting with headings carried over; headings alone do not make a node
+        current = list(pending or [])
+        tokens, content = sum(count_tokens(heading) + 1 for heading in current), 0
+        caption = None  # (text, tokens) of a last piece that may caption a table
+
+        def flush():
+            nonlocal current, tokens, content
+            if content:
+                splits.append((BLOCK_SEPARATOR.join(current), self._section_path(header_stack)))
+                current, tokens, content = [], 0, 0
+
+        def add(piece, piece_tokens):
+            nonlocal tokens, content
+            if content and tokens + piece_tokens > self.chunk_tokens:
+                flush()
+            current.append(piece)
+            tokens += piece_tokens
+            content += 1
+
+        text = node.get_content(metadata_mode=MetadataMode.NONE)
+        for kind, block in iter_blocks(text):
+            if kind == "heading":
+                caption = None
+                flush()
+                level, title = HEADING.match(block).groups()
+                while header_stack and header_stack[-1][0] >= len(level):
+                    header_stack.pop()
+                header_stack.append((len(level), title.strip()))
+                # Headings open the next node (several in a row stay together)
+                current.append(block)
+                tokens += count_tokens(block) + 1
+                continue
+
+            title = None
+            if kind == "table" and caption and current and current[-1] is caption[0]:
+                # Move the caption down into the table, so it goes wherever the table goes
+                title = current.pop()
+                tokens -= caption[1]
+                content -= 1
+            caption = None
+            block_text = (title + BLOCK_SEPARATOR if title else "") + "\n".join(block) if kind == "table" else block
+            block_tokens = count_tokens(block_text) + 1
+            if content and tokens + block_tokens > self.chunk_tokens:
+                flush()
+            if tokens + block_tokens <= self.chunk_tokens:
+                # Whole paragraphs and tables stay in one node when they fit in one
+                add(block_text, block_tokens)
+                if kind == "text" and "\n" not in block and block_tokens <= CAPTION_TOKENS:
+                    caption = (block_text, block_tokens)
+                continue
+            room = max(self.chunk_tokens - tokens, 1)
+            parts = split_table(block, room, title) if kind == "table" else split_text(block, room)
+            for part in parts:
+                add(part, count_tokens(part) + 1)
+        flush()
+        if pending is None:
+            # Headings with nothing after them (e.g. a cover page) still become a node
+            return self._build_nodes(splits + self._pending_split(current, header_stack), node)
+        pending[:] = current
+        return self._build_nodes(splits, node)
+
+    def _pending_split(self, headings, header_stack):
+        return [(BLOCK_SEPARATOR.join(headings), self._section_path(header_stack))] if headings else []
+
+    def _build_nodes(self, splits, node):
+        if not splits:
+            return []
+        text_nodes = build_nodes_from_splits([split for split, _ in splits], node, id_func=self.id_func)
+        for text_node, (_, section_path) in zip(text_nodes, splits):
+            if self.include_metadata and section_path:
+                text_node.metadata["section_path"] = section_path
+        return text_nodes
+
+    def _section_path(self, header_stack):
+        return self.header_path_separator.join(title for _, title in header_stack)
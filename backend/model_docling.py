@@ -1,11 +1,21 @@
 from llama_index.core import VectorStoreIndex, Settings
-from llama_index.core.node_parser import MarkdownNodeParser
-from llama_index.readers.docling import DoclingReader
-from llama_index.llms.openrouter import OpenRouter
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding 
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-
+from llama_index.core.schema import QueryBundle
+from backend.docling_shards import DOCLING_WORKERS, build_pdf_converter, load_documents_parallel
+from backend.hybrid_ingest import load_documents_hybrid
+from backend.markdown_chunker import CHUNK_TOKENS, TableAwareMarkdownParser
+from backend.answer_cache import answer_cache
+from backend.hybrid_retrieval import BM25Index, register_bm25
+from backend.financial_ratios import get_ratio_table, is_ratio_question, ratio_table_from_text, register_ratio_table
+from backend.engine_pool import get_query_engine
+from backend.context_packer import PACKED_MODE
+from backend.model_router import ROUTED_MODEL, model_router, routing_hints
+from backend.registry import EMBED_MODEL, get_cached_embedding, get_llm
+from backend.numpy_vector_store import VECTOR_DIMENSIONS, VECTOR_QUANTIZATION, build_storage_context
+from backend.progress import report
+from backend.tracing import detach, span, start_span, traced_stream
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dotenv import load_dotenv
 import os
 import streamlit as st
@@ -15,69 +25,108 @@ load_dotenv()
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 os.environ["OPENROUTER_API_KEY"] = os.getenv("OPENROUTER_API_KEY")
 
-# Initialize both LLMs
-openrouter_llm = OpenRouter(
-    model="anthropic/claude-sonnet-4", 
-    api_key=os.getenv("OPENROUTER_API_KEY"))
-    
-openai_llm = OpenAI(
-    model="gpt-4o",  # or "gpt-3.5-turbo", "gpt-4-turbo", etc.
-    api_key=os.getenv("OPENAI_API_KEY"),
-    max_tokens=4096   # Optional: control response length
-)
-
-# Set default LLM to OpenRouter
-llm = openrouter_llm
-
-# Configure OpenAI Large Embedding Model
-openai_embedding = OpenAIEmbedding(
-    model="text-embedding-3-large",  
-    api_key=os.getenv("OPENAI_API_KEY"))
-
-# maximum input size to the LLM
+# "hybrid": Docling only on table pages, PyMuPDF text elsewhere; "docling": Docling on every page
+INGEST_MODE = os.getenv("INGEST_MODE", "hybrid")
+
+# LLM and embedding clients come from backend.registry and are only built on first
+# use (shared process-wide with the other pages and modules); OpenRouter is the default,
+# and role questions are routed per call by backend.model_router
+
+# Chunks passed to the LLM per question; BM25 + vector fusion keeps recall at a smaller top-k
+RETRIEVAL_TOP_K = 4
+# Ratio questions come with the precomputed ratio table, so fewer chunks are retrieved
+RATIO_TOP_K = 2
+# Retrievals started ahead of the answer-cache lookup
+_retrieval_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fsa-retrieve")
+
+# maximum input size to the LLM for the built-in response modes
+# (the packed mode used below sizes prompts from each model's real context window)
 Settings.context_window = 4096
 # number of tokens reserved for text generation.
 Settings.num_output = 1000
-Settings.embed_model = openai_embedding
-
-# ---------- Function to set the LLM based on the user's choice -----
-
-def set_llm(use_openAI=False):
-    return openai_llm if use_openAI else openrouter_llm
+# Reuse vectors of chunks already embedded (amended filings, repeated boilerplate)
+Settings.embed_model = get_cached_embedding()
+
+# Everything that changes the built index; cached indexes are keyed on this
+PIPELINE_CONFIG = {
+    "parser": "docling",
+    "do_ocr": False,
+    "do_table_structure": True,
+    "ingest_mode": INGEST_MODE,
+    "docling_mode": "sharded" if DOCLING_WORKERS > 1 else "single",
+    "chunker": "markdown_tables",
+    "chunk_tokens": CHUNK_TOKENS,
+    "embed_model": EMBED_MODEL,
+    "vector_store": "numpy",
+    "vector_quantization": VECTOR_QUANTIZATION,
+    "vector_dimensions": VECTOR_DIMENSIONS,
+    "version": 2,  # 2: file name and page number no longer embedded
+}
 
 # ----------------- PDF extraction using Docling ----------------
-def build_index_from_pdf_docling(pdf_file):
-    pipeline_options = PdfPipelineOptions()
-    pipeline_options.do_ocr = False  # Skip OCR for text-based PDFs
-    pipeline_options.do_table_structure = True  # Keep table detection
-
-    # Extract pdf information using Docling
-    reader = DoclingReader()
-    documents = reader.load_data(pdf_file)
-
-    # Node parsing (semantic chunking)
-    print(f"📄 Extracted {len(documents)} documents from {pdf_file}")
-    node_parser = MarkdownNodeParser()  
-    nodes = node_parser.get_nodes_from_documents(documents)
-    # show the first 5 nodes for debugging
-    print(f"🔍 Parsed {len(nodes)} nodes from documents.")
-    for i, node in enumerate(nodes[:5]):
-            print(f"\n--- Node {i+1} ---")
-            print(f"Text length: {len(node.text)} characters")
-            print(f"Text preview: {node.text}")
-            print("-" * 50)
-
-    # Indexing
-    index = VectorStoreIndex.from_documents(documents, transformations=[node_parser])
+def build_index_from_pdf_docling(pdf_file, workers=DOCLING_WORKERS, mode=INGEST_MODE):
+    with span("ingest", file=os.path.basename(str(pdf_file)), mode=mode, workers=workers) as ingest:
+        with span("parse", mode=mode) as parse:
+            if mode == "hybrid":
+                # Table pages through Docling, narrative pages through PyMuPDF
+                documents = load_documents_hybrid(pdf_file, workers=workers)
+            elif workers > 1:
+                # Convert page shards in a process pool, one Document per page
+                documents = load_documents_parallel(pdf_file, workers=workers)
+            else:
+                # Extract pdf information using Docling (OCR off, table detection on)
+                from llama_index.readers.docling import DoclingReader
+                reader = DoclingReader(doc_converter=build_pdf_converter())
+                documents = reader.load_data(pdf_file)
+            parse.set(documents=len(documents))
+
+        # Node parsing: split on headings, at most CHUNK_TOKENS per node, tables split only between rows
+        with span("chunk", chunker="markdown_tables", chunk_tokens=CHUNK_TOKENS) as chunk:
+            nodes = TableAwareMarkdownParser().get_nodes_from_documents(documents)
+            chunk.set(nodes=len(nodes), chars=sum(len(node.text) for node in nodes))
+        report("chunk", done=len(nodes), total=len(nodes))
+        report("embed", done=0, total=len(nodes))
+
+        # Indexing (embedding spans nest under this one)
+        with span("index", nodes=len(nodes)):
+            index = VectorStoreIndex(nodes=nodes, storage_context=build_storage_context())
+            # Keyword index over the same nodes, for exact terms like "diluted EPS"
+            register_bm25(index, BM25Index.from_nodes(list(index.docstore.docs.values())))
+
+        # Statement line items -> per-period arrays -> ratio table, injected into role prompts
+        with span("ratios") as ratios:
+            ratio_table = ratio_table_from_text("\n\n".join(node.get_content() for node in nodes))
+            register_ratio_table(index, ratio_table)
+            ratios.set(ratios=max(ratio_table.count("\n") - 1, 0))
+        stats = Settings.embed_model.stats()
+        ingest.set(nodes=len(nodes), embed_cache_hit_rate=round(stats["hit_rate"], 3))
     return index
 
-def query_index(index: VectorStoreIndex, query: str, llm=llm):
-    engine = index.as_query_engine(
-        llm=llm,
-        similarity_top_k=5,
-        response_mode = "tree_summarize"
+def query_index(index: VectorStoreIndex, query, llm=None, streaming=False, similarity_top_k=RETRIEVAL_TOP_K):
+    """
+    Answer a query (a string or QueryBundle) over the fused BM25 + vector retriever.
+    With streaming=True returns a generator of text tokens instead of a string.
+    """
+    engine = get_query_engine(
+        index,
+        llm=llm or get_llm(),
+        similarity_top_k=similarity_top_k,
+        response_mode=PACKED_MODE,
+        streaming=streaming
     )
     response = engine.query(query)
+    if streaming:
+        return response.response_gen
+    return str(response)
+
+async def aquery_index(index: VectorStoreIndex, query, llm=None):
+    engine = get_query_engine(
+        index,
+        llm=llm or get_llm(),
+        similarity_top_k=RETRIEVAL_TOP_K,
+        response_mode=PACKED_MODE
+    )
+    response = await engine.aquery(query)
     return str(response)
 
 
@@ -110,22 +159,89 @@ def create_role_prompts(user_role):
 
     return role_prompts.get(user_role, role_prompts["🎓 Beginner"])
 
-def query_index_with_roles(index: VectorStoreIndex, question: str, user_role: str, use_openAI=False):
+def _stream_with_error_message(token_gen, on_complete=None):
+    # Errors can also surface while the answer is being generated
+    tokens = []
+    try:
+        for token in token_gen:
+            tokens.append(token)
+            yield token
+    except Exception as e:
+        st.error(f"Error querying index: {str(e)}")
+        yield "An error occurred while processing your request."
+        return
+    if on_complete:
+        on_complete("".join(tokens))
+
+def query_index_with_roles(index: VectorStoreIndex, question: str, user_role: str,
+                           streaming=False, doc_hash=None):
+    """
+    Answer a question for a user role. The model router picks the model of each LLM
+    call from the prompt size, the role's expected answer length and recent latencies.
+    When doc_hash is given, answers are served from and saved to the semantic answer cache.
+    """
+    model_name = ROUTED_MODEL
+    # Root span of the question; a streamed answer keeps it open until fully consumed
+    root = start_span("query", role=user_role, model=model_name, streaming=streaming,
+                      question_chars=len(question))
     try:
-        selected_llm = set_llm(use_openAI)
         role_context = create_role_prompts(user_role)
 
+        # Ratios computed from the statement tables, so the model does not redo the arithmetic;
+        # beginners only get them when they ask about ratios
+        ratio_question = is_ratio_question(question)
+        ratio_table = get_ratio_table(index) if ratio_question or user_role != "🎓 Beginner" else ""
+        ratio_context = f"""
+        Financial ratios computed from the document's statements (use these figures rather than recomputing them):
+{ratio_table}
+        """ if ratio_table else ""
+        top_k = RATIO_TOP_K if ratio_table and ratio_question else RETRIEVAL_TOP_K
+        root.set(ratio_table=bool(ratio_table), top_k=top_k)
+
         # Combine role context with user query
         combined_query = f"""
         {role_context}
+        {ratio_context}
         User Question: {question}
         """
-        # Query the index with the combined query
-        print(f"🔍 Querying index with role context: {combined_query}")
-        response = query_index(index, combined_query, selected_llm)
+        # The question is embedded once, for both the answer cache and retrieval;
+        # retrieval matches on the question alone, not on the role instructions
+        with span("embed_query"):
+            question_embedding = Settings.embed_model.get_query_embedding(question)
+        query_bundle = QueryBundle(query_str=combined_query, custom_embedding_strs=[question],
+                                   embedding=question_embedding)
+        engine = get_query_engine(index, llm=model_router.default_llm(), similarity_top_k=top_k,
+                                  response_mode=PACKED_MODE, streaming=streaming, router=model_router)
+        # Retrieval runs while the answer cache is checked; a cache hit just leaves it unused
+        retrieval = _retrieval_pool.submit(copy_context().run, engine.retrieve, query_bundle)
+
+        # Look for an identical or near-identical question asked before
+        if doc_hash:
+            with span("answer_cache") as cache_span:
+                cached_answer = answer_cache.lookup(
+                    doc_hash, user_role, model_name, question, question_embedding)
+                cache_span.set(cache_hit=cached_answer is not None)
+            if cached_answer is not None:
+                detach(root)
+                root.end()
+                return iter([cached_answer]) if streaming else cached_answer
+
+        def save_answer(answer):
+            if doc_hash and answer:
+                answer_cache.store(doc_hash, user_role, model_name, question, answer, question_embedding)
+
+        with routing_hints(role=user_role):
+            response = engine.synthesize(query_bundle, retrieval.result())
+        detach(root)
+        if streaming:
+            return _stream_with_error_message(traced_stream(response.response_gen, root), on_complete=save_answer)
+        root.end()
+        save_answer(str(response))
         return str(response)
     except Exception as e:
+        detach(root)
+        root.end(error=e)
         st.error(f"Error querying index: {str(e)}")
+        if streaming:
+            return iter(["An error occurred while processing your request."])
         return "An error occurred while processing your request."
-
-
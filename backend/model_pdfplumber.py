@@ -1,19 +1,29 @@
 import pymupdf
-import pdfplumber
+import multiprocessing
 import os
-from llama_index.core import Document, VectorStoreIndex
-from llama_index.llms.openrouter import OpenRouter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from llama_index.core import Document, Settings, VectorStoreIndex
 from llama_index.core.node_parser import SimpleNodeParser
 from dotenv import load_dotenv
+from backend.numpy_vector_store import build_storage_context
+from backend.pdfplumber_tables import extract_table_page
+from backend.hybrid_retrieval import BM25Index, register_bm25
+from backend.engine_pool import get_query_engine
+from backend.registry import get_cached_embedding, get_llm
+from backend.progress import report
+from backend.tracing import span
 
 load_dotenv() 
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 os.environ["OPENROUTER_API_KEY"] = os.getenv("OPENROUTER_API_KEY")
 
-# Initialize OpenRouter LLM
-llm = OpenRouter(
-    model="anthropic/claude-sonnet-4", 
-    api_key=os.getenv("OPENROUTER_API_KEY"))
+# Number of PDFPlumber table workers and documents embedded per batch
+TABLE_WORKERS = int(os.getenv("TABLE_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_BATCH_DOCUMENTS = 32
+
+# Same cached, rate-limited embedding model as the Docling pipeline
+Settings.embed_model = get_cached_embedding()
 
 # ----------------- PDF extraction ----------------
 def likely_contains_table(text):
@@ -35,91 +45,101 @@ def likely_contains_table(text):
     return count >=2
 
 
-# The helper function to tidy up the row and remove the None values 
-def clean_table_row(row):
-    cleaned_row = []
-    for cell in row:
-        # Skip None values or cells that are just a dollar sign
-        if cell is None:
-            continue
-
-        cell_str = str(cell).strip()
-        if cell_str == '$':
-            continue
-
-        if cell_str:
-            cleaned_row.append(cell_str)
-
-    return cleaned_row
+def iter_pdf_items(pdf_file, workers=TABLE_WORKERS, max_pending=None):
+    """
+    Stream extracted items page by page, in page order.
+    Plain pages are read with PyMuPDF; pages that likely contain a table are sent to
+    a pool of PDFPlumber workers, started on the first such page. At most `max_pending`
+    table pages are in flight, so memory does not grow with the page count.
+    """
+    max_pending = max_pending or workers * 2
+    pending = deque()  # (future or None, items) in page order
+    pool = None
 
-
-def extract_text_from_pdf(pdf_file):
-    output = []
-
-    # open PDF file
     try:
-        pymupdf_doc = pymupdf.open(pdf_file)
-        with pdfplumber.open(pdf_file) as plumber_doc:
-            for pymupdf_page, plumber_page in zip(pymupdf_doc, plumber_doc.pages):
+        with pymupdf.open(pdf_file) as pymupdf_doc:
+            report("parse", done=0, total=pymupdf_doc.page_count)
+            for page_index, pymupdf_page in enumerate(pymupdf_doc):
                 text = pymupdf_page.get_text()
 
                 if likely_contains_table(text):
-                    # Use PDFPlumber to extract full page text if the page likely contains a table
-                    full_text = plumber_page.extract_text()
-                    if full_text:
-                        output.append({
-                            "type": "text",
-                            "content": full_text.strip()
-                        })
-
-                    tables = plumber_page.extract_tables()
-                    for table in tables:
-                        cleaned_table = [clean_table_row(row) for row in table if clean_table_row(row)]
-                        output.append({
-                            "type": "table",
-                            "content": cleaned_table
-                        })
+                    # Use PDFPlumber to extract full page text and tables if the page likely contains a table
+                    if pool is None:
+                        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                    pending.append((pool.submit(extract_table_page, pdf_file, page_index), None))
                 # Use PyMuPDF for faster text extraction if no table is detected
                 else:
-                    output.append({
-                        "type": "text",
-                        "content": text.strip()
-                    })
-        return output
+                    pending.append((None, [{"type": "text", "content": text.strip()}]))
+
+                # Emit finished pages from the front of the queue once the window is full
+                while len(pending) > max_pending or (pending and pending[0][0] is None):
+                    future, items = pending.popleft()
+                    yield from (future.result() if future else items)
+                    report("parse", advance=1)
+
+            while pending:
+                future, items = pending.popleft()
+                yield from (future.result() if future else items)
+                report("parse", advance=1)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def extract_text_from_pdf(pdf_file):
+    try:
+        return list(iter_pdf_items(pdf_file))
     except Exception as e:
         return f"Error reading PDF: {str(e)}"
 
 # ----------------- LlamaIndex Pipeline -----------------
-def build_index_from_pdf(pdf_file):
-    extracted_data = extract_text_from_pdf(pdf_file)
-    documents = []
-
-    for item in extracted_data:
-        if item['type'] == 'text':
-            documents.append(Document(text=item['content']))
-        elif item['type'] == 'table':
-            # Convert table rows to a string representation
-            table_content = "\n".join(["\t".join(row) for row in item['content']])
-            documents.append(Document(text=table_content))
-    
+def item_to_document(item):
+    if item['type'] == 'table':
+        # Convert table rows to a string representation
+        return Document(text="\n".join(["\t".join(row) for row in item['content']]))
+    return Document(text=item['content'])
+
+
+def build_index_from_pdf(pdf_file, batch_size=EMBED_BATCH_DOCUMENTS):
+    """
+    Stream pages through extract -> chunk -> embed in bounded batches,
+    so only one batch of documents and nodes is held in memory at a time.
+    """
     node_parser = SimpleNodeParser.from_defaults(chunk_size=512, chunk_overlap=50)
-    nodes = node_parser.get_nodes_from_documents(documents)
-
-    for i, node in enumerate(nodes[:5]):  
-        if i == 0: # Show first 5 nodes
-            print(f"\n--- Node {i+1} ---")
-            print(f"Text length: {len(node.text)} characters")
-            print(f"Text preview: {node.text}...")
-            print("-" * 50)
-
-    index = VectorStoreIndex.from_documents(documents)
+    index = VectorStoreIndex(nodes=[], storage_context=build_storage_context())
+    batch = []
+    node_count = 0
+
+    def flush(documents):
+        with span("chunk", chunker="sentence", documents=len(documents)) as chunk:
+            nodes = node_parser.get_nodes_from_documents(documents)
+            chunk.set(nodes=len(nodes))
+        report("chunk", advance=len(nodes))
+        with span("index", nodes=len(nodes)):
+            index.insert_nodes(nodes)
+        return len(nodes)
+
+    # Parsing is interleaved with chunking and embedding, so it has no span of its own
+    with span("ingest", file=os.path.basename(str(pdf_file)), parser="pdfplumber") as ingest:
+        for item in iter_pdf_items(pdf_file):
+            if not item['content']:
+                continue
+            batch.append(item_to_document(item))
+            if len(batch) >= batch_size:
+                node_count += flush(batch)
+                batch = []
+        if batch:
+            node_count += flush(batch)
+
+        register_bm25(index, BM25Index.from_nodes(list(index.docstore.docs.values())))
+        ingest.set(nodes=node_count)
     return index
 
-def query_index(index: VectorStoreIndex, query: str, llm=llm):
-    engine = index.as_query_engine(
-        llm=llm,
-        similarity_top_k=10,
-        max_tokens=4096,
+def query_index(index: VectorStoreIndex, query: str, llm=None):
+    engine = get_query_engine(
+        index,
+        llm=llm or get_llm(),
+        similarity_top_k=6,
         response_mode="compact")
     response = engine.query(query)
     return str(response)
\ No newline at end of file
@@ -0,0 +1,296 @@
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from backend.context_packer import context_window, output_tokens
+from backend.registry import get_llm
+from backend.tracing import detach, start_span
+
+# Candidate models (names in backend.registry.LLMS) and their tier, in order of preference;
+# "fast" models answer the intermediate map steps of long answers
+ROUTES = {
+    "openrouter": "quality",
+    "openai": "quality",
+    "openai-mini": "fast",
+}
+# Tier each synthesis step prefers; anything else gets "quality"
+STEP_TIERS = {"map": "fast"}
+
+# Tokens an answer is expected to need, by role (Beginner answers stay under 200 words)
+ROLE_OUTPUT_TOKENS = {
+    "🎓 Beginner": 300,
+    "📊 Financial Analyst": 1200,
+    "💼 Investor": 900,
+}
+DEFAULT_OUTPUT_TOKENS = 800
+# Partial answers of the map step only need to carry facts to the reduce step
+MAP_OUTPUT_TOKENS = 400
+
+# A model whose p95 call latency goes over this is passed over while another one is not
+LATENCY_BUDGET_S = float(os.getenv("FSA_LATENCY_BUDGET_S", "30"))
+# Recent call latencies kept per model, and how many are needed before p95 is trusted
+LATENCY_SAMPLES = 50
+MIN_LATENCY_SAMPLES = 5
+# Routing decisions kept in memory for stats()
+RECENT_DECISIONS = 500
+
+# Answer cache and span label for answers from whichever model the router picked
+ROUTED_MODEL = "auto"
+
+# Provider messages for prompts over the context window (OpenAI, Anthropic via OpenRouter)
+CONTEXT_LENGTH_ERRORS = ("context_length_exceeded", "maximum context length", "context length",
+                         "prompt is too long", "too many tokens")
+
+_hints = contextvars.ContextVar("fsa_route_hints", default={})
+
+
+@contextmanager
+def routing_hints(**hints):
+    """Tell routers called from this context about the request, e.g. routing_hints(role=user_role)."""
+    token = _hints.set({**_hints.get(), **hints})
+    try:
+        yield
+    finally:
+        _hints.reset(token)
+
+
+def failover_reason(error):
+    """"timeout" or "context_length" when another model may succeed where this one failed, else None."""
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    message = str(error).lower()
+    if any(marker in message for marker in CONTEXT_LENGTH_ERRORS):
+        return "context_length"
+    return None
+
+
+# ----------------- Router ----------------
+class ModelRouter:
+    """
+    Picks the model for each LLM call. A candidate must fit the prompt plus its output
+    limit in its context window and allow at least the expected output (from the role,
+    or MAP_OUTPUT_TOKENS for map steps); among those, models within the latency budget
+    (observed p95) come first, then the tier the step prefers, then ROUTES order.
+
+    Calls that fail with a context-length or timeout error are retried on the next
+    best model. Every decision is a "route" span (parent of the call's "llm" span)
+    holding the inputs, the model picked and why, and how the call ended.
+    """
+
+    def __init__(self, routes=ROUTES, latency_budget_s=LATENCY_BUDGET_S):
+        self.routes = dict(routes)
+        self.latency_budget_s = latency_budget_s
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self._decisions = deque(maxlen=RECENT_DECISIONS)
+        self._lock = threading.Lock()
+
+    def default_llm(self):
+        """The first candidate; engines size their context budget from it."""
+        return get_llm(next(iter(self.routes)))
+
+    # ---- latency ----
+    def observe(self, name, seconds):
+        with self._lock:
+            self._latencies[name].append(seconds)
+
+    def p95(self, name):
+        """p95 of the model's recent call latencies in seconds, or None with too few samples."""
+        with self._lock:
+            samples = list(self._latencies[name])
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return float(np.percentile(samples, 95))
+
+    # ---- decisions ----
+    def choose(self, step, prompt_tokens, expected_output=None, role=None, exclude=()):
+        """The routing decision for one call, as a dict; "model" is the registry name picked."""
+        role = role or _hints.get().get("role")
+        if expected_output is None:
+            expected_output = MAP_OUTPUT_TOKENS if step == "map" else ROLE_OUTPUT_TOKENS.get(
+                role, DEFAULT_OUTPUT_TOKENS)
+        tier = STEP_TIERS.get(step, "quality")
+
+        candidates = []
+        for rank, name in enumerate(name for name in self.routes if name not in exclude):
+            llm = get_llm(name)
+            window, max_output, p95 = context_window(llm), output_tokens(llm), self.p95(name)
+            problems = []
+            if prompt_tokens + max_output > window:
+                problems.append(f"context {prompt_tokens} + {max_output} > {window}")
+            if max_output < expected_output:
+                problems.append(f"max output {max_output} < {expected_output}")
+            slow = p95 is not None and p95 > self.latency_budget_s
+            if slow:
+                problems.append(f"p95 {p95:.1f}s > {self.latency_budget_s:g}s")
+            key = (prompt_tokens + max_output > window, max_output < expected_output,
+                   slow, p95 if slow else 0.0, self.routes[name] != tier, rank)
+            candidates.append((key, name, llm, problems))
+        if not candidates:
+            raise RuntimeError(f"No model left to route {step!r} to")
+
+        preferred = sorted(candidates, key=lambda candidate: (candidate[0][4], candidate[0][5]))
+        key, name, llm, _ = min(candidates)
+        # Why each model preferred for this step was passed over
+        skipped = []
+        for _, other, _, problems in preferred:
+            if other == name:
+                break
+            skipped.append(f"{other}: {', '.join(problems) or 'ranked lower'}")
+        p95 = self.p95(name)
+        return {
+            "step": step,
+            "role": role,
+            "estimated_tokens": prompt_tokens,
+            "expected_output": expected_output,
+            "model": name,
+            "model_name": llm.metadata.model_name,
+            "tier": self.routes[name],
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "reason": "; ".join(skipped) or "preferred",
+            "failover_from": list(exclude),
+        }
+
+    def _route(self, step, prompt_tokens, tried):
+        decision = self.choose(step, prompt_tokens, exclude=tried)
+        with self._lock:
+            self._decisions.append(decision)
+        # Open until the call ends, so the call's llm span nests under it
+        route_span = start_span("route", **decision)
+        return decision, get_llm(decision["model"]), route_span, time.perf_counter()
+
+    def _succeeded(self, decision, route_span, started):
+        seconds = time.perf_counter() - started
+        self.observe(decision["model"], seconds)
+        decision.update(outcome="ok", seconds=round(seconds, 3))
+        route_span.set(outcome="ok")
+        route_span.end()
+
+    def _failed(self, decision, route_span, started, error, tried):
+        """Record a failed call; True when the next model should be tried."""
+        seconds = time.perf_counter() - started
+        reason = failover_reason(error)
+        if reason == "timeout":
+            self.observe(decision["model"], seconds)
+        fail_over = reason is not None and tried is not None and len(tried) + 1 < len(self.routes)
+        outcome = "failover" if fail_over else "error"
+        decision.update(outcome=outcome, error=reason or type(error).__name__, seconds=round(seconds, 3))
+        route_span.set(outcome=outcome)
+        route_span.end(error=error)
+        if fail_over:
+            tried.append(decision["model"])
+        return fail_over
+
+    # ---- calls ----
+    def call(self, step, prompt_tokens, invoke):
+        """Return invoke(llm) for the routed model, failing over on context-length and timeout errors."""
+        tried = []
+        while True:
+            decision, llm, route_span, started = self._route(step, prompt_tokens, tried)
+            try:
+                result = invoke(llm)
+            except Exception as e:
+                if self._failed(decision, route_span, started, e, tried):
+                    continue
+                raise
+            finally:
+                detach(route_span)
+            self._succeeded(decision, route_span, started)
+            return result
+
+    async def acall(self, step, prompt_tokens, ainvoke):
+        tried = []
+        while True:
+            decision, llm, route_span, started = self._route(step, prompt_tokens, tried)
+            try:
+                result = await ainvoke(llm)
+            except Exception as e:
+                if self._failed(decision, route_span, started, e, tried):
+                    continue
+                raise
+            finally:
+                detach(route_span)
+            self._succeeded(decision, route_span, started)
+            return result
+
+    def stream(self, step, prompt_tokens, invoke):
+        """
+        Like call, for invoke(llm) returning a token stream. Providers report errors on
+        the first read, so that token is awaited here: a failover never repeats text
+        the caller has already shown.
+        """
+        tried = []
+        while True:
+            decision, llm, route_span, started = self._route(step, prompt_tokens, tried)
+            try:
+                tokens = iter(invoke(llm))
+                first = next(tokens, None)
+            except Exception as e:
+                if self._failed(decision, route_span, started, e, tried):
+                    continue
+                raise
+            finally:
+                detach(route_span)
+            return self._finish_stream(decision, route_span, started, first, tokens)
+
+    async def astream(self, step, prompt_tokens, ainvoke):
+        tried = []
+        while True:
+            decision, llm, route_span, started = self._route(step, prompt_tokens, tried)
+            try:
+                tokens = (await ainvoke(llm)).__aiter__()
+                first = await anext(tokens, None)
+            except Exception as e:
+                if self._failed(decision, route_span, started, e, tried):
+                    continue
+                raise
+            finally:
+                detach(route_span)
+            return self._afinish_stream(decision, route_span, started, first, tokens)
+
+    def _finish_stream(self, decision, route_span, started, first, tokens):
+        try:
+            if first is not None:
+                yield first
+            yield from tokens
+        except Exception as e:
+            self._failed(decision, route_span, started, e, None)
+            raise
+        self._succeeded(decision, route_span, started)
+
+    async def _afinish_stream(self, decision, route_span, started, first, tokens):
+        try:
+            if first is not None:
+                yield first
+            async for token in tokens:
+                yield token
+        except Exception as e:
+            self._failed(decision, route_span, started, e, None)
+            raise
+        self._succeeded(decision, route_span, started)
+
+    # ---- reporting ----
+    def recent_decisions(self):
+        with self._lock:
+            return [dict(decision) for decision in self._decisions]
+
+    def stats(self):
+        """Per model: recent decisions, failovers and p95 latency."""
+        decisions = self.recent_decisions()
+        return {
+            name: {
+                "calls": sum(decision["model"] == name for decision in decisions),
+                "failovers": sum(decision["model"] == name and decision.get("outcome") == "failover"
+                                 for decision in decisions),
+                "p95_s": self.p95(name),
+            }
+            for name in self.routes
+        }
+
+
+# Shared by every session in this process, so latency observations add up
+model_router = ModelRouter()
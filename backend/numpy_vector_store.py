@@ -0,0 +1,228 @@
+import json
+import os
+from typing import Any, List, Optional, Sequence
+import numpy as np
+from llama_index.core import StorageContext
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryMode, VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import build_metadata_filter_fn
+
+DEFAULT_PERSIST_FNAME = "default__vector_store.json"
+# "float32" or "int8" storage, and an optional truncated embedding size
+# (text-embedding-3 vectors keep most of their quality when truncated and renormalized)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "float32")
+VECTOR_DIMENSIONS = int(os.getenv("VECTOR_DIMENSIONS", "0")) or None
+# Rows scored per block when the matrix is int8, bounding the float32 scratch space
+SCORE_BLOCK_ROWS = 65536
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# ----------------- NumPy vector store ----------------
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    In-memory vector store holding every embedding in one contiguous, pre-normalized
+    matrix. Top-k is a single matrix-vector product plus argpartition, so cosine
+    similarity needs no per-node Python loop.
+
+    quantization="int8" stores each row as int8 with a per-row float32 scale (4x smaller);
+    dimensions=N keeps only the first N components of every embedding.
+    Saved matrices are reopened with np.load(mmap_mode="r").
+    """
+
+    stores_text: bool = False
+    quantization: str = "float32"
+    dimensions: Optional[int] = None
+
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    _pending: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _metadata: List[dict] = PrivateAttr(default_factory=list)
+    _alive: Optional[np.ndarray] = PrivateAttr(default=None)
+    # metadata filters (as JSON) -> matching rows, dropped whenever rows change
+    _partitions: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, quantization: str = VECTOR_QUANTIZATION, dimensions: Optional[int] = VECTOR_DIMENSIONS,
+                 **kwargs: Any):
+        if quantization not in ("float32", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        super().__init__(quantization=quantization, dimensions=dimensions, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    # Not __len__: StorageContext tests the store's truthiness, and an empty store must not be falsy
+    @property
+    def num_vectors(self):
+        return len(self._ids)
+
+    # ---------- building the matrix ----------
+    def _prepare(self, vectors):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.dimensions:
+            matrix = matrix[:, :self.dimensions]
+        return _normalize(matrix)
+
+    def _consolidate(self):
+        """Fold rows added since the last query into the contiguous matrix."""
+        if not self._pending:
+            return
+        new_rows = np.concatenate(self._pending)
+        self._pending = []
+        self._partitions = {}
+        if self.quantization == "int8":
+            scales = np.abs(new_rows).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            new_rows = np.round(new_rows / scales[:, None]).astype(np.int8)
+            self._scales = scales.astype(np.float32) if self._scales is None \
+                else np.concatenate([self._scales, scales.astype(np.float32)])
+        self._matrix = new_rows if self._matrix is None else np.concatenate([self._matrix, new_rows])
+        self._alive = np.concatenate([
+            self._alive if self._alive is not None else np.ones(0, dtype=bool),
+            np.ones(len(new_rows), dtype=bool),
+        ])
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        self._pending.append(self._prepare([node.get_embedding() for node in nodes]))
+        for node in nodes:
+            self._ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id or "None")
+            self._metadata.append(dict(node.metadata))
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        # Rows are only masked out; the matrix keeps its shape
+        self._consolidate()
+        for row, doc_id in enumerate(self._ref_doc_ids):
+            if doc_id == ref_doc_id:
+                self._alive[row] = False
+        self._partitions = {}
+
+    def clear(self) -> None:
+        self._matrix = self._scales = self._alive = None
+        self._pending, self._ids, self._ref_doc_ids, self._metadata = [], [], [], []
+        self._partitions = {}
+
+    # ---------- querying ----------
+    def _partition(self, filters):
+        """Rows matching metadata filters, computed once per distinct filter set."""
+        key = filters.model_dump_json()
+        rows = self._partitions.get(key)
+        if rows is None:
+            filter_fn = build_metadata_filter_fn(lambda row: self._metadata[row], filters)
+            rows = self._partitions[key] = np.fromiter(
+                (filter_fn(row) for row in range(len(self._ids))), dtype=bool, count=len(self._ids))
+        return rows
+
+    def _scores(self, query_vector, rows=None):
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        if self.quantization == "float32":
+            return matrix @ query_vector
+        scales = self._scales if rows is None else self._scales[rows]
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_BLOCK_ROWS] = block @ query_vector
+        return scores * scales
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"NumpyVectorStore only supports the default query mode, got {query.mode}")
+        self._consolidate()
+        if self._matrix is None or not len(self._ids):
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        # Pre-filter rows by node ids and metadata, then score only that partition
+        mask = self._alive.copy()
+        if query.node_ids is not None:
+            wanted = set(query.node_ids)
+            mask &= np.fromiter((node_id in wanted for node_id in self._ids), dtype=bool, count=len(self._ids))
+        if query.filters is not None:
+            mask &= self._partition(query.filters)
+        rows = None if mask.all() else np.flatnonzero(mask)
+        if rows is not None and not len(rows):
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = self._prepare([query.query_embedding])[0]
+        scores = self._scores(query_vector, rows)
+
+        k = min(query.similarity_top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        row_ids = top if rows is None else rows[top]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._ids[row] for row in row_ids],
+        )
+
+    # ---------- persistence ----------
+    @staticmethod
+    def _matrix_paths(persist_path):
+        base, _ = os.path.splitext(persist_path)
+        return base + ".npy", base + ".scales.npy"
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        self._consolidate()
+        os.makedirs(os.path.dirname(persist_path) or ".", exist_ok=True)
+        matrix_path, scales_path = self._matrix_paths(persist_path)
+        dim = self.dimensions or 0
+        np.save(matrix_path, self._matrix if self._matrix is not None else np.zeros((0, dim), dtype=np.float32))
+        if self.quantization == "int8":
+            np.save(scales_path, self._scales if self._scales is not None else np.zeros(0, dtype=np.float32))
+        with open(persist_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "class_name": self.class_name(),
+                "quantization": self.quantization,
+                "dimensions": self.dimensions,
+                "ids": self._ids,
+                "ref_doc_ids": self._ref_doc_ids,
+                "metadata": self._metadata,
+                "alive": self._alive.tolist() if self._alive is not None else [],
+            }, f)
+
+    @classmethod
+    def is_persisted(cls, persist_dir: str) -> bool:
+        persist_path = os.path.join(persist_dir, DEFAULT_PERSIST_FNAME)
+        return os.path.exists(cls._matrix_paths(persist_path)[0])
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, mmap: bool = True) -> "NumpyVectorStore":
+        with open(persist_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        store = cls(quantization=data["quantization"], dimensions=data["dimensions"])
+        matrix_path, scales_path = cls._matrix_paths(persist_path)
+        mmap_mode = "r" if mmap else None
+        # Memory-mapped: pages are read on demand and shared with other processes
+        store._matrix = np.load(matrix_path, mmap_mode=mmap_mode)
+        if data["quantization"] == "int8":
+            store._scales = np.load(scales_path, mmap_mode=mmap_mode)
+        store._ids = data["ids"]
+        store._ref_doc_ids = data["ref_doc_ids"]
+        store._metadata = data["metadata"]
+        store._alive = np.array(data["alive"], dtype=bool)
+        return store
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, mmap: bool = True) -> "NumpyVectorStore":
+        return cls.from_persist_path(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME), mmap=mmap)
+
+
+def build_storage_context():
+    """Storage context whose vectors live in a NumpyVectorStore."""
+    return StorageContext.from_defaults(vector_store=NumpyVectorStore())
@@ -0,0 +1,48 @@
+import pdfplumber
+
+# Runs in the pdfplumber pipeline's spawned table workers, so it imports nothing but
+# pdfplumber: each worker starts by importing this module, not backend.model_pdfplumber
+# with its LlamaIndex and model client setup
+
+
+# The helper function to tidy up the row and remove the None values
+def clean_table_row(row):
+    cleaned_row = []
+    for cell in row:
+        # Skip None values or cells that are just a dollar sign
+        if cell is None:
+            continue
+
+        cell_str = str(cell).strip()
+        if cell_str == '$':
+            continue
+
+        if cell_str:
+            cleaned_row.append(cell_str)
+
+    return cleaned_row
+
+
+# Worker processes keep their pdfplumber document open between pages
+_plumber_docs = {}
+
+
+def extract_table_page(pdf_file, page_index):
+    """Full text and cleaned tables of one page with PDFPlumber (runs in a worker process)."""
+    plumber_doc = _plumber_docs.get(pdf_file)
+    if plumber_doc is None:
+        plumber_doc = _plumber_docs[pdf_file] = pdfplumber.open(pdf_file)
+    plumber_page = plumber_doc.pages[page_index]
+
+    items = []
+    full_text = plumber_page.extract_text()
+    if full_text:
+        items.append({"type": "text", "content": full_text.strip()})
+
+    for table in plumber_page.extract_tables():
+        cleaned_rows = (clean_table_row(row) for row in table)
+        items.append({"type": "table", "content": [row for row in cleaned_rows if row]})
+
+    # Drop the parsed layout objects so worker memory stays flat
+    plumber_page.close()
+    return items
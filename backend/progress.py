@@ -0,0 +1,38 @@
+import contextvars
+from contextlib import contextmanager
+
+_tracker = contextvars.ContextVar("fsa_progress", default=None)
+
+
+class Cancelled(Exception):
+    """Raised at a progress checkpoint once the job doing the work has been cancelled."""
+
+
+# ----------------- Progress reporting ----------------
+@contextmanager
+def track(tracker):
+    """
+    Route report() calls made in this context to tracker.update(stage, done, total, advance).
+    The tracker may raise Cancelled from update() to stop the work at that checkpoint.
+    """
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+
+
+def report(stage, done=None, total=None, advance=0):
+    """Set or advance a stage's progress for the job running in this context; a no-op outside jobs."""
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.update(stage, done=done, total=total, advance=advance)
+
+
+def reporter():
+    """report() bound to the current job, for callbacks run on threads that don't share this context."""
+    tracker = _tracker.get()
+    if tracker is None:
+        return lambda stage, done=None, total=None, advance=0: None
+    return lambda stage, done=None, total=None, advance=0: tracker.update(
+        stage, done=done, total=total, advance=advance)
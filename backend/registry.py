@@ -0,0 +1,71 @@
+import importlib
+import os
+from functools import lru_cache
+
+import backend.clients as clients
+
+# Parser name -> "module:function" building a VectorStoreIndex from a PDF.
+# Modules are imported on first use, so pdfplumber or Docling only load when picked.
+PARSERS = {
+    "docling": "backend.model_docling:build_index_from_pdf_docling",
+    "pdfplumber": "backend.model_pdfplumber:build_index_from_pdf",
+}
+
+# LLM name -> (getter in backend.clients, arguments); looked up by name so the
+# getters can be swapped for local stand-ins (benchmarks, offline runs)
+LLMS = {
+    "openrouter": ("get_openrouter_llm", {"model": "anthropic/claude-sonnet-4", "max_tokens": 4096}),
+    "openai": ("get_openai_llm", {"model": "gpt-4o", "max_tokens": 4096}),  # max_tokens controls response length
+    "openai-mini": ("get_openai_llm", {"model": "gpt-4o-mini", "max_tokens": 4096}),  # cheap, fast intermediate steps
+}
+DEFAULT_LLM = "openrouter"
+
+EMBED_MODEL = "text-embedding-3-large"
+
+# "module:Class" of the speech-to-text service; point it at
+# benchmarks.local_models:StubTranscriber to run the voice path offline
+TRANSCRIBER = os.getenv("FSA_TRANSCRIBER", "backend.transcription:WhisperTranscriber")
+
+
+def _load(path):
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+# ----------------- Parsers ----------------
+@lru_cache(maxsize=None)
+def get_parser(name="docling"):
+    """The index-building function of a parser, importing its module on first use."""
+    if name not in PARSERS:
+        raise ValueError(f"Unknown parser {name!r}, expected one of {sorted(PARSERS)}")
+    return _load(PARSERS[name])
+
+
+# ----------------- Models ----------------
+def get_llm(name=DEFAULT_LLM):
+    """Shared LLM client, constructed on first use."""
+    if name not in LLMS:
+        raise ValueError(f"Unknown LLM {name!r}, expected one of {sorted(LLMS)}")
+    getter, kwargs = LLMS[name]
+    return getattr(clients, getter)(**kwargs)
+
+
+def get_embedding():
+    """Shared embedding client, constructed on first use."""
+    return clients.get_openai_embedding(EMBED_MODEL)
+
+
+@lru_cache(maxsize=None)
+def get_cached_embedding():
+    """
+    The embedding model every pipeline indexes with: the embedding cache and its
+    executor in front of get_embedding(), one per process so rate limits are shared.
+    """
+    from backend.embedding_cache import CachedEmbedding
+    return CachedEmbedding(get_embedding, model_name=EMBED_MODEL)
+
+
+@lru_cache(maxsize=None)
+def get_transcriber():
+    """Shared speech-to-text service, constructed on first use."""
+    return _load(TRANSCRIBER)()
@@ -0,0 +1,334 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set FSA_TRACING=0 to turn spans into no-ops
+TRACING_ENABLED = os.getenv("FSA_TRACING", "1") != "0"
+# JSONL span sink, off unless a path is set; rotated to <path>.1 once it reaches the size cap
+TRACE_FILE = os.getenv("FSA_TRACE_FILE", "")
+TRACE_FILE_MAX_BYTES = int(os.getenv("FSA_TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Port of the Prometheus text endpoint; 0 leaves it off
+METRICS_PORT = int(os.getenv("FSA_METRICS_PORT", "0"))
+# Finished spans kept in memory for the timing panel
+RECENT_SPANS = 2000
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_current_span = contextvars.ContextVar("fsa_current_span", default=None)
+_session = contextvars.ContextVar("fsa_session", default=None)
+
+
+# ----------------- Spans ----------------
+class Span:
+    """One timed stage. Attributes are free-form: token counts, node ids, cache hits."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "session", "start", "end_time",
+                 "duration_ms", "attributes", "status", "error", "_token")
+
+    def __init__(self, name, attributes):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.session = _session.get()
+        self.start = time.time()
+        self.end_time = None
+        self.duration_ms = None
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        self.duration_ms = round((self.end_time - self.start) * 1000, 3)
+        if error is not None:
+            self.status, self.error = "error", repr(error)
+        _export(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session": self.session,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+def start_span(name, **attributes):
+    """
+    Open a span that becomes the parent of spans started in this context.
+    Call end() on it; prefer the span() context manager where the stage has a clear scope.
+    """
+    if not TRACING_ENABLED:
+        return _NoopSpan()
+    new_span = Span(name, attributes)
+    new_span._token = _current_span.set(new_span)
+    return new_span
+
+
+def detach(active_span):
+    """Stop an open span from parenting later spans (e.g. a stream handed back to the caller)."""
+    if getattr(active_span, "_token", None) is not None:
+        try:
+            _current_span.reset(active_span._token)
+        except ValueError:
+            pass  # ended in a different context than it started
+        active_span._token = None
+
+
+@contextmanager
+def span(name, **attributes):
+    active = start_span(name, **attributes)
+    try:
+        yield active
+    except BaseException as e:
+        active.end(error=e)
+        raise
+    finally:
+        detach(active)
+        active.end()
+
+
+def current_span():
+    """The innermost open span, or a no-op span outside of any."""
+    return _current_span.get() or _NoopSpan()
+
+
+def traced_stream(token_gen, active_span, on_text=None):
+    """Yield tokens and end the span when the stream is exhausted; on_text gets the full text."""
+    tokens = []
+    try:
+        for token in token_gen:
+            tokens.append(token)
+            yield token
+    except BaseException as e:
+        active_span.end(error=e)
+        raise
+    if on_text:
+        on_text("".join(tokens))
+    active_span.end()
+
+
+async def atraced_stream(token_gen, active_span, on_text=None):
+    """Async counterpart of traced_stream."""
+    tokens = []
+    try:
+        async for token in token_gen:
+            tokens.append(token)
+            yield token
+    except BaseException as e:
+        active_span.end(error=e)
+        raise
+    if on_text:
+        on_text("".join(tokens))
+    active_span.end()
+
+
+def bind_session(session_id=None):
+    """Tag spans started from this context with a session id (the Streamlit session by default)."""
+    if session_id is None:
+        try:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+            ctx = get_script_run_ctx()
+            session_id = ctx.session_id if ctx else None
+        except Exception:
+            session_id = None
+    _session.set(session_id)
+    return session_id
+
+
+# ----------------- Exporters ----------------
+_recent = deque(maxlen=RECENT_SPANS)
+_jsonl_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_span_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+_span_sums = defaultdict(float)
+_span_counts = defaultdict(int)
+_span_errors = defaultdict(int)
+_tokens = defaultdict(int)        # (model, kind) -> tokens
+_cache_events = defaultdict(int)  # (cache, result) -> events
+_trace_handle = None  # TRACE_FILE kept open for appending, guarded by _jsonl_lock
+
+
+def _export(finished):
+    record = finished.to_dict()
+    _recent.append(record)
+    _observe(finished)
+    if TRACE_FILE:
+        _write_trace(json.dumps(record, default=str))
+
+
+def _write_trace(line):
+    global _trace_handle
+    with _jsonl_lock:
+        try:
+            if _trace_handle is None:
+                os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+                _trace_handle = open(TRACE_FILE, "a", encoding="utf-8")
+            _trace_handle.write(line + "\n")
+            _trace_handle.flush()
+            if _trace_handle.tell() >= TRACE_FILE_MAX_BYTES:
+                _trace_handle.close()
+                _trace_handle = None
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+        except OSError:
+            pass  # tracing must never break a request
+
+
+def _observe(finished):
+    seconds = finished.duration_ms / 1000
+    attributes = finished.attributes
+    with _metrics_lock:
+        buckets = _span_buckets[finished.name]
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+        _span_sums[finished.name] += seconds
+        _span_counts[finished.name] += 1
+        if finished.status == "error":
+            _span_errors[finished.name] += 1
+        model = attributes.get("model", "")
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if attributes.get(kind):
+                _tokens[(model, kind)] += attributes[kind]
+        # cache_hit: one lookup; cache_hits / cache_misses: counts from a batch
+        if "cache_hit" in attributes:
+            _cache_events[(finished.name, "hit" if attributes["cache_hit"] else "miss")] += 1
+        for key, result in (("cache_hits", "hit"), ("cache_misses", "miss")):
+            if attributes.get(key):
+                _cache_events[(finished.name, result)] += attributes[key]
+
+
+def recent_spans(session=None):
+    spans = list(_recent)
+    return [s for s in spans if session is None or s["session"] == session]
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{str(value).replace(chr(34), "")}"' for key, value in labels.items()) + "}"
+
+
+def metrics_text():
+    """Span latency histograms, token and cache counters in the Prometheus text format."""
+    lines = [
+        "# HELP fsa_span_duration_seconds Duration of traced pipeline stages.",
+        "# TYPE fsa_span_duration_seconds histogram",
+    ]
+    with _metrics_lock:
+        for name in sorted(_span_counts):
+            for bound, count in zip(DURATION_BUCKETS, _span_buckets[name]):
+                lines.append(f"fsa_span_duration_seconds_bucket{_labels(span=name, le=bound)} {count}")
+            lines.append(f"fsa_span_duration_seconds_bucket{_labels(span=name, le='+Inf')} {_span_counts[name]}")
+            lines.append(f"fsa_span_duration_seconds_sum{_labels(span=name)} {_span_sums[name]:.6f}")
+            lines.append(f"fsa_span_duration_seconds_count{_labels(span=name)} {_span_counts[name]}")
+        lines += ["# HELP fsa_span_errors_total Spans that ended with an exception.",
+                  "# TYPE fsa_span_errors_total counter"]
+        lines += [f"fsa_span_errors_total{_labels(span=name)} {count}" for name, count in sorted(_span_errors.items())]
+        lines += ["# HELP fsa_llm_tokens_total Prompt and completion tokens sent to LLMs.",
+                  "# TYPE fsa_llm_tokens_total counter"]
+        lines += [f"fsa_llm_tokens_total{_labels(model=model, kind=kind)} {count}"
+                  for (model, kind), count in sorted(_tokens.items())]
+        lines += ["# HELP fsa_cache_events_total Cache lookups by cache and result.",
+                  "# TYPE fsa_cache_events_total counter"]
+        lines += [f"fsa_cache_events_total{_labels(cache=cache, result=result)} {count}"
+                  for (cache, result), count in sorted(_cache_events.items())]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on a background thread; safe to call on every Streamlit rerun."""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+# ----------------- Streamlit timing panel ----------------
+def render_timing_panel(max_traces=5):
+    """Collapsible sidebar panel with the span tree of this session's latest requests."""
+    import streamlit as st
+
+    session = bind_session()
+    spans = recent_spans(session)
+    if not spans:
+        return
+    by_trace = defaultdict(list)
+    for record in spans:
+        by_trace[record["trace_id"]].append(record)
+
+    with st.sidebar.expander("⏱️ Timings", expanded=False):
+        for trace in list(by_trace.values())[-max_traces:][::-1]:
+            children = defaultdict(list)
+            for record in trace:
+                children[record["parent_id"]].append(record)
+            span_ids = {record["span_id"] for record in trace}
+            roots = [record for record in trace if record["parent_id"] not in span_ids]
+
+            lines = []
+
+            def walk(record, depth):
+                # Scalars only; node id lists and previews stay in the JSONL sink
+                details = ", ".join(f"{key}={value}" for key, value in record["attributes"].items()
+                                    if isinstance(value, (int, float, bool, str)) and len(str(value)) <= 40)
+                status = " ❌" if record["status"] == "error" else ""
+                lines.append(f"{'  ' * depth}- **{record['name']}** {record['duration_ms']:.0f} ms{status}"
+                             + (f" · {details}" if details else ""))
+                for child in sorted(children[record["span_id"]], key=lambda item: item["start"]):
+                    walk(child, depth + 1)
+
+            for root in sorted(roots, key=lambda item: item["start"]):
+                walk(root, 0)
+            st.markdown("\n".join(lines))
+            st.markdown("---")
+
+
+if METRICS_PORT:
+    start_metrics_server()
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from backend.tracing import span
+
+WHISPER_MODEL = "whisper-1"
+# Recordings transcribed at once in this process
+TRANSCRIBE_WORKERS = 4
+
+_pool = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="fsa-transcribe")
+
+
+# ----------------- Transcription services ----------------
+class Transcriber:
+    """
+    Speech to text. Audio is passed as bytes, never through a file, so concurrent
+    sessions cannot overwrite each other's recordings. Implementations override
+    atranscribe; see benchmarks.local_models.StubTranscriber for an offline one.
+    """
+
+    async def atranscribe(self, audio: bytes, filename: str = "question.webm") -> str:
+        raise NotImplementedError
+
+    def transcribe(self, audio: bytes, filename: str = "question.webm") -> str:
+        return asyncio.run(self.atranscribe(audio, filename))
+
+
+class WhisperTranscriber(Transcriber):
+    """OpenAI Whisper through the shared SDK client (and its keep-alive connections)."""
+
+    def __init__(self, model=WHISPER_MODEL):
+        self.model = model
+
+    async def atranscribe(self, audio: bytes, filename: str = "question.webm") -> str:
+        from backend.clients import get_openai_client
+        # The SDK takes (filename, bytes); the extension tells Whisper the container format
+        transcript = await asyncio.to_thread(
+            get_openai_client().audio.transcriptions.create, model=self.model, file=(filename, audio))
+        return transcript.text
+
+
+# ----------------- Background transcription ----------------
+async def _traced_transcribe(transcriber, audio, filename):
+    with span("transcribe", audio_bytes=len(audio), service=type(transcriber).__name__) as active:
+        text = await transcriber.atranscribe(audio, filename)
+        active.set(transcript_chars=len(text))
+        return text
+
+
+def transcribe_in_background(audio, filename="question.webm", transcriber=None):
+    """
+    Start transcribing a recording and return a Future of its text right away, so
+    the caller can keep working (rendering, warming the query engine) meanwhile.
+    """
+    if transcriber is None:
+        from backend.registry import get_transcriber
+        transcriber = get_transcriber()
+    # The copied context keeps the caller's session and trace for the span
+    return _pool.submit(copy_context().run, asyncio.run, _traced_transcribe(transcriber, bytes(audio), filename))
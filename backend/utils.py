@@ -1,24 +1,25 @@
 import streamlit as st
+import asyncio
 import json
 import re
 from datetime import datetime
-from backend.model_docling import query_index
+from backend.model_docling import query_index, aquery_index
+from backend.financial_tables import extract_metrics_from_index
 from llama_index.core import Document, VectorStoreIndex
-from llama_index.llms.openrouter import OpenRouter
+from backend.progress import report
+from backend.registry import get_llm
+from backend.tracing import current_span, span
 from dotenv import load_dotenv
 import os
 #----------Define the LLM specific for the front page----------
 load_dotenv()
 os.environ["OPENROUTER_API_KEY"] = os.getenv("OPENROUTER_API_KEY")
-llm = OpenRouter(
-    model="anthropic/claude-sonnet-4", 
-    api_key=os.getenv("OPENROUTER_API_KEY"))
+# The front page always uses OpenRouter; the client is built on the first extraction
+FRONT_PAGE_LLM = "openrouter"
 
 # ----------------- Extract Key Metrics ----------------
 
-def extract_key_metrics(index: VectorStoreIndex):
-    # Find the company name first
-    company_name = find_company_name_from_index(index)
+def build_metrics_prompt(company_name=None, fields=None):
     # Metrics extraction logic
     metrics_schema = {
         "company_name": company_name if company_name else "string (company name)",
@@ -29,9 +30,11 @@ def extract_key_metrics(index: VectorStoreIndex):
         "profit_margin": {"current": "float", "previous": "float"},
         "eps": {"current": "float", "previous": "float"},
     }
-    try:
-        # Use the RAG system to extract key metrics
-        prompt = f"""
+    # Only ask the LLM for the fields the table extractor could not resolve
+    if fields is not None:
+        metrics_schema = {key: value for key, value in metrics_schema.items()
+                          if key == "company_name" or key in fields}
+    return f"""
 You are a financial analysis assistant.
 Extract the following metrics from the document.
 
@@ -52,34 +55,125 @@ Rules:
 - If "company_name" in the JSON already has a value, DO NOT modify it.
 - Use null if data is not available.
         """
-        response = query_index(index, prompt,llm=llm)
-        # Extract JSON from the response
-        metrics_json = extract_json_from_response(response)
-        print(f"📊 Extracted metrics: {metrics_json}")
-        if not metrics_json:
-            st.warning("⚠️ LLM response could not be parsed as JSON. Returning empty metrics.")
-            return {}
-        
-        return metrics_json
+
+def resolve_local_metrics(index: VectorStoreIndex):
+    """
+    Fill the metrics from the document's own statement tables, without any LLM call.
+    Returns (metrics, missing_fields).
+    """
+    company_name = find_company_name_from_index(index)
+    table_metrics, missing = extract_metrics_from_index(index)
+    current_span().set(table_metrics_resolved=len(table_metrics) - len(missing), table_metrics_total=len(table_metrics))
+    if not company_name:
+        missing.insert(0, "company_name")
+    return {"company_name": company_name, **table_metrics}, missing
+
+def merge_llm_metrics(metrics, missing, response):
+    """Copy the LLM's values into the fields that were missing; returns False if unparseable."""
+    metrics_json = extract_json_from_response(response)
+    current_span().set(llm_metrics_parsed=bool(metrics_json))
+    if not metrics_json:
+        return False
+    for field in missing:
+        metrics[field] = metrics_json.get(field)
+    return True
+
+def extract_key_metrics(index: VectorStoreIndex):
+    # Tables first; the LLM is only asked for what they do not contain
+    metrics, missing = resolve_local_metrics(index)
+    if not missing:
+        return metrics
+    try:
+        # Use the RAG system to extract the remaining metrics
+        prompt = build_metrics_prompt(metrics["company_name"], fields=missing)
+        response = query_index(index, prompt, llm=get_llm(FRONT_PAGE_LLM))
+        if not merge_llm_metrics(metrics, missing, response):
+            st.warning("⚠️ LLM response could not be parsed as JSON. Showing table metrics only.")
+        return metrics
        
     except Exception as e:
         st.error(f"Error extracting key metrics: {str(e)}")
-        return {}
+        return metrics
 
 # ----------------- Extract Risk Factors ----------------
-def extract_risk_factors(index: VectorStoreIndex):
-    # Use the RAG system to extract key metrics
-    prompt = """
+RISK_FACTORS_PROMPT = """
     You are a financial analysis assistant.
     Task: Identify and summarize the most significant business highlights, changes or achievements. 
     Rules: 
     - Include quantitative data if available in the document.
     - Include details specific to the company, not generic risks.
     """
-    response = query_index(index, prompt, llm=llm)
-    print(f"⚠️ Extracted risk factors: {response}")
+
+def extract_risk_factors(index: VectorStoreIndex):
+    # Use the RAG system to extract key metrics
+    response = query_index(index, RISK_FACTORS_PROMPT, llm=get_llm(FRONT_PAGE_LLM))
+    return str(response)
+
+
+# ----------------- Concurrent dashboard extraction ----------------
+# Seconds each dashboard step may take before it is given up
+DASHBOARD_TIMEOUT = 120
+
+async def _extract_metrics_async(index, warnings):
+    metrics, missing = await asyncio.to_thread(resolve_local_metrics, index)
+    if missing:
+        prompt = build_metrics_prompt(metrics["company_name"], fields=missing)
+        response = await aquery_index(index, prompt, llm=get_llm(FRONT_PAGE_LLM))
+        if not merge_llm_metrics(metrics, missing, response):
+            warnings.append("⚠️ LLM response could not be parsed as JSON. Showing table metrics only.")
+    return metrics
+
+async def _extract_risk_factors_async(index):
+    response = await aquery_index(index, RISK_FACTORS_PROMPT, llm=get_llm(FRONT_PAGE_LLM))
     return str(response)
 
+async def extract_dashboard_async(index: VectorStoreIndex, on_result=None, timeout=DASHBOARD_TIMEOUT):
+    """
+    Run the key metrics and risk factor steps concurrently.
+    on_result(section, value) is called as soon as each section is ready, with
+    section one of "key_metrics" or "risk_factors", and with "warnings" (the list
+    of messages so far) whenever a step times out, fails or falls back.
+    This runs on job threads and batch processes, which cannot draw Streamlit
+    elements, so problems are returned for the UI to show rather than shown here.
+    Returns {"key_metrics": ..., "risk_factors": ..., "warnings": [...]}.
+    """
+    warnings = []
+
+    async def run(section, coro, default):
+        with span(section) as section_span:
+            try:
+                return section, await asyncio.wait_for(coro, timeout)
+            except asyncio.TimeoutError:
+                section_span.set(timed_out=True)
+                warnings.append(f"⚠️ Timed out extracting {section.replace('_', ' ')}.")
+            except Exception as e:
+                section_span.end(error=e)
+                warnings.append(f"Error extracting {section.replace('_', ' ')}: {str(e)}")
+            return section, default
+
+    tasks = [
+        run("key_metrics", _extract_metrics_async(index, warnings), {}),
+        run("risk_factors", _extract_risk_factors_async(index), ""),
+    ]
+    results = {}
+    report("dashboard", done=0, total=len(tasks))
+    # Section tasks copy this context when they start, so their spans nest under "dashboard"
+    with span("dashboard") as dashboard_span:
+        reported = 0
+        for next_done in asyncio.as_completed(tasks):
+            section, value = await next_done
+            results[section] = value
+            report("dashboard", advance=1)
+            if on_result:
+                on_result(section, value)
+                if len(warnings) > reported:
+                    reported = len(warnings)
+                    on_result("warnings", list(warnings))
+        dashboard_span.set(warnings=len(warnings))
+
+    return {"key_metrics": results["key_metrics"], "risk_factors": results["risk_factors"],
+            "warnings": warnings}
+
 
 
 # ----------------- Helper Functions ----------------
@@ -0,0 +1,86 @@
+"""
+Checks the semantic answer cache's matching rules and lookup speed.
+
+    python -m benchmarks.answer_cache
+    python -m benchmarks.answer_cache --entries 5000 --dim 3072
+
+A temporary cache is filled with random question embeddings, then:
+  - a rephrased question close to a cached one reuses its answer
+  - a question differing only by a year or figure does not, however close its embedding
+  - a semantic lookup over a full partition stays fast (one matrix-vector product)
+Exits 1 if any check fails. No network access or API key is needed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+DOC_HASH = "synthetic-answer-cache"
+ROLE = "📊 Financial Analyst"
+MODEL = "auto"
+# Median semantic lookup allowed over a full partition (the pure-Python scan took about 3s)
+LOOKUP_BUDGET_MS = 250
+
+
+def run(entries, dim):
+    import numpy as np
+    from backend.answer_cache import AnswerCache
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AnswerCache(db_path=os.path.join(cache_dir, "answers.sqlite"), max_entries=entries + 1)
+        vector = rng.standard_normal(dim).astype(np.float32)
+        cache.store(DOC_HASH, ROLE, MODEL, "What was revenue in 2022?", "Revenue was $394.3B.", vector.tolist())
+
+        # Embedding models barely separate questions that differ in one number
+        close = (vector + 0.01 * rng.standard_normal(dim)).astype(np.float32).tolist()
+        answer = cache.lookup(DOC_HASH, ROLE, MODEL, "What was the revenue in 2022", close)
+        check(answer == "Revenue was $394.3B.", "rephrased question with the same year reuses the answer")
+        answer = cache.lookup(DOC_HASH, ROLE, MODEL, "What was revenue in 2023?", close)
+        check(answer is None, f"question about another year misses (got {answer!r})")
+        answer = cache.lookup(DOC_HASH, ROLE, MODEL, "What was revenue in 2022 and 2023?", close)
+        check(answer is None, f"question with an extra figure misses (got {answer!r})")
+
+        # Lookup speed over a full partition
+        with cache._connect() as conn:
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO answers (doc_hash, role, model, question, embedding, answer, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((DOC_HASH, ROLE, MODEL, f"question {i}",
+                  rng.standard_normal(dim).astype(np.float32).tobytes(), f"answer {i}", now, now)
+                 for i in range(entries - 1)),
+            )
+        seconds = []
+        for _ in range(5):
+            query = rng.standard_normal(dim).astype(np.float32).tolist()
+            start = time.perf_counter()
+            cache.lookup(DOC_HASH, ROLE, MODEL, "An unrelated question", query)
+            seconds.append(time.perf_counter() - start)
+        median_ms = sorted(seconds)[len(seconds) // 2] * 1000
+        check(median_ms < LOOKUP_BUDGET_MS,
+              f"semantic lookup over {entries} x {dim} embeddings: median {median_ms:.1f}ms "
+              f"(budget {LOOKUP_BUDGET_MS}ms)")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=3072)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("FSA_CACHE_DIR", tempfile.mkdtemp())
+    failures = run(args.entries, args.dim)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Local stand-in for the OpenAI embeddings endpoint, and a run of the embedding
+executor against it.
+
+    python -m benchmarks.embedding_stub
+    python -m benchmarks.embedding_stub --texts 2000 --latency-ms 80 --rate-limit-every 3
+
+The stub answers POST /v1/embeddings with deterministic vectors after a set latency,
+and can answer every Nth request with a 429 (with Retry-After) or start failing
+after a number of requests. The run checks that:
+  - every text gets its own vector, in order, despite injected 429s
+  - concurrency beats one request at a time
+  - a failed ingest resumes from its checkpointed batches instead of restarting
+and exits 1 if any check fails. No network access or API key is needed.
+"""
+import argparse
+import base64
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+
+def stub_vector(text, dim):
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+# ----------------- Stub server ----------------
+class StubEmbeddingServer:
+    """
+    OpenAI-compatible embeddings endpoint on 127.0.0.1.
+    rate_limit_every=N answers every Nth request with 429; fail_after=N answers
+    500 to every request after the first N successful ones.
+    """
+
+    def __init__(self, dim=64, latency_ms=50.0, rate_limit_every=0, retry_after_s=0.2, fail_after=None):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.rate_limit_every = rate_limit_every
+        self.retry_after_s = retry_after_s
+        self.fail_after = fail_after
+        self.requests = 0
+        self.succeeded = 0
+        self.rate_limited = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _outcome(self, texts):
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                return 429
+            if self.fail_after is not None and self.succeeded >= self.fail_after:
+                return 500
+            self.succeeded += 1
+            self.texts += len(texts)
+            return 200
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/embeddings"):
+                    self.send_error(404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+                time.sleep(stub.latency_ms / 1000)
+                status = stub._outcome(texts)
+                if status != 200:
+                    message = "Rate limit reached" if status == 429 else "Injected failure"
+                    self._send(status, {"error": {"message": message, "type": "stub", "code": status}},
+                               {"Retry-After": str(stub.retry_after_s)} if status == 429 else {})
+                    return
+                data = []
+                for i, text in enumerate(texts):
+                    vector = stub_vector(text, stub.dim)
+                    embedding = (base64.b64encode(vector.tobytes()).decode("ascii")
+                                 if request.get("encoding_format") == "base64" else vector.tolist())
+                    data.append({"object": "embedding", "index": i, "embedding": embedding})
+                tokens = sum(len(text) // 4 + 1 for text in texts)
+                self._send(200, {"object": "list", "data": data, "model": request.get("model"),
+                                 "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# ----------------- Executor runs against the stub ----------------
+def stub_embedding(server):
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    return OpenAIEmbedding(model="text-embedding-3-large", api_key="stub", api_base=server.url, max_retries=0)
+
+
+def synthetic_texts(count):
+    return [f"Note {i}: revenue for segment {i % 17} grew {i % 9}% while operating costs "
+            f"rose {i % 5}% in fiscal {2000 + i % 25}." for i in range(count)]
+
+
+def cached_embedding(server, db_path, **executor_kwargs):
+    from backend.embedding_cache import CachedEmbedding
+    from backend.embedding_executor import EmbeddingExecutor
+    executor = EmbeddingExecutor(**executor_kwargs)
+    return CachedEmbedding(stub_embedding(server), db_path=db_path, executor=executor)
+
+
+def stored_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def check(name, ok, detail):
+    print(f"   {'✅' if ok else '❌'} {name}: {detail}")
+    return ok
+
+
+def run_checks(count, latency_ms, rate_limit_every, batch_size, concurrency, dim=64):
+    texts = synthetic_texts(count)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. Correct vectors, in order, through injected 429s
+        server = StubEmbeddingServer(dim=dim, latency_ms=latency_ms, rate_limit_every=rate_limit_every).start()
+        model = cached_embedding(server, f"{tmp}/rate_limited.sqlite", batch_size=batch_size,
+                                 concurrency=concurrency, backoff_base=0.05)
+        start = time.perf_counter()
+        vectors = model.get_text_embedding_batch(texts)
+        concurrent_s = time.perf_counter() - start
+        server.stop()
+        expected = np.stack([stub_vector(text, dim) for text in texts])
+        matches = len(vectors) == count and np.allclose(np.asarray(vectors, dtype=np.float32), expected, atol=1e-6)
+        stats = model.stats()
+        print(f"⏱️ {count} texts, batch {batch_size}, concurrency {concurrency}: {concurrent_s:.2f}s, "
+              f"{server.requests} requests, {server.rate_limited} answered 429, "
+              f"executor retries {stats['retries']}, throttled {stats['throttle_wait_s']:.2f}s")
+        results.append(check("vectors through 429s", matches and server.rate_limited > 0,
+                             f"{len(vectors)} vectors, {server.rate_limited} rate-limited requests retried"))
+
+        # 2. Concurrency against one request at a time
+        server = StubEmbeddingServer(dim=dim, latency_ms=latency_ms).start()
+        serial = cached_embedding(server, f"{tmp}/serial.sqlite", batch_size=batch_size, concurrency=1)
+        start = time.perf_counter()
+        serial.get_text_embedding_batch(texts)
+        serial_s = time.perf_counter() - start
+        server.stop()
+        server = StubEmbeddingServer(dim=dim, latency_ms=latency_ms).start()
+        parallel = cached_embedding(server, f"{tmp}/parallel.sqlite", batch_size=batch_size, concurrency=concurrency)
+        start = time.perf_counter()
+        parallel.get_text_embedding_batch(texts)
+        parallel_s = time.perf_counter() - start
+        server.stop()
+        results.append(check("concurrency", parallel_s < serial_s,
+                             f"{serial_s:.2f}s serial → {parallel_s:.2f}s ({serial_s / parallel_s:.1f}x)"))
+
+        # 3. A failing ingest keeps its finished batches; the retry only embeds the rest
+        db_path = f"{tmp}/resume.sqlite"
+        batches = -(-count // batch_size)
+        server = StubEmbeddingServer(dim=dim, latency_ms=latency_ms, fail_after=batches // 2).start()
+        failing = cached_embedding(server, db_path, batch_size=batch_size, concurrency=concurrency,
+                                   max_retries=1, backoff_base=0.01)
+        try:
+            failing.get_text_embedding_batch(texts)
+            failed = False
+        except Exception:
+            failed = True
+        server.stop()
+        checkpointed = stored_rows(db_path)
+        server = StubEmbeddingServer(dim=dim, latency_ms=latency_ms).start()
+        resumed = cached_embedding(server, db_path, batch_size=batch_size, concurrency=concurrency)
+        resumed.get_text_embedding_batch(texts)
+        server.stop()
+        results.append(check("resume from checkpoint",
+                             failed and checkpointed > 0 and server.texts == count - checkpointed,
+                             f"first run failed after {checkpointed} stored vectors, "
+                             f"retry embedded {server.texts} of {count}"))
+    return all(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the embedding executor against a local stub endpoint.")
+    parser.add_argument("--texts", type=int, default=800)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub latency per request")
+    parser.add_argument("--rate-limit-every", type=int, default=4, help="answer every Nth request with 429")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+    ok = run_checks(args.texts, args.latency_ms, args.rate_limit_every, args.batch_size, args.concurrency)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
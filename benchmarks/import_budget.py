@@ -0,0 +1,105 @@
+"""
+Import-time budget of the backend modules a Streamlit worker loads at startup.
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-s 2.4 --runs 5
+
+Each run imports the startup modules in a fresh interpreter and reports the wall
+time and which heavy stacks came along. Exits 1 when the median import time is
+over budget or when a module that must stay lazy (Docling, torch, pdfplumber,
+PyMuPDF, the LLM and embedding client libraries) was imported before any upload
+or question.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# What app.py and pages/chatbot.py import before the first upload
+STARTUP_MODULES = [
+    "backend.cache",
+    "backend.tracing",
+    "backend.registry",
+    "backend.model_docling",
+    "backend.utils",
+    "backend.corpus",
+    "backend.index_registry",
+    "backend.jobs",
+    "backend.model_router",
+    "backend.transcription",
+]
+# Loaded on first use only
+LAZY_MODULES = [
+    "docling",
+    "torch",
+    "transformers",
+    "pdfplumber",
+    "pymupdf",
+    "llama_index.readers.docling",
+    "llama_index.llms.openai",
+    "llama_index.llms.openrouter",
+    "llama_index.embeddings.openai",
+    "backend.model_pdfplumber",
+]
+# llama_index.core alone is about 2s on a laptop; the startup modules measure about 2.3s
+DEFAULT_BUDGET_S = float(os.getenv("FSA_IMPORT_BUDGET_S", "2.6"))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "loaded": [name for name in {lazy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_once(modules=STARTUP_MODULES, lazy=LAZY_MODULES):
+    """Import `modules` in a fresh interpreter; returns {"seconds", "loaded"}."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, FSA_CACHE_DIR=cache_dir, FSA_METRICS_PORT="0")
+        env.setdefault("OPENAI_API_KEY", "offline")
+        env.setdefault("OPENROUTER_API_KEY", "offline")
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(modules=modules, lazy=lazy)],
+            capture_output=True, text=True, env=env,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the startup modules failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the backend import-time budget.")
+    parser.add_argument("--budget-s", type=float, default=DEFAULT_BUDGET_S, help="median import time allowed")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to measure")
+    args = parser.parse_args(argv)
+
+    runs = [measure_once() for _ in range(args.runs)]
+    median = statistics.median(run["seconds"] for run in runs)
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+
+    timings = ", ".join(f"{run['seconds']:.2f}" for run in runs)
+    print(f"⏱️ Startup imports: median {median:.2f}s over {args.runs} runs "
+          f"(budget {args.budget_s:.2f}s; runs: {timings})")
+    ok = True
+    if median > args.budget_s:
+        print(f"❌ Over budget by {median - args.budget_s:.2f}s")
+        ok = False
+    if loaded:
+        print(f"❌ Loaded at import time, should be lazy: {', '.join(loaded)}")
+        ok = False
+    if ok:
+        print("✅ Within budget, heavy stacks not loaded")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Checks that cancelling a background job stops a sharded Docling parse cleanly.
+
+    python -m benchmarks.job_cancellation
+
+A synthetic filing is parsed by convert_pdf_parallel in several shards, with a
+stand-in converter (Docling's models need no download) on a thread pool in place
+of the spawn process pool, and the job is cancelled once the first shard is in:
+  - the job ends "cancelled", not "failed", and records no error
+  - no shard is resubmitted as if it had failed
+Exits 1 if any check fails. No network access or API key is needed.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from types import SimpleNamespace
+
+PAGES_PER_SHARD = 2
+SHARD_SECONDS = 0.2
+
+
+class StandInConverter:
+    """Docling's DocumentConverter.convert, returning placeholder markdown after SHARD_SECONDS."""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def convert(self, pdf_file, page_range):
+        with self._lock:
+            self.calls.append(tuple(page_range))
+        time.sleep(SHARD_SECONDS)
+        document = SimpleNamespace(export_to_markdown=lambda page_no: f"Page {page_no}")
+        return SimpleNamespace(document=document)
+
+
+def setup():
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ.setdefault("OPENROUTER_API_KEY", "offline")
+    os.environ["FSA_TRACE_FILE"] = ""
+
+    from benchmarks.local_models import block_network
+    block_network()
+    import backend.docling_shards as docling_shards
+    converter = StandInConverter()
+    docling_shards.build_pdf_converter = lambda *args, **kwargs: converter
+    docling_shards.multiprocessing = SimpleNamespace(get_context=lambda method: SimpleNamespace(Pool=ThreadPool))
+    return converter
+
+
+def run():
+    converter = setup()
+    from backend.docling_shards import convert_pdf_parallel, plan_shards
+    from backend.jobs import JobQueue
+    from benchmarks.synthetic_filings import SIZES, make_corpus
+
+    data_dir = os.path.join(tempfile.gettempdir(), "fsa_benchmark_pdfs")
+    pdf_path = make_corpus(data_dir, ("small",))["small"]
+    shards = plan_shards(SIZES["small"], PAGES_PER_SHARD)
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    queue = JobQueue(workers=1)
+    job = queue.submit("cancel-sharded-parse", lambda job: convert_pdf_parallel(
+        pdf_path, workers=2, pages_per_shard=PAGES_PER_SHARD))
+    deadline = time.monotonic() + 30
+    while not job.stages["parse"]["done"] and job.status in ("queued", "running") \
+            and time.monotonic() < deadline:
+        time.sleep(0.01)
+    parsed = job.stages["parse"]["done"]
+    queue.cancel(job.key)
+    job.future.result(timeout=30)
+
+    check(0 < parsed < SIZES["small"], f"cancelled after {parsed} of {SIZES['small']} pages")
+    check(job.status == "cancelled" and job.error is None,
+          f"job ends {job.status!r}" + (f" ({job.error})" if job.error else ""))
+    check(len(converter.calls) == len(set(converter.calls)) and len(converter.calls) <= len(shards),
+          f"{len(converter.calls)} shard conversions for {len(shards)} shards, none resubmitted")
+    return failures
+
+
+def main():
+    failures = run()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
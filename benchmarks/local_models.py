@@ -0,0 +1,172 @@
+import asyncio
+import re
+import socket
+import time
+import zlib
+from typing import Any, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import MockLLM
+from llama_index.core.llms.callbacks import llm_completion_callback
+from backend.transcription import Transcriber
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+# ----------------- Deterministic stand-in models ----------------
+class HashEmbedding(BaseEmbedding):
+    """
+    Bag-of-words embedding hashed into `dim` buckets (CRC32, so identical in every
+    process). Texts sharing words get similar vectors, which keeps retrieval
+    meaningful without a model download. latency_ms simulates a remote call per batch.
+    """
+
+    dim: int = 256
+    latency_ms: float = 0.0
+    _seconds: float = PrivateAttr(default=0.0)
+    _texts: int = PrivateAttr(default=0)
+
+    def __init__(self, dim: int = 256, latency_ms: float = 0.0, **kwargs: Any):
+        super().__init__(dim=dim, latency_ms=latency_ms, model_name=f"hash-{dim}", **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, texts: List[str], sleep=True) -> List[List[float]]:
+        start = time.perf_counter()
+        if self.latency_ms and sleep:
+            time.sleep(self.latency_ms / 1000)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN.findall(text.lower()):
+                matrix[row, zlib.crc32(token.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._seconds += time.perf_counter() - start
+        self._texts += len(texts)
+        return (matrix / norms).tolist()
+
+    def stats(self):
+        return {"embed_s": round(self._seconds, 4), "embedded_texts": self._texts}
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([query])[0]
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        # Concurrent batches overlap their simulated latency, like remote calls would
+        if self.latency_ms:
+            start = time.perf_counter()
+            await asyncio.sleep(self.latency_ms / 1000)
+            self._seconds += time.perf_counter() - start
+        return self._embed(texts, sleep=False)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aembed([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(texts)
+
+
+def local_llm(max_tokens=64):
+    """MockLLM echoes a fixed-length slice of the prompt: deterministic and instant."""
+    return MockLLM(max_tokens=max_tokens)
+
+
+class ProfiledLLM(MockLLM):
+    """
+    MockLLM with a name, context window and output limit, for routing checks.
+    latency_ms simulates the service; error="timeout" or "context_length" makes every
+    call fail the way a provider would (a stream fails on its first token).
+    """
+
+    model_name: str = "profiled"
+    context_window: int = 128000
+    latency_ms: float = 0.0
+    error: Optional[str] = None
+    _calls: int = PrivateAttr(default=0)
+
+    def __init__(self, model_name="profiled", context_window=128000, max_tokens=4096,
+                 latency_ms=0.0, error=None, **kwargs: Any):
+        super().__init__(max_tokens=max_tokens, **kwargs)
+        self.model_name, self.context_window = model_name, context_window
+        self.latency_ms, self.error = latency_ms, error
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ProfiledLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model_name, context_window=self.context_window,
+                           num_output=self.max_tokens)
+
+    @property
+    def calls(self):
+        return self._calls
+
+    def _respond(self):
+        self._calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error == "timeout":
+            raise TimeoutError("Request timed out.")
+        if self.error == "context_length":
+            raise ValueError(f"This model's maximum context length is {self.context_window} tokens.")
+        return f"answer from {self.model_name}"
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=self._respond())
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        def gen():
+            text = ""
+            for word in self._respond().split(" "):
+                delta = word if not text else " " + word
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+
+class StubTranscriber(Transcriber):
+    """
+    Offline stand-in for Whisper: returns `text`, or the "recording" itself when it is
+    UTF-8 text (tests pass the question as bytes). latency_ms simulates the service.
+    """
+
+    def __init__(self, text=None, latency_ms=0.0):
+        self.text = text
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    async def atranscribe(self, audio: bytes, filename: str = "question.webm") -> str:
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self.text is not None:
+            return self.text
+        return audio.decode("utf-8", errors="ignore").strip()
+
+
+# ----------------- Offline guard ----------------
+def block_network():
+    """Make any connection to a non-local address fail immediately."""
+    original_connect = socket.socket.connect
+
+    def guarded_connect(sock, address):
+        host = address[0] if isinstance(address, tuple) else address
+        if sock.family in (socket.AF_INET, socket.AF_INET6) and host not in ("127.0.0.1", "::1", "localhost"):
+            raise ConnectionRefusedError(f"Network disabled during benchmarks: {address}")
+        return original_connect(sock, address)
+
+    socket.socket.connect = guarded_connect
@@ -0,0 +1,150 @@
+"""
+Checks the model router's decisions and failover with offline stand-in models.
+
+    python -m benchmarks.model_routing
+
+The registry's models are replaced by ProfiledLLMs with the context windows and
+output limits the registry configures (4096 output tokens each), then:
+  - answers for every role, at the real expected lengths, go to the default model
+  - answers longer than a model's output limit go to one allowing them
+  - prompts over a model's context window go to a model they fit
+  - map steps of an overflowing answer go to the fast model, the reduce step does not
+  - a model over the p95 latency budget is passed over
+  - context-length and timeout errors fail over to another model (streams before
+    their first token); other errors do not
+  - every decision is kept and traced as a "route" span
+Exits 1 if any check fails. No network access or API key is needed.
+"""
+import os
+import sys
+
+STAND_INS = {
+    # model -> (context window, max output tokens)
+    "anthropic/claude-sonnet-4": (200000, 4096),
+    "gpt-4o": (128000, 4096),
+    "gpt-4o-mini": (128000, 4096),
+}
+
+
+def setup():
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ.setdefault("OPENROUTER_API_KEY", "offline")
+    os.environ["FSA_TRACE_FILE"] = ""
+
+    from benchmarks.local_models import ProfiledLLM, block_network
+    block_network()
+    import backend.clients as clients
+    llms = {model: ProfiledLLM(f"stub-{model}", window, max_tokens)
+            for model, (window, max_tokens) in STAND_INS.items()}
+    clients.get_openrouter_llm = lambda model="anthropic/claude-sonnet-4", **kwargs: llms[model]
+    clients.get_openai_llm = lambda model="gpt-4o", **kwargs: llms[model]
+    return llms
+
+
+def run():
+    llms = setup()
+    from llama_index.core.prompts import PromptTemplate
+    from backend.context_packer import PackedSynthesizer
+    from backend.model_router import ROLE_OUTPUT_TOKENS, ModelRouter, routing_hints
+    from backend.tracing import recent_spans
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    def reset(**errors):
+        for model, llm in llms.items():
+            llm.error = errors.get(model)
+            llm.max_tokens = STAND_INS[model][1]
+        return ModelRouter()
+
+    prompt = PromptTemplate("{question}")
+    predict = lambda llm: llm.predict(prompt, question="What was revenue?")
+
+    # Capacity: output length and context window
+    router = reset()
+    chosen = {role: router.choose("answer", 2000, role=role)["model"] for role in [*ROLE_OUTPUT_TOKENS, None]}
+    check(set(chosen.values()) == {"openrouter"}, f"answers at the role defaults -> {chosen}")
+    llms["anthropic/claude-sonnet-4"].max_tokens = 256
+    decision = router.choose("answer", 2000, role="📊 Financial Analyst")
+    check(decision["model"] == "openai", f"analyst answer over a 256-token limit -> {decision['model']} "
+                                         f"({decision['reason']})")
+    router = reset()
+    decision = router.choose("map", 130000)
+    check(decision["model"] == "openrouter" and "context" in decision["reason"],
+          f"130k-token map prompt -> {decision['model']} ({decision['reason']})")
+    with routing_hints(role="🎓 Beginner"):
+        decision = router.choose("reduce", 2000)
+    check(decision["expected_output"] == 300, "role hint sets the expected output")
+
+    # Latency budget
+    router = reset()
+    for _ in range(10):
+        router.observe("openrouter", router.latency_budget_s * 2)
+    decision = router.choose("answer", 2000, role="💼 Investor")
+    check(decision["model"] == "openai" and "p95" in decision["reason"],
+          f"slow model passed over -> {decision['model']} ({decision['reason']})")
+
+    # Map steps on the fast model
+    router = reset()
+    synthesizer = PackedSynthesizer(llm=router.default_llm(), max_context_tokens=300, router=router)
+    chunks = [f"Segment {i} revenue grew {i} percent. " * 40 for i in range(6)]
+    with routing_hints(role="📊 Financial Analyst"):
+        synthesizer.get_response("How did segment revenue change?", chunks)
+    steps = [(decision["step"], decision["model"]) for decision in router.recent_decisions()]
+    map_models = {model for step, model in steps if step == "map"}
+    reduce_models = [model for step, model in steps if step == "reduce"]
+    check(map_models == {"openai-mini"} and reduce_models == ["openrouter"],
+          f"{len(steps) - 1} map calls -> {sorted(map_models)}, reduce -> {reduce_models}")
+
+    # Failover
+    router = reset(**{"anthropic/claude-sonnet-4": "context_length"})
+    answer = router.call("answer", 2000, predict)
+    outcomes = [(decision["model"], decision["outcome"]) for decision in router.recent_decisions()]
+    check(outcomes == [("openrouter", "failover"), ("openai", "ok")] and "stub-gpt-4o" in answer,
+          f"context-length error fails over: {outcomes}")
+
+    router = reset(**{"anthropic/claude-sonnet-4": "timeout"})
+    with routing_hints(role="💼 Investor"):
+        tokens = router.stream("answer", 2000, lambda llm: llm.stream(prompt, question="Risks?"))
+    text = "".join(tokens)
+    outcomes = [(decision["model"], decision["outcome"]) for decision in router.recent_decisions()]
+    check(outcomes == [("openrouter", "failover"), ("openai", "ok")] and "stub-gpt-4o" in text,
+          f"stream timeout fails over before the first token: {outcomes}")
+
+    router = reset(**{model: "timeout" for model in STAND_INS})
+    try:
+        router.call("answer", 2000, predict)
+        check(False, "all models timing out raises")
+    except TimeoutError:
+        check(len(router.recent_decisions()) == len(STAND_INS), "all models timing out raises after trying each")
+
+    router = reset()
+    failing = lambda llm: (_ for _ in ()).throw(PermissionError("invalid API key"))
+    try:
+        router.call("answer", 2000, failing)
+    except PermissionError:
+        pass
+    outcomes = [decision["outcome"] for decision in router.recent_decisions()]
+    check(outcomes == ["error"], f"other errors are not retried: {outcomes}")
+
+    # Recording
+    route_spans = [s for s in recent_spans() if s["name"] == "route"]
+    llm_spans = [s for s in recent_spans() if s["name"] == "llm"]
+    check(len(route_spans) >= 14 and all("reason" in s["attributes"] for s in route_spans),
+          f"{len(route_spans)} decisions traced as route spans")
+    check(all(any(r["span_id"] == s["parent_id"] for r in route_spans) for s in llm_spans),
+          f"{len(llm_spans)} llm spans nest under their route span")
+    return failures
+
+
+def main():
+    failures = run()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
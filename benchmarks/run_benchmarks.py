@@ -0,0 +1,277 @@
+"""
+Offline end-to-end benchmarks of the ingestion and query pipelines.
+
+    python -m benchmarks.run_benchmarks --sizes small,medium --pipelines pdfplumber,docling
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<earlier run>.json
+
+Synthetic 10-K-like PDFs are generated locally, LLM and embedding clients are
+replaced by deterministic local stand-ins and outbound connections are blocked.
+Every case runs in a fresh process so peak RSS and import costs are its own.
+Docling needs its layout and table models already downloaded; without them the
+docling cases are reported as errors.
+"""
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+
+from benchmarks.synthetic_filings import SIZES, make_corpus
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PIPELINES = ("pdfplumber", "docling")
+QUERIES = [
+    "What was total net sales?",
+    "How much net income did the company report?",
+    "What are the main risk factors?",
+    "Total assets and long-term debt",
+    "Diluted earnings per share",
+    "Cash generated by operating activities",
+]
+QUERY_REPEATS = 3
+
+
+# ----------------- Stage timing ----------------
+class StageTimer:
+    """Accumulates wall time spent inside wrapped functions, per stage."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        timer = self
+
+        if inspect.isgeneratorfunction(original):
+            @wraps(original)
+            def wrapper(*args, **kwargs):
+                gen = original(*args, **kwargs)
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        timer.seconds[stage] += time.perf_counter() - start
+                        return
+                    timer.seconds[stage] += time.perf_counter() - start
+                    yield item
+        else:
+            @wraps(original)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    timer.seconds[stage] += time.perf_counter() - start
+
+        setattr(owner, name, wrapper)
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+    }
+
+
+# ----------------- One benchmark case (fresh process) ----------------
+def run_case(pipeline, pdf_path, cache_dir, embed_latency_ms=0.0):
+    # Environment first: backend modules read it at import time
+    os.environ["FSA_CACHE_DIR"] = cache_dir
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ.setdefault("OPENROUTER_API_KEY", "offline")
+
+    from benchmarks.local_models import HashEmbedding, block_network, local_llm
+    block_network()
+
+    import backend.clients as clients
+    embedding, llm = HashEmbedding(latency_ms=embed_latency_ms), local_llm()
+    clients.get_openrouter_llm = lambda *args, **kwargs: llm
+    clients.get_openai_llm = lambda *args, **kwargs: llm
+    clients.get_openai_embedding = lambda *args, **kwargs: embedding
+
+    start = time.perf_counter()
+    import backend.model_docling as model_docling
+    import backend.model_pdfplumber as model_pdfplumber
+    from backend.embedding_cache import CachedEmbedding
+    from backend.hybrid_retrieval import FusionRetriever
+    from backend.markdown_chunker import TableAwareMarkdownParser
+    from llama_index.core.node_parser import SentenceSplitter
+    import_s = time.perf_counter() - start
+
+    timer = StageTimer()
+    timer.wrap(model_pdfplumber, "iter_pdf_items", "parse")
+    timer.wrap(model_docling, "load_documents_hybrid", "parse")
+    timer.wrap(model_docling, "load_documents_parallel", "parse")
+    if pipeline == "docling":
+        # The backend imports Docling lazily; import it before the build timer starts
+        from llama_index.readers.docling import DoclingReader
+        timer.wrap(DoclingReader, "load_data", "parse")
+    timer.wrap(TableAwareMarkdownParser, "_parse_nodes", "chunk")
+    timer.wrap(SentenceSplitter, "_parse_nodes", "chunk")
+    # Wall time: concurrent embedding batches overlap
+    timer.wrap(CachedEmbedding, "_get_text_embeddings", "embed")
+
+    start = time.perf_counter()
+    if pipeline == "pdfplumber":
+        index = model_pdfplumber.build_index_from_pdf(pdf_path)
+        query_fn = lambda question: model_pdfplumber.query_index(index, question, llm)
+    else:
+        index = model_docling.build_index_from_pdf_docling(pdf_path)
+        query_fn = lambda question: model_docling.query_index(index, question, llm)
+    build_s = time.perf_counter() - start
+
+    embed = embedding.stats()
+    stages = {
+        "import_s": round(import_s, 4),
+        "parse_s": round(timer.seconds["parse"], 4),
+        "chunk_s": round(timer.seconds["chunk"], 4),
+        "embed_s": round(timer.seconds["embed"], 4),
+    }
+    # Whatever is left: documents, docstore, vector store and BM25 index
+    stages["index_s"] = round(build_s - stages["parse_s"] - stages["chunk_s"] - stages["embed_s"], 4)
+    stages["build_total_s"] = round(build_s, 4)
+
+    retriever = FusionRetriever(index, similarity_top_k=4)
+    retrieval, query = [], []
+    for _ in range(QUERY_REPEATS):
+        for question in QUERIES:
+            start = time.perf_counter()
+            retriever.retrieve(question)
+            retrieval.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            query_fn(question)
+            query.append(time.perf_counter() - start)
+
+    # ru_maxrss is in KiB on Linux; children are the parser worker processes
+    return {
+        "stages": stages,
+        "nodes": len(index.docstore.docs),
+        "embedded_texts": embed["embedded_texts"],
+        "retrieval": latency_summary(retrieval),
+        "query": latency_summary(query),
+        "peak_rss_mb": {
+            "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        },
+    }
+
+
+# ----------------- Runner ----------------
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(pipelines, sizes, data_dir, embed_latency_ms=0.0):
+    paths = make_corpus(data_dir, sizes)
+    context = multiprocessing.get_context("spawn")
+    cases = []
+    for size, pdf_path in paths.items():
+        for pipeline in pipelines:
+            name = f"{pipeline}/{size}"
+            print(f"⏱️ {name} ({SIZES[size]} pages)")
+            case = {"case": name, "pipeline": pipeline, "size": size, "pages": SIZES[size],
+                    "pdf_bytes": os.path.getsize(pdf_path)}
+            # A new process and an empty cache per case: cold imports, cold embedding cache
+            with tempfile.TemporaryDirectory() as cache_dir, \
+                    ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                try:
+                    case.update(pool.submit(run_case, pipeline, pdf_path, cache_dir, embed_latency_ms).result())
+                    case["status"] = "ok"
+                except Exception as e:
+                    case.update({"status": "error", "error": repr(e)})
+            cases.append(case)
+            print_case(case)
+    return {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "embed_latency_ms": embed_latency_ms,
+        "cases": cases,
+    }
+
+
+def print_case(case):
+    if case["status"] != "ok":
+        print(f"   ❌ {case['error']}")
+        return
+    stages = case["stages"]
+    print(f"   build {stages['build_total_s']:.2f}s (parse {stages['parse_s']:.2f}, chunk {stages['chunk_s']:.2f}, "
+          f"embed {stages['embed_s']:.2f}, index {stages['index_s']:.2f}) • {case['nodes']} nodes • "
+          f"retrieve p50 {case['retrieval']['p50_ms']:.1f}ms • query p50 {case['query']['p50_ms']:.1f}ms • "
+          f"peak RSS {case['peak_rss_mb']['self']:.0f}MB (+{case['peak_rss_mb']['children']:.0f}MB workers)")
+
+
+COMPARED_METRICS = [
+    ("build_total_s", lambda case: case["stages"]["build_total_s"]),
+    ("parse_s", lambda case: case["stages"]["parse_s"]),
+    ("retrieve_p50_ms", lambda case: case["retrieval"]["p50_ms"]),
+    ("query_p50_ms", lambda case: case["query"]["p50_ms"]),
+    ("peak_rss_mb", lambda case: case["peak_rss_mb"]["self"]),
+]
+
+
+def compare(baseline, current):
+    """Print the relative change of the main metrics for cases present in both runs."""
+    base_cases = {case["case"]: case for case in baseline["cases"] if case.get("status") == "ok"}
+    print(f"\n📊 {baseline.get('commit')} → {current.get('commit')}")
+    for case in current["cases"]:
+        base = base_cases.get(case["case"])
+        if base is None or case.get("status") != "ok":
+            continue
+        changes = []
+        for name, get in COMPARED_METRICS:
+            before, after = get(base), get(case)
+            change = (after - before) / before * 100 if before else 0.0
+            changes.append(f"{name} {before:g}→{after:g} ({change:+.1f}%)")
+        print(f"   {case['case']}: " + ", ".join(changes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmarks.")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES), help="comma separated: pdfplumber,docling")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated: {','.join(SIZES)}")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "fsa_benchmark_pdfs"),
+                        help="where synthetic PDFs are generated (and reused)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0,
+                        help="simulated latency of each embedding batch")
+    parser.add_argument("--output", help="results JSON (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.pipelines.split(","), args.sizes.split(","), args.data_dir, args.embed_latency_ms)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{results['commit']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+    return 1 if any(case["status"] != "ok" for case in results["cases"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
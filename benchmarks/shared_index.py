@@ -0,0 +1,152 @@
+"""
+Checks that sessions and processes share one memory-mapped copy of a cached index.
+
+    python -m benchmarks.shared_index
+    python -m benchmarks.shared_index --size medium --sessions 40 --workers 3
+
+A synthetic filing is indexed offline into a temporary cache, then:
+  - many sessions leasing it from the registry get the same index object, loaded once
+  - its vectors are memory-mapped, and worker processes map the same cache file with
+    only clean, file-backed pages: no private copy, so the OS page cache holds the
+    one physical copy (read from /proc/self/smaps, Linux only)
+  - leased entries survive the memory budget; released or garbage-collected leases
+    let the registry evict them
+Exits 1 if any check fails. No network access or API key is needed.
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+DOC_HASH = "synthetic-shared-index"
+
+
+def setup(cache_dir):
+    # Environment first: backend modules read it at import time
+    os.environ["FSA_CACHE_DIR"] = cache_dir
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ.setdefault("OPENROUTER_API_KEY", "offline")
+
+    from benchmarks.local_models import HashEmbedding, block_network, local_llm
+    block_network()
+    import backend.clients as clients
+    embedding, llm = HashEmbedding(), local_llm()
+    clients.get_openrouter_llm = lambda *args, **kwargs: llm
+    clients.get_openai_llm = lambda *args, **kwargs: llm
+    clients.get_openai_embedding = lambda *args, **kwargs: embedding
+
+
+def mapped_kb(path):
+    """Resident, anonymous and dirty KiB of this process's mappings of path, from /proc/self/smaps."""
+    totals = {"Rss": 0, "Anonymous": 0, "Private_Dirty": 0}
+    current = False
+    try:
+        with open("/proc/self/smaps", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if "-" in fields[0] and not fields[0].endswith(":"):
+                    current = fields[-1] == path
+                elif current and fields[0].rstrip(":") in totals:
+                    totals[fields[0].rstrip(":")] += int(fields[1])
+    except OSError:
+        return None
+    return totals
+
+
+def worker(cache_dir, barrier):
+    """A second process (e.g. another Streamlit worker) opening the same filing."""
+    setup(cache_dir)
+    import numpy as np
+    from backend.index_registry import IndexRegistry
+    lease = IndexRegistry().acquire(DOC_HASH)
+    matrix = lease.index.vector_store._matrix
+    np.asarray(matrix).sum()  # touch every page
+    barrier.wait()  # every process has the pages mapped at once
+    result = {"memmap": isinstance(matrix, np.memmap), "path": matrix.filename,
+              "kb": mapped_kb(matrix.filename)}
+    barrier.wait()
+    return result
+
+
+def run(size, sessions, workers):
+    from benchmarks.synthetic_filings import make_corpus
+    data_dir = os.path.join(tempfile.gettempdir(), "fsa_benchmark_pdfs")
+    pdf_path = make_corpus(data_dir, (size,))[size]
+
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        setup(cache_dir)
+        import numpy as np
+        from backend.cache import save_analysis
+        from backend.index_registry import IndexRegistry, index_bytes
+        from backend.model_docling import PIPELINE_CONFIG
+        from backend.model_pdfplumber import build_index_from_pdf
+
+        built = build_index_from_pdf(pdf_path)
+        save_analysis(DOC_HASH, PIPELINE_CONFIG, built, {"key_metrics": {}, "risk_factors": []})
+        size_bytes = index_bytes(built)
+        del built
+
+        registry = IndexRegistry(max_bytes=size_bytes * 10)
+        leases = [registry.acquire(DOC_HASH) for _ in range(sessions)]
+        stats = registry.stats()
+        check(len({id(lease.index) for lease in leases}) == 1 and stats["indexes"] == 1,
+              f"{sessions} sessions share one index object ({stats['bytes'] / 1024:.0f} KiB)")
+        check(stats["leases"] == sessions, f"{stats['leases']} leases counted")
+        matrix = leases[0].index.vector_store._matrix
+        check(isinstance(matrix, np.memmap), f"vectors memory-mapped ({matrix.shape[0]} x {matrix.shape[1]})")
+
+        # Other processes map the same file while this one holds it
+        np.asarray(matrix).sum()
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Manager().Barrier(workers + 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(worker, cache_dir, barrier) for _ in range(workers)]
+            barrier.wait()
+            barrier.wait()
+            results = [future.result() for future in futures]
+        check(all(result["memmap"] and result["path"] == matrix.filename for result in results),
+              f"{workers} worker processes map the same vector file")
+        mapped = [result["kb"] for result in results if result["kb"] is not None]
+        if mapped:
+            check(all(kb["Rss"] and not kb["Anonymous"] and not kb["Private_Dirty"] for kb in mapped),
+                  "worker vector pages come from the page cache: " + ", ".join(
+                      f"{kb['Rss']} KiB resident, {kb['Anonymous'] + kb['Private_Dirty']} KiB private"
+                      for kb in mapped))
+        else:
+            print("⚠️ /proc/self/smaps unavailable, physical sharing not measured")
+
+        # Budget: held entries stay, released ones go once over budget
+        registry.max_bytes = 0
+        leases[0].release()
+        check(registry.stats()["indexes"] == 1, "entry kept while other sessions hold leases")
+        del leases, matrix
+        gc.collect()
+        stats = registry.stats()
+        check(stats["indexes"] == 0 and stats["leases"] == 0,
+              "entry evicted once every lease was released or garbage-collected")
+        check(registry.acquire("missing") is None, "unknown document is a miss")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="small", choices=["small", "medium", "large"])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args(argv)
+    failures = run(args.size, args.sessions, args.workers)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
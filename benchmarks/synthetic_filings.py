@@ -0,0 +1,133 @@
+import os
+import random
+import pymupdf
+
+# Page counts of the generated filings
+SIZES = {"small": 12, "medium": 60, "large": 200}
+# Every Nth page is a financial statement table
+TABLE_EVERY = 4
+
+WORDS = """
+revenue growth customers products services markets competition regulation supply chain
+operating income margin investment capital liquidity demand pricing inventory segment
+international currency interest rates debt obligations cash flows acquisitions risk
+management strategy technology employees manufacturing distribution sales guidance
+""".split()
+
+SECTIONS = [
+    "Item 1. Business",
+    "Item 1A. Risk Factors",
+    "Item 7. Management's Discussion and Analysis of Financial Condition and Results of Operations",
+    "Item 7A. Quantitative and Qualitative Disclosures About Market Risk",
+    "Item 8. Financial Statements and Supplementary Data",
+]
+
+STATEMENTS = [
+    ("CONSOLIDATED STATEMENTS OF OPERATIONS (in millions, except per share amounts)", [
+        "Total net sales", "Cost of sales", "Gross margin", "Research and development",
+        "Selling, general and administrative", "Operating income", "Net income",
+        "Earnings per share: Basic", "Diluted",
+    ]),
+    ("CONSOLIDATED BALANCE SHEETS (in millions)", [
+        "Cash and cash equivalents", "Accounts receivable, net", "Inventories", "Total current assets",
+        "Property, plant and equipment, net", "Total assets", "Total current liabilities",
+        "Long-term debt", "Total liabilities", "Total shareholders' equity",
+    ]),
+    ("CONSOLIDATED STATEMENTS OF CASH FLOWS (in millions)", [
+        "Net income", "Depreciation and amortization", "Cash generated by operating activities",
+        "Payments for acquisition of property, plant and equipment", "Cash used in investing activities",
+        "Repayments of term debt", "Cash used in financing activities",
+    ]),
+]
+
+MARGIN = 54
+LINE_HEIGHT = 13
+FONT_SIZE = 9.5
+
+
+def _paragraph(rng, sentences=5):
+    out = []
+    for _ in range(sentences):
+        words = rng.choices(WORDS, k=rng.randint(10, 22))
+        words[0] = words[0].capitalize()
+        out.append(" ".join(words) + ".")
+    return " ".join(out)
+
+
+def _narrative_page(page, rng, heading):
+    y = MARGIN + 20
+    if heading:
+        page.insert_text((MARGIN, y), heading, fontsize=12)
+        y += 24
+    rect = pymupdf.Rect(MARGIN, y, page.rect.width - MARGIN, page.rect.height - MARGIN)
+    paragraphs = [_paragraph(rng) for _ in range(rng.randint(4, 7))]
+    # insert_textbox writes nothing when the text overflows, so drop paragraphs until it fits
+    while paragraphs and page.insert_textbox(rect, "\n\n".join(paragraphs), fontsize=FONT_SIZE) < 0:
+        paragraphs.pop()
+
+
+def _table_page(page, rng, title, labels, year):
+    """A ruled three-year statement table, so both text and line based extractors find it."""
+    x_label, x_cols, col_width = MARGIN, [330, 420, 510], 80
+    left, right = x_label - 4, x_cols[-1] + col_width - 10
+    y = MARGIN + 20
+    page.insert_text((x_label, y), title, fontsize=11)
+    y += 26
+    top = y - LINE_HEIGHT + 3
+    for x, value in zip(x_cols, (year, year - 1, year - 2)):
+        page.insert_text((x, y), str(value), fontsize=FONT_SIZE)
+    y += LINE_HEIGHT + 4
+
+    for label in labels:
+        page.draw_line((left, y - LINE_HEIGHT + 2), (right, y - LINE_HEIGHT + 2))
+        page.insert_text((x_label, y), label, fontsize=FONT_SIZE)
+        per_share = "share" in label.lower() or label == "Diluted"
+        base = rng.uniform(1, 12) if per_share else rng.uniform(500, 400000)
+        for i, x in enumerate(x_cols):
+            value = base * (1 - 0.07 * i) * rng.uniform(0.95, 1.05)
+            cell = f"{value:,.2f}" if per_share else f"{value:,.0f}"
+            if rng.random() < 0.1 and not per_share:
+                cell = f"({cell})"
+            page.insert_text((x, y), cell, fontsize=FONT_SIZE)
+        y += LINE_HEIGHT + 4
+    bottom = y - LINE_HEIGHT + 2
+    page.draw_line((left, bottom), (right, bottom))
+    for x in [left] + [x - 6 for x in x_cols] + [right]:
+        page.draw_line((x, top), (x, bottom))
+
+
+def make_filing(path, pages, company="Synthetic Devices Inc.", year=2024, seed=0):
+    """Write a 10-K-like PDF: cover page, narrative sections and statement tables."""
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    cover = doc.new_page()
+    cover.insert_text((MARGIN, 120), "UNITED STATES SECURITIES AND EXCHANGE COMMISSION", fontsize=12)
+    cover.insert_text((MARGIN, 150), "FORM 10-K", fontsize=16)
+    cover.insert_text((MARGIN, 180), f"For the fiscal year ended September 28, {year}", fontsize=11)
+    cover.insert_text((MARGIN, 220), company, fontsize=14)
+
+    section_every = max(1, pages // len(SECTIONS))
+    for page_no in range(1, pages):
+        page = doc.new_page()
+        if page_no % TABLE_EVERY == 0:
+            title, labels = STATEMENTS[(page_no // TABLE_EVERY) % len(STATEMENTS)]
+            _table_page(page, rng, title, labels, year)
+        else:
+            heading = SECTIONS[min(page_no // section_every, len(SECTIONS) - 1)] if page_no % section_every == 1 else None
+            _narrative_page(page, rng, heading)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_corpus(out_dir, sizes=("small", "medium")):
+    """Generate one filing per size; returns {size: path}. Existing files are reused."""
+    paths = {}
+    for i, size in enumerate(sizes):
+        path = os.path.join(out_dir, f"synthetic_10k_{size}.pdf")
+        if not os.path.exists(path):
+            make_filing(path, SIZES[size], seed=i)
+        paths[size] = path
+    return paths
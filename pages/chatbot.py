@@ -1,6 +1,8 @@
 import streamlit as st
 from backend.model_docling import create_role_prompts, query_index_with_roles, query_index
-from openai import OpenAI
+from backend.model_router import routing_hints
+from backend.transcription import transcribe_in_background
+from backend.tracing import bind_session, render_timing_panel
 from dotenv import load_dotenv
 import os
 from streamlit_mic_recorder import mic_recorder
@@ -9,8 +11,8 @@ from streamlit_mic_recorder import mic_recorder
 load_dotenv()
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-# Initialize OpenAI API for audio input
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Spans from this run are shown in this session's timing panel
+bind_session()
 
 # Page config
 st.set_page_config(
@@ -19,6 +21,14 @@ st.set_page_config(
     layout="wide"
 )
 
+# Recorded in the browser; the file name sent with the bytes tells the transcriber the format
+AUDIO_FORMAT = "webm"
+
+# Escape dollar signs so that Streamlit won't interpret them as LaTeX
+def escape_dollars(token_stream):
+    for token in token_stream:
+        yield token.replace("$", r"\$")
+
 # Role-based configuration for the user
 ROLE_OPTIONS  = {
     "🎓 Beginner": {
@@ -66,31 +76,23 @@ if "index" not in st.session_state:
 if "role" not in st.session_state:
     st.session_state.role = "🎓 Beginner"
 
-if "use_openAI" not in st.session_state:
-    st.session_state.use_openAI = False
-
 # --- Voice Input Section ---
 voice_input = None
+pending_transcript = None
 if voice_mode:
     st.markdown("Click the button below to start recording your question.")
     audio = mic_recorder(
             start_prompt="🎙 Start Recording", 
             stop_prompt="⏹ Stop Recording",
             just_once=True,
-            use_container_width=True
+            use_container_width=True,
+            format=AUDIO_FORMAT
         )
     if audio:
         st.audio(audio['bytes'])
-        with open("temp_voice.wav", "wb") as f:
-            f.write(audio['bytes'])
-
-        # Transcribe with Whisper
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=open("temp_voice.wav", "rb")
-        )
-        voice_input = transcript.text
-        st.success(f"🗣 You said: {voice_input}")
+        # The recording stays in this session's memory (no shared temp file); transcription
+        # starts now and runs while the chat history renders
+        pending_transcript = transcribe_in_background(audio['bytes'], filename=f"question.{AUDIO_FORMAT}")
 
 
 # Display chat messages
@@ -98,6 +100,14 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
+if pending_transcript is not None:
+    try:
+        with st.spinner("🗣 Transcribing..."):
+            voice_input = pending_transcript.result()
+        st.success(f"🗣 You said: {voice_input}")
+    except Exception as e:
+        st.error(f"Error transcribing audio: {str(e)}")
+
 # --- Text Input Section ---
 
 text_input = st.chat_input("Ask a question about your document...")
@@ -116,16 +126,36 @@ if user_input:
     response = ""
     with st.chat_message("assistant"):
         # Simple mock response (replace with your backend call)
-        if st.session_state.index:
+        compare_filings = st.session_state.get("compare_filings", [])
+        if len(compare_filings) >= 2:
+            with st.spinner("💡 Comparing filings..."), routing_hints(role=st.session_state.role):
+                # Same question asked of each filing concurrently, answers merged into one comparison
+                result = st.session_state.corpus.compare(
+                    user_input,
+                    compare_filings,
+                    role_context=create_role_prompts(st.session_state.role)
+                )
+            response = result["comparison"]
+            st.markdown(response.replace("$", r"\$"))
+            with st.expander("Answers per filing"):
+                for doc_hash, answer in result["answers"].items():
+                    st.markdown(f"**{st.session_state.corpus.label(doc_hash)}**")
+                    st.markdown(answer.replace("$", r"\$"))
+        elif st.session_state.index:
             with st.spinner("💡 Thinking..."):
-                response = query_index_with_roles(
+                # Retrieval happens here; the answer itself is streamed below
+                token_stream = query_index_with_roles(
                     st.session_state.index, 
                     user_input, 
                     st.session_state.role,
-                    st.session_state.use_openAI
+                    streaming=True,
+                    doc_hash=st.session_state.get("doc_hash")
                 )
 
-            response = response.replace("$", r"\$")  # Escape dollar signs so that Streamlit won't interpret them as LaTeX
+            # Render tokens as they arrive; write_stream returns the full text
+            response = st.write_stream(escape_dollars(token_stream))
+        elif st.session_state.get("job_key"):
+            response = "⏳ Your document is still being processed. You can follow its progress on the main page."
             st.markdown(response)
         else:
             response = "Please upload a document first so that I can help. 😊"
@@ -156,15 +186,21 @@ with st.sidebar:
 
     st.markdown("---")
 
-    st.markdown("### Chat Options")
-
-    use_openAI = st.toggle(
-        "Switch AI model for longer responses", 
-        value=st.session_state.use_openAI
-    )
+    # Cross-filing comparison once more than one filing has been uploaded
+    corpus = st.session_state.get("corpus")
+    if corpus is not None and len(corpus.filings) > 1:
+        st.markdown("### Compare Filings")
+        st.multiselect(
+            "Ask each selected filing and compare:",
+            options=list(corpus.filings),
+            format_func=corpus.label,
+            key="compare_filings"
+        )
+        # Filings that left the selection (other than the open one) may be evicted until asked again
+        corpus.release(keep=[*st.session_state.compare_filings, st.session_state.get("doc_hash")])
+        st.markdown("---")
 
-    if use_openAI != st.session_state.use_openAI:
-        st.session_state.use_openAI = use_openAI
+    st.markdown("### Chat Options")
 
     if st.button("🗑️ Clear Chat"):
         st.session_state.messages = [
@@ -175,4 +211,7 @@ with st.sidebar:
     
     if st.button("🔙 Back to Main"):
         st.switch_page("app.py")
-    
\ No newline at end of file
+    
+
+# Collapsible per-stage timings of this session's latest requests
+render_timing_panel()